@@ -42,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'elevatelearningapp.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +56,7 @@ ROOT_URLCONF = 'elevatelearning.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'elevatelearningapp.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -70,6 +71,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'elevatelearning.wsgi.application'
+ASGI_APPLICATION = 'elevatelearning.asgi.application'
 
 
 # Database
@@ -83,9 +85,104 @@ DATABASES = {
         'PASSWORD': os.environ.get('DB_PASSWORD', 'cd2a48ef99e854338296fda3'),
         'HOST': os.environ.get('DB_HOST', 'localhost'),
         'PORT': os.environ.get('DB_PORT', '3306'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# With DB_POOL on, MySQL connections come from a bounded pool per worker
+# (elevatelearningapp/backends/mysqlpool) instead of persisting per thread
+if os.environ.get('DB_POOL', 'False') == 'True' and DATABASES['default']['ENGINE'] == 'django.db.backends.mysql':
+    DATABASES['default'].update({
+        'ENGINE': 'elevatelearningapp.backends.mysqlpool',
+        'CONN_MAX_AGE': 0,
+        'OPTIONS': {
+            'pool': {
+                'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', '10')),
+                'timeout': float(os.environ.get('DB_POOL_TIMEOUT', '10')),
+                'max_lifetime': float(os.environ.get('DB_POOL_MAX_LIFETIME', '1800')),
+                'pre_ping': os.environ.get('DB_POOL_PRE_PING', 'True') == 'True',
+            },
+        },
+    })
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# CACHE_BACKEND is 'locmem' (per process), 'file' (shared by the workers of
+# one pod) or 'redis' (shared by every replica; set CACHE_LOCATION to the
+# redis URL).
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'elevatelearning'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://redis:6379/1'),
+}
+CACHE_BACKEND, CACHE_DEFAULT_LOCATION = CACHE_BACKENDS[os.environ.get('CACHE_BACKEND', 'locmem')]
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_DEFAULT_LOCATION),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', '300')),
+        'KEY_PREFIX': 'elevatelearning',
+    }
+}
+
+# Rendered course page fragments (page body, comments)
+FRAGMENT_CACHE_ALIAS = 'default'
+FRAGMENT_CACHE_TIMEOUT = int(os.environ.get('FRAGMENT_CACHE_TIMEOUT', '86400'))
+
+# Users are loaded with their UserDetail and cached (see elevatelearningapp/profiles.py);
+# sessions are read from the cache and written through to the database
+AUTHENTICATION_BACKENDS = ['elevatelearningapp.profiles.ProfileBackend']
+PROFILE_CACHE_ALIAS = 'default'
+PROFILE_CACHE_TIMEOUT = int(os.environ.get('PROFILE_CACHE_TIMEOUT', '300'))
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Page-view progress is buffered and written in batches; see
+# elevatelearningapp/progress_buffer.py. MAX_DELAY (seconds) bounds how stale
+# progress read elsewhere can be.
+PROGRESS_BUFFER = {
+    'ENABLED': os.environ.get('PROGRESS_BUFFER_ENABLED', 'True') == 'True',
+    'MAX_EVENTS': int(os.environ.get('PROGRESS_BUFFER_MAX_EVENTS', '500')),
+    'MAX_DELAY': float(os.environ.get('PROGRESS_BUFFER_MAX_DELAY', '5')),
+}
+
+# Background jobs (course deletes, bulk archiving, recounts) run by
+# `manage.py run_jobs`; see elevatelearningapp/jobs.py. Each chunk of
+# CHUNK_SIZE rows is its own transaction; a running job silent for
+# STALE_AFTER seconds is handed to another worker.
+JOBS = {
+    'CHUNK_SIZE': int(os.environ.get('JOBS_CHUNK_SIZE', '1000')),
+    'POLL_INTERVAL': float(os.environ.get('JOBS_POLL_INTERVAL', '2')),
+    'STALE_AFTER': int(os.environ.get('JOBS_STALE_AFTER', '600')),
+    'MAX_ATTEMPTS': int(os.environ.get('JOBS_MAX_ATTEMPTS', '3')),
+}
+
+# Daily analytics rollups, aggregated by `manage.py rollup_analytics`; see
+# elevatelearningapp/analytics.py. Each run re-reads LAG seconds before the
+# last one to pick up transactions that committed late.
+ANALYTICS = {
+    'LAG': int(os.environ.get('ANALYTICS_LAG', '900')),
+}
+
+
+# Per-view latency/SQL/template metrics, served at /elevatelearning/metrics/;
+# see elevatelearningapp/metrics.py. SQL and template timing only runs for
+# SAMPLE_RATE of requests (0 turns it off). Workers share totals via DIR.
+METRICS = {
+    'ENABLED': os.environ.get('METRICS_ENABLED', 'True') == 'True',
+    'SAMPLE_RATE': float(os.environ.get('METRICS_SAMPLE_RATE', '0.1')),
+    'N_PLUS_ONE_THRESHOLD': int(os.environ.get('METRICS_N_PLUS_ONE_THRESHOLD', '10')),
+    'DIR': os.environ.get('METRICS_DIR', ''),
+    'FLUSH_INTERVAL': float(os.environ.get('METRICS_FLUSH_INTERVAL', '10')),
+    # Scrapers of /elevatelearning/metrics/ send this bearer token or, without one, connect from these networks
+    'TOKEN': os.environ.get('METRICS_TOKEN', ''),
+    'ALLOWED_IPS': os.environ.get(
+        'METRICS_ALLOWED_IPS', '127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,fc00::/7'
+    ).split(','),
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -127,6 +224,20 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# QR code images (see elevatelearningapp/qrcodes.py); requests render the
+# missing ones inline, while the render_qrcodes command spreads batches above
+# the threshold over a pool of QR_RENDER_WORKERS processes
+QR_RENDER_WORKERS = int(os.environ.get('QR_RENDER_WORKERS', '1'))
+QR_RENDER_BATCH_THRESHOLD = int(os.environ.get('QR_RENDER_BATCH_THRESHOLD', '20'))
+
+# Async views run their independent queries in parallel threads, each on its
+# own connection (see elevatelearningapp/async_db.py). On by default only with
+# the connection pool; at most ASYNC_QUERY_CONNECTIONS (default half the pool)
+# such threads run at once per process
+ASYNC_CONCURRENT_QUERIES = os.environ.get(
+    'ASYNC_CONCURRENT_QUERIES', str(DATABASES['default']['ENGINE'] == 'elevatelearningapp.backends.mysqlpool')
+) == 'True'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
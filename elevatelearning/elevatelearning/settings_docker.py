@@ -4,7 +4,7 @@ Django settings for elevatelearning project - Docker-ready version.
 
 from pathlib import Path
 import os
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -26,6 +26,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'elevatelearningapp.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Added for static files in production
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -40,7 +41,7 @@ ROOT_URLCONF = 'elevatelearning.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'elevatelearningapp.metrics.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -55,6 +56,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'elevatelearning.wsgi.application'
+ASGI_APPLICATION = 'elevatelearning.asgi.application'
 
 # Database - Docker-ready configuration
 DATABASES = {
@@ -67,10 +69,93 @@ DATABASES = {
         'PORT': config('DB_PORT', default='3306'),
         'OPTIONS': {
             'init_command': "SET sql_mode='STRICT_TRANS_TABLES'",
-        }
+        },
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+    }
+}
+
+# With DB_POOL on, MySQL connections come from a bounded pool per worker
+# (elevatelearningapp/backends/mysqlpool) instead of persisting per thread
+if config('DB_POOL', default=True, cast=bool) and DATABASES['default']['ENGINE'] == 'django.db.backends.mysql':
+    DATABASES['default'].update({
+        'ENGINE': 'elevatelearningapp.backends.mysqlpool',
+        'CONN_MAX_AGE': 0,
+    })
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+        'timeout': config('DB_POOL_TIMEOUT', default=10.0, cast=float),
+        'max_lifetime': config('DB_POOL_MAX_LIFETIME', default=1800.0, cast=float),
+        'pre_ping': config('DB_POOL_PRE_PING', default=True, cast=bool),
+    }
+
+# Cache - 'locmem' (per process), 'file' (shared by the workers of one pod)
+# or 'redis' (shared by every replica; set CACHE_LOCATION to the redis URL)
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'elevatelearning'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', os.path.join(BASE_DIR, 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://redis:6379/1'),
+}
+CACHE_BACKEND, CACHE_DEFAULT_LOCATION = CACHE_BACKENDS[config('CACHE_BACKEND', default='locmem')]
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': config('CACHE_LOCATION', default=CACHE_DEFAULT_LOCATION),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+        'KEY_PREFIX': 'elevatelearning',
     }
 }
 
+# Rendered course page fragments (page body, comments)
+FRAGMENT_CACHE_ALIAS = 'default'
+FRAGMENT_CACHE_TIMEOUT = config('FRAGMENT_CACHE_TIMEOUT', default=86400, cast=int)
+
+# Users are loaded with their UserDetail and cached (see elevatelearningapp/profiles.py);
+# sessions are read from the cache and written through to the database
+AUTHENTICATION_BACKENDS = ['elevatelearningapp.profiles.ProfileBackend']
+PROFILE_CACHE_ALIAS = 'default'
+PROFILE_CACHE_TIMEOUT = config('PROFILE_CACHE_TIMEOUT', default=300, cast=int)
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# Page-view progress is buffered and written in batches; MAX_DELAY (seconds)
+# bounds how stale progress read elsewhere can be
+PROGRESS_BUFFER = {
+    'ENABLED': config('PROGRESS_BUFFER_ENABLED', default=True, cast=bool),
+    'MAX_EVENTS': config('PROGRESS_BUFFER_MAX_EVENTS', default=500, cast=int),
+    'MAX_DELAY': config('PROGRESS_BUFFER_MAX_DELAY', default=5.0, cast=float),
+}
+
+# Background jobs run by `manage.py run_jobs` (see elevatelearningapp/jobs.py)
+JOBS = {
+    'CHUNK_SIZE': config('JOBS_CHUNK_SIZE', default=1000, cast=int),
+    'POLL_INTERVAL': config('JOBS_POLL_INTERVAL', default=2.0, cast=float),
+    'STALE_AFTER': config('JOBS_STALE_AFTER', default=600, cast=int),
+    'MAX_ATTEMPTS': config('JOBS_MAX_ATTEMPTS', default=3, cast=int),
+}
+
+# Daily analytics rollups aggregated by `manage.py rollup_analytics` (see elevatelearningapp/analytics.py)
+ANALYTICS = {
+    'LAG': config('ANALYTICS_LAG', default=900, cast=int),
+}
+
+# Per-view latency/SQL/template metrics, served at /elevatelearning/metrics/;
+# see elevatelearningapp/metrics.py. SQL and template timing only runs for
+# SAMPLE_RATE of requests (0 turns it off). Workers share totals via DIR.
+METRICS = {
+    'ENABLED': config('METRICS_ENABLED', default=True, cast=bool),
+    'SAMPLE_RATE': config('METRICS_SAMPLE_RATE', default=0.1, cast=float),
+    'N_PLUS_ONE_THRESHOLD': config('METRICS_N_PLUS_ONE_THRESHOLD', default=10, cast=int),
+    'DIR': config('METRICS_DIR', default='/tmp/elevatelearning-metrics'),
+    'FLUSH_INTERVAL': config('METRICS_FLUSH_INTERVAL', default=10.0, cast=float),
+    # Scrapers of /elevatelearning/metrics/ send this bearer token or, without one, connect from these networks
+    'TOKEN': config('METRICS_TOKEN', default=''),
+    'ALLOWED_IPS': config(
+        'METRICS_ALLOWED_IPS', default='127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,fc00::/7',
+        cast=Csv(),
+    ),
+}
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -102,6 +187,21 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# QR code images (see elevatelearningapp/qrcodes.py); requests render the
+# missing ones inline, while the render_qrcodes command spreads batches above
+# the threshold over a pool of QR_RENDER_WORKERS processes
+QR_RENDER_WORKERS = config('QR_RENDER_WORKERS', default=1, cast=int)
+QR_RENDER_BATCH_THRESHOLD = config('QR_RENDER_BATCH_THRESHOLD', default=20, cast=int)
+
+# Async views run their independent queries in parallel threads, each on its
+# own connection (see elevatelearningapp/async_db.py). On by default only with
+# the connection pool; at most ASYNC_QUERY_CONNECTIONS (default half the pool)
+# such threads run at once per process
+ASYNC_CONCURRENT_QUERIES = config(
+    'ASYNC_CONCURRENT_QUERIES', default=DATABASES['default']['ENGINE'] == 'elevatelearningapp.backends.mysqlpool',
+    cast=bool,
+)
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
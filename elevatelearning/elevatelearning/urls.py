@@ -14,6 +14,8 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
@@ -22,3 +24,6 @@ urlpatterns = [
     path("elevatelearning/", include("elevatelearningapp.urls")),
     path("elevatelearning/admin/", admin.site.urls),
 ]
+
+# nginx serves /media/ in deployments; this only applies with DEBUG on
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
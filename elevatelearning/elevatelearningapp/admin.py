@@ -1,8 +1,20 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.utils import get_last_value_from_parameters, get_model_from_relation
+from django.contrib.admin.widgets import AdminDateWidget, AutocompleteSelect, AutocompleteSelectMultiple
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.http import StreamingHttpResponse
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
 from django.utils.html import format_html
-from .models import UserDetail, Course, QRcode, CoursePage, CourseProgress, CourseInteraction, CourseComment
+from . import enrollment, exports, jobs
+from .bundles import BundleError, export_ndjson, import_bundles, parse_lines
+from .models import UserDetail, Course, QRcode, CoursePage, CourseProgress, CourseInteraction, CourseComment, CoursePageStats, Job, Certificate
 
 # Inline Admin for UserDetail
 class UserDetailInline(admin.StackedInline):
@@ -12,6 +24,72 @@ class UserDetailInline(admin.StackedInline):
     fields = ('firstname', 'surname', 'mobile_no', 'role', 'email', 'is_archived')
     readonly_fields = ('email',)
 
+# Sidebar filter on a foreign key that searches through the admin's autocomplete
+# view instead of listing every related row
+class AutocompleteFilter(admin.FieldListFilter):
+    template = 'admin/elevatelearningapp/autocomplete_filter.html'
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        self.lookup_kwarg = f'{field_path}__{field.target_field.name}__exact'
+        self.lookup_val = get_last_value_from_parameters(params, self.lookup_kwarg)
+        super().__init__(field, request, params, model, model_admin, field_path)
+        self.title = getattr(field, 'verbose_name', field_path)
+        self.other_params = [
+            (name, value) for name, values in request.GET.lists()
+            if name not in (self.lookup_kwarg, 'p') for value in values
+        ]
+        # The selected row is looked up by primary key to label it; archived rows included
+        choice_field = forms.ModelChoiceField(
+            queryset=get_model_from_relation(field)._base_manager.all(),
+            to_field_name=field.target_field.name,
+            widget=AutocompleteSelect(field, model_admin.admin_site, attrs={'style': 'width: 100%'}),
+            required=False,
+        )
+        self.rendered_widget = choice_field.widget.render(
+            self.lookup_kwarg, self.lookup_val, attrs={'id': f'id_filter_{field_path}'}
+        )
+
+    def expected_parameters(self):
+        return [self.lookup_kwarg]
+
+    def choices(self, changelist):
+        yield {
+            'selected': self.lookup_val is None,
+            'query_string': changelist.get_query_string(remove=[self.lookup_kwarg]),
+            'display': 'All',
+        }
+
+    def get_facet_counts(self, pk_attname, filtered_qs):
+        return {}
+
+# Loads the autocomplete widget's scripts for AutocompleteFilter entries of list_filter
+class AutocompleteFilterMixin:
+    @property
+    def media(self):
+        media = super().media
+        for entry in self.list_filter:
+            if isinstance(entry, tuple) and issubclass(entry[1], AutocompleteFilter):
+                media += AutocompleteSelect(self.model._meta.get_field(entry[0]), self.admin_site).media
+        return media
+
+# Which learner data to export and how (see exports.py); submitted as GET parameters
+class ExportForm(forms.Form):
+    export = forms.ChoiceField(choices=[(name, name.capitalize()) for name in exports.EXPORTS])
+    format = forms.ChoiceField(choices=[(fmt, fmt.upper()) for fmt in exports.FORMATS])
+    courses = forms.ModelMultipleChoiceField(queryset=Course.all_objects.all(), required=False,
+                                             help_text="Leave empty to export every course.")
+    since = forms.DateField(required=False, widget=AdminDateWidget)
+    until = forms.DateField(required=False, widget=AdminDateWidget)
+
+    def __init__(self, *args, admin_site, **kwargs):
+        super().__init__(*args, **kwargs)
+        courses = self.fields['courses']
+        courses.widget = AutocompleteSelectMultiple(
+            CourseProgress._meta.get_field('course'), admin_site, attrs={'style': 'width: 30em'}
+        )
+        # The widget only looks up the selected courses, through the field's queryset
+        courses.widget.choices = courses.choices
+
 # Extend User Admin
 class CustomUserAdmin(UserAdmin):
     inlines = (UserDetailInline,)
@@ -19,37 +97,81 @@ class CustomUserAdmin(UserAdmin):
     list_editable = ('is_active', 'is_staff')
     list_filter = ('is_staff', 'is_superuser', 'is_active', 'userdetail__role')
     search_fields = ('username', 'first_name', 'last_name', 'email', 'userdetail__role')
+    list_select_related = ('userdetail',)
+    show_full_result_count = False
 
     def get_role(self, obj):
         return obj.userdetail.role if hasattr(obj, 'userdetail') else '-'
     get_role.short_description = 'Role'
 
-# Custom Actions
+# Custom Actions; the heavy ones run as background jobs (see jobs.py)
+def _queued(request, job, description):
+    messages.info(request, f"Queued job #{job.pk} to {description}; follow it under Jobs.")
+
+def _selected_ids(queryset):
+    return list(queryset.values_list('pk', flat=True))
+
 def archive_selected(modeladmin, request, queryset):
-    queryset.update(is_archived=True)
+    ids = _selected_ids(queryset)
+    job = jobs.enqueue('set_archived', request.user, model=queryset.model._meta.label, ids=ids, archived=True)
+    _queued(request, job, f"archive {len(ids)} items")
 archive_selected.short_description = "Archive selected items"
 
 def unarchive_selected(modeladmin, request, queryset):
-    queryset.update(is_archived=False)
+    ids = _selected_ids(queryset)
+    job = jobs.enqueue('set_archived', request.user, model=queryset.model._meta.label, ids=ids, archived=False)
+    _queued(request, job, f"unarchive {len(ids)} items")
 unarchive_selected.short_description = "Unarchive selected items"
 
 def delete_selected(modeladmin, request, queryset):
-    queryset.delete()
+    if queryset.model is Course:
+        # Courses disappear at once and are deleted row by row in the background
+        job = jobs.delete_courses_later(queryset, request.user)
+        _queued(request, job, f"delete {len(job.params['course_ids'])} courses")
+        return
+    ids = _selected_ids(queryset)
+    job = jobs.enqueue('delete_rows', request.user, model=queryset.model._meta.label, ids=ids)
+    _queued(request, job, f"delete {len(ids)} items")
 delete_selected.short_description = "Delete selected items"
 
+def recount_selected(modeladmin, request, queryset):
+    job = jobs.enqueue('refresh_counters', request.user, course_ids=_selected_ids(queryset))
+    _queued(request, job, "recount progress and page stats")
+recount_selected.short_description = "Recount progress and page stats of selected courses"
+
+def export_bundles(modeladmin, request, queryset):
+    response = StreamingHttpResponse(export_ndjson(queryset), content_type='application/x-ndjson')
+    response['Content-Disposition'] = 'attachment; filename="courses.ndjson"'
+    return response
+export_bundles.short_description = "Export selected courses as NDJSON bundles"
+
+# Admin works on archived rows too, which the models' default managers hide
+class AllObjectsAdminMixin:
+    def get_queryset(self, request):
+        queryset = self.model.all_objects.get_queryset()
+        ordering = self.get_ordering(request)
+        if ordering:
+            queryset = queryset.order_by(*ordering)
+        return queryset
+
 # ModelAdmin Classes
 @admin.register(Course)
-class CourseAdmin(admin.ModelAdmin):
+class CourseAdmin(AllObjectsAdminMixin, admin.ModelAdmin):
     list_display = ('title', 'category', 'creator_link', 'learner_count', 'page_count', 
                    'is_archived', 'created_date')
     list_editable = ('category', 'is_archived')
     list_filter = ('is_archived', 'category', 'created_date')
     search_fields = ('title', 'description', 'creator__username')
-    actions = [delete_selected, archive_selected, unarchive_selected]
+    actions = [delete_selected, archive_selected, unarchive_selected, recount_selected, export_bundles]
     readonly_fields = ('created_date', 'modified_date', 'course_id')
-    filter_horizontal = ('learners',)
+    change_list_template = 'admin/elevatelearningapp/course/change_list.html'
+    # Lists only the enrolled learners; cohorts are enrolled from the "Enroll learners" page
+    autocomplete_fields = ('learners',)
     list_per_page = 20
     raw_id_fields = ('creator',)
+    list_select_related = ('creator',)
+    # Newest first on the catalog index; also orders the autocomplete results of the course filters
+    ordering = ('-created_date', '-course_id')
     
     fieldsets = (
         ('Basic Information', {
@@ -72,24 +194,113 @@ class CourseAdmin(admin.ModelAdmin):
                          obj.creator.username)
     creator_link.short_description = 'Creator'
 
+    def get_queryset(self, request):
+        # Counted per listed row in the same query; a GROUP BY would count every course first
+        learners = Course.learners.through.objects.filter(
+            course_id=OuterRef('pk')
+        ).order_by().values('course_id').annotate(n=Count('*')).values('n')
+        pages = CoursePage.objects.filter(
+            course_id=OuterRef('pk')
+        ).order_by().values('course_id').annotate(n=Count('*')).values('n')
+        return super().get_queryset(request).defer('description').annotate(
+            learner_total=Coalesce(Subquery(learners), 0),
+            page_total=Coalesce(Subquery(pages), 0),
+        )
+
+    def delete_model(self, request, obj):
+        job = jobs.delete_courses_later(Course.all_objects.filter(pk=obj.pk), request.user)
+        _queued(request, job, f"delete '{obj.title}'")
+
+    def get_deleted_objects(self, objs, request):
+        # Listing every page, comment and progress record of a big course takes longer than deleting them
+        return [str(obj) for obj in objs], {Course._meta.verbose_name_plural: len(objs)}, set(), []
+
     def learner_count(self, obj):
-        return obj.learners.count()
+        return obj.learner_total
     learner_count.short_description = 'Learners'
+    learner_count.admin_order_field = 'learner_total'
 
     def page_count(self, obj):
-        return obj.pages.count()
+        return obj.page_total
     page_count.short_description = 'Pages'
+    page_count.admin_order_field = 'page_total'
+
+    def get_urls(self):
+        urls = [
+            path('export-bundles/', self.admin_site.admin_view(self.export_bundles_view), name='course_export_bundles'),
+            path('import-bundles/', self.admin_site.admin_view(self.import_bundles_view), name='course_import_bundles'),
+            path('<int:course_id>/enroll/', self.admin_site.admin_view(self.enroll_learners_view),
+                 name='course_enroll_learners'),
+        ]
+        return urls + super().get_urls()
+
+    def export_bundles_view(self, request):
+        """Stream every course (or ?creator=<username>'s courses) as NDJSON"""
+        courses = self.get_queryset(request)
+        if request.GET.get('creator'):
+            courses = courses.filter(creator__username=request.GET['creator'])
+        return export_bundles(self, request, courses)
+
+    def import_bundles_view(self, request):
+        if request.method == 'POST' and request.FILES.get('bundle'):
+            creator = User.objects.filter(username=request.POST.get('creator') or request.user.username).first()
+            if creator is None:
+                messages.error(request, "No user with that username.")
+            else:
+                try:
+                    courses, pages = import_bundles(parse_lines(request.FILES['bundle']), creator)
+                    messages.success(request, f"Imported {courses} courses with {pages} pages.")
+                    return redirect('admin:elevatelearningapp_course_changelist')
+                except BundleError as e:
+                    messages.error(request, f"Import failed and nothing was imported: {e}")
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Import course bundles',
+        }
+        return TemplateResponse(request, 'admin/elevatelearningapp/course/import_bundles.html', context)
+
+    def enroll_learners_view(self, request, course_id):
+        course = self.get_object(request, str(course_id))
+        if course is None or not self.has_change_permission(request, course):
+            raise PermissionDenied
+        if request.method == 'POST':
+            if request.FILES.get('learners_file'):
+                usernames = enrollment.read_usernames(request.FILES['learners_file'])
+            else:
+                usernames = enrollment.split_usernames(request.POST.get('learners', ''))
+            result = enrollment.enroll(course, usernames)
+            messages.success(request, f"Enrolled {result['enrolled']} learners; "
+                                      f"{result['already_enrolled']} were already enrolled.")
+            for key, label in (('not_found', "No such users"), ('not_learners', "Not learners")):
+                if result[key]:
+                    shown = ', '.join(result[key][:20]) + (' ...' if len(result[key]) > 20 else '')
+                    messages.warning(request, f"{label} ({len(result[key])}): {shown}")
+            return redirect('admin:elevatelearningapp_course_change', course.pk)
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'original': course,
+            'title': f"Enroll learners in {course.title}",
+        }
+        return TemplateResponse(request, 'admin/elevatelearningapp/course/enroll_learners.html', context)
 
 @admin.register(CoursePage)
-class CoursePageAdmin(admin.ModelAdmin):
+class CoursePageAdmin(AutocompleteFilterMixin, AllObjectsAdminMixin, admin.ModelAdmin):
     list_display = ('page_title', 'course_link', 'page_no', 'is_completed', 
                    'is_archived', 'created_at', 'comment_count')
     list_editable = ('page_no', 'is_completed', 'is_archived')
-    list_filter = ('is_archived', 'is_completed', 'course', 'created_at')
+    list_filter = ('is_archived', 'is_completed', ('course', AutocompleteFilter), 'created_at')
     search_fields = ('page_title', 'page_description', 'course__title')
     actions = [delete_selected, archive_selected, unarchive_selected]
     list_per_page = 20
     raw_id_fields = ('course',)
+    list_select_related = ('course', 'stats')
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        # The listing never shows page bodies or course descriptions
+        return super().get_queryset(request).defer('page_description', 'course__description')
     
     def course_link(self, obj):
         return format_html('<a href="{}">{}</a>', 
@@ -99,8 +310,13 @@ class CoursePageAdmin(admin.ModelAdmin):
     course_link.admin_order_field = 'course'
 
     def comment_count(self, obj):
-        return obj.comments.count()
+        # Kept up to date by signals (see CoursePageStats); pages without a stats row show 0
+        try:
+            return obj.stats.comment_count
+        except CoursePageStats.DoesNotExist:
+            return 0
     comment_count.short_description = 'Comments'
+    comment_count.admin_order_field = 'stats__comment_count'
 
 @admin.register(QRcode)
 class QRcodeAdmin(admin.ModelAdmin):
@@ -111,6 +327,10 @@ class QRcodeAdmin(admin.ModelAdmin):
     actions = [delete_selected, archive_selected, unarchive_selected]
     readonly_fields = ('qrcode_id', 'created_at', 'modified_at')
     raw_id_fields = ('course',)
+    list_select_related = ('course',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('course__description')
     
     def course_link(self, obj):
         return format_html('<a href="{}">{}</a>', 
@@ -123,16 +343,50 @@ class QRcodeAdmin(admin.ModelAdmin):
     short_qrcode_url.short_description = 'QR Code URL'
 
 @admin.register(CourseProgress)
-class CourseProgressAdmin(admin.ModelAdmin):
+class CourseProgressAdmin(AutocompleteFilterMixin, admin.ModelAdmin):
     list_display = ('learner_link', 'course_link', 'progress_bar', 'current_page_link', 
                    'started_at', 'get_is_completed', 'is_archived')
     list_editable = ('is_archived',)
-    list_filter = ('is_archived', 'course', 'started_at')
+    list_filter = ('is_archived', ('course', AutocompleteFilter), 'started_at')
     search_fields = ('learner__username', 'course__title')
     actions = [delete_selected, archive_selected, unarchive_selected]
     readonly_fields = ('started_at', 'completed_at', 'last_updated')
     list_per_page = 20
     raw_id_fields = ('learner', 'course', 'current_page')
+    list_select_related = ('learner', 'course', 'current_page')
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('course__description', 'current_page__page_description')
+
+    def get_urls(self):
+        urls = [
+            path('export/', self.admin_site.admin_view(self.export_view), name='courseprogress_export'),
+        ]
+        return urls + super().get_urls()
+
+    def export_view(self, request):
+        """Stream progress, enrollments or interactions as CSV or NDJSON, filtered by course and date"""
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        form = ExportForm(request.GET or None, admin_site=self.admin_site)
+        if form.is_valid():
+            data = form.cleaned_data
+            name, fmt = data['export'], data['format']
+            response = StreamingHttpResponse(exports.stream(
+                name, fmt, course_ids=[course.pk for course in data['courses']],
+                since=data['since'], until=data['until'],
+            ), content_type=exports.FORMATS[fmt])
+            response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+            return response
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Export learner data',
+            'form': form,
+            'media': self.media + form.media,
+        }
+        return TemplateResponse(request, 'admin/elevatelearningapp/courseprogress/export.html', context)
     
     def learner_link(self, obj):
         return format_html('<a href="{}">{}</a>', 
@@ -166,16 +420,22 @@ class CourseProgressAdmin(admin.ModelAdmin):
         return obj.is_completed
     get_is_completed.boolean = True
     get_is_completed.short_description = 'Completed'
+    get_is_completed.admin_order_field = 'completed_at'
 
 @admin.register(CourseInteraction)
-class CourseInteractionAdmin(admin.ModelAdmin):
+class CourseInteractionAdmin(AllObjectsAdminMixin, admin.ModelAdmin):
     list_display = ('user_link', 'course_page_link', 'liked', 'shared', 'created_at', 'is_archived')
     list_editable = ('liked', 'shared', 'is_archived')
     list_filter = ('is_archived', 'liked', 'shared', 'created_at')
     search_fields = ('user__username', 'course_page__page_title')
     actions = [delete_selected, archive_selected, unarchive_selected]
-    readonly_fields = ('created_at',)
+    readonly_fields = ('liked_at', 'shared_at', 'created_at')
     raw_id_fields = ('user', 'course_page')
+    list_select_related = ('user', 'course_page')
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('course_page__page_description')
     
     def user_link(self, obj):
         return format_html('<a href="{}">{}</a>', 
@@ -190,7 +450,7 @@ class CourseInteractionAdmin(admin.ModelAdmin):
     course_page_link.short_description = 'Course Page'
 
 @admin.register(CourseComment)
-class CourseCommentAdmin(admin.ModelAdmin):
+class CourseCommentAdmin(AllObjectsAdminMixin, admin.ModelAdmin):
     list_display = ('user_link', 'course_page_link', 'short_text', 'created_at', 'is_archived')
     list_editable = ('is_archived',)
     list_filter = ('is_archived', 'created_at')
@@ -198,6 +458,11 @@ class CourseCommentAdmin(admin.ModelAdmin):
     actions = [delete_selected, archive_selected, unarchive_selected]
     readonly_fields = ('created_at', 'updated_at')
     raw_id_fields = ('user', 'course_page')
+    list_select_related = ('user', 'course_page')
+    show_full_result_count = False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer('course_page__page_description')
     
     def user_link(self, obj):
         return format_html('<a href="{}">{}</a>', 
@@ -215,6 +480,73 @@ class CourseCommentAdmin(admin.ModelAdmin):
         return obj.text[:50] + '...' if len(obj.text) > 50 else obj.text
     short_text.short_description = 'Comment'
 
+@admin.register(CoursePageStats)
+class CoursePageStatsAdmin(admin.ModelAdmin):
+    list_display = ('course_page_link', 'like_count', 'share_count', 'comment_count')
+    search_fields = ('course_page__page_title',)
+    readonly_fields = ('course_page', 'like_count', 'share_count', 'comment_count')
+    list_select_related = ('course_page',)
+    show_full_result_count = False
+    
+    def course_page_link(self, obj):
+        return format_html('<a href="{}">{}</a>', 
+                         f'/admin/elearning/coursepage/{obj.course_page.coursepage_id}/change/',
+                         obj.course_page.page_title)
+    course_page_link.short_description = 'Course Page'
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(Certificate)
+class CertificateAdmin(admin.ModelAdmin):
+    list_display = ('code', 'learner_name', 'course_title', 'completed_at', 'issued_at', 'artifact_links')
+    search_fields = ('code', 'learner__username', 'learner_name', 'course_title')
+    list_filter = ('issued_at',)
+    readonly_fields = ('code', 'learner', 'course', 'learner_name', 'course_title', 'completed_at', 'issued_at',
+                       'artifact_digest')
+    ordering = ('-issued_at',)
+    show_full_result_count = False
+
+    def artifact_links(self, obj):
+        if not obj.artifact_digest:
+            return 'Pending'
+        return format_html('<a href="{}">PNG</a> / <a href="{}">PDF</a>', obj.png_url, obj.pdf_url)
+    artifact_links.short_description = 'Files'
+
+    def has_add_permission(self, request):
+        return False
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'status', 'progress_bar', 'attempts', 'created_by', 'created_at',
+                    'started_at', 'finished_at')
+    list_filter = ('status', 'kind', 'created_at')
+    list_select_related = ('created_by',)
+    readonly_fields = ('kind', 'params', 'status', 'created_by', 'progress_done', 'progress_total', 'attempts',
+                       'error', 'created_at', 'started_at', 'heartbeat_at', 'finished_at')
+    ordering = ('-created_at',)
+    actions = ['retry_jobs']
+    list_per_page = 50
+
+    def progress_bar(self, obj):
+        percentage = obj.progress_percentage * 100
+        return format_html(
+            '<div style="width:100px;background:#ddd;border-radius:5px;">'
+            '<div style="width:{}%;background:#4CAF50;height:20px;border-radius:5px;text-align:center;color:white;">{}%</div>'
+            '</div>{} / {}', percentage, int(percentage), obj.progress_done, obj.progress_total)
+    progress_bar.short_description = 'Progress'
+
+    @admin.action(description="Run selected failed jobs again")
+    def retry_jobs(self, request, queryset):
+        retried = queryset.filter(status='failed').update(status='queued', attempts=0, error='', finished_at=None)
+        messages.info(request, f"Queued {retried} jobs again.")
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
 # Unregister the default User admin and register our custom one
 admin.site.unregister(User)
 admin.site.register(User, CustomUserAdmin)
@@ -0,0 +1,193 @@
+"""
+Daily learning-analytics rollups.
+
+``CourseDailyStats`` and ``PageDailyStats`` hold, per course and per page,
+each day's enrollments, course completions, page completions, likes, shares
+and comments. Events are bucketed by their own timestamps
+(``CourseProgress.started_at`` and ``completed_at``,
+``PageCompletion.completed_at``, ``CourseInteraction.liked_at`` and
+``shared_at`` and ``CourseComment.created_at``), each of which is indexed, so
+aggregating a day reads only that day's rows.
+
+``aggregate`` (run by the ``rollup_analytics`` command) re-aggregates every
+day from the watermark, less ``LAG`` seconds for transactions that committed
+late, up to now. It replaces those days' rows and then moves the watermark
+to when it started, so running it again is harmless. Events count as they
+stood when their day was last aggregated: a like withdrawn or a comment
+archived later shows up only once that day is aggregated again
+(``rollup_analytics --since``).
+
+Educator dashboards read only these rows and the course manifest.
+"""
+
+from collections import Counter, defaultdict
+from datetime import datetime, time, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q, Sum
+from django.utils import timezone
+from .models import (AnalyticsWatermark, CourseComment, CourseDailyStats, CourseInteraction, CourseManifest,
+                     CourseProgress, PageCompletion, PageDailyStats)
+
+DEFAULTS = {
+    'LAG': 900,
+}
+
+WATERMARK = 'daily_rollups'
+
+PAGE_METRICS = ('page_completions', 'likes', 'shares', 'comments')
+COURSE_METRICS = ('enrollments', 'completions') + PAGE_METRICS
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'ANALYTICS', {})}
+
+
+def day_bounds(day):
+    """(start, end) of a day, from midnight to midnight in the site's time zone"""
+    start = timezone.make_aware(datetime.combine(day, time.min))
+    return start, timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _page_counts(day):
+    """(course_id, course_page_id) -> Counter of the page metrics for one day"""
+    start, end = day_bounds(day)
+    pages = defaultdict(Counter)
+    rows = PageCompletion.objects.filter(completed_at__gte=start, completed_at__lt=end).values_list(
+        'coursepage__course_id', 'coursepage_id'
+    ).annotate(n=Count('*')).order_by()
+    for course_id, page_id, n in rows:
+        pages[(course_id, page_id)]['page_completions'] = n
+    # A like or share counts on the day it was made, not the day the interaction row was created
+    for field, metric in (('liked_at', 'likes'), ('shared_at', 'shares')):
+        rows = CourseInteraction.objects.filter(**{f'{field}__gte': start, f'{field}__lt': end}).values_list(
+            'course_page__course_id', 'course_page_id'
+        ).annotate(n=Count('*')).order_by()
+        for course_id, page_id, n in rows:
+            pages[(course_id, page_id)][metric] = n
+    rows = CourseComment.objects.filter(created_at__gte=start, created_at__lt=end).values_list(
+        'course_page__course_id', 'course_page_id'
+    ).annotate(n=Count('*')).order_by()
+    for course_id, page_id, n in rows:
+        pages[(course_id, page_id)]['comments'] = n
+    return pages
+
+
+def _course_counts(day, pages):
+    """course_id -> Counter of the course metrics for one day, including its pages' totals"""
+    start, end = day_bounds(day)
+    courses = defaultdict(Counter)
+    for field, metric in (('started_at', 'enrollments'), ('completed_at', 'completions')):
+        rows = CourseProgress.objects.filter(**{f'{field}__gte': start, f'{field}__lt': end}).values_list(
+            'course_id'
+        ).annotate(n=Count('*')).order_by()
+        for course_id, n in rows:
+            courses[course_id][metric] = n
+    for (course_id, page_id), counts in pages.items():
+        courses[course_id].update(counts)
+    return courses
+
+
+def aggregate_day(day):
+    """Replace one day's rollup rows with counts from the source tables"""
+    pages = _page_counts(day)
+    courses = _course_counts(day, pages)
+    with transaction.atomic():
+        CourseDailyStats.objects.filter(day=day).delete()
+        PageDailyStats.objects.filter(day=day).delete()
+        CourseDailyStats.objects.bulk_create([
+            CourseDailyStats(course_id=course_id, day=day, **{metric: counts[metric] for metric in COURSE_METRICS})
+            for course_id, counts in courses.items()
+        ], batch_size=1000)
+        PageDailyStats.objects.bulk_create([
+            PageDailyStats(course_id=course_id, course_page_id=page_id, day=day,
+                           **{metric: counts[metric] for metric in PAGE_METRICS})
+            for (course_id, page_id), counts in pages.items()
+        ], batch_size=1000)
+
+
+def first_event():
+    """Time of the earliest event the rollups count, or None when there are none"""
+    times = [
+        CourseProgress.objects.aggregate(at=Min('started_at'))['at'],
+        PageCompletion.objects.aggregate(at=Min('completed_at'))['at'],
+        CourseInteraction.all_objects.aggregate(at=Min('created_at'))['at'],
+        CourseComment.all_objects.aggregate(at=Min('created_at'))['at'],
+    ]
+    times = [at for at in times if at is not None]
+    return min(times) if times else None
+
+
+def watermark():
+    """When the rollups were last aggregated up to, or None if they never were"""
+    return AnalyticsWatermark.objects.filter(name=WATERMARK).values_list('aggregated_until', flat=True).first()
+
+
+def aggregate(since=None, on_progress=None):
+    """
+    Re-aggregate every day from ``since`` (by default the watermark less
+    ``LAG``, or the first event on the first run) up to today, then move the
+    watermark. ``on_progress(day, done, total)`` is called after each day.
+    Returns the number of days aggregated.
+    """
+    started = timezone.now()
+    if since is None:
+        until = watermark()
+        since = until - timedelta(seconds=get_config()['LAG']) if until else first_event()
+    days = []
+    if since is not None:
+        day, today = timezone.localdate(since), timezone.localdate(started)
+        while day <= today:
+            days.append(day)
+            day += timedelta(days=1)
+    for done, day in enumerate(days, 1):
+        aggregate_day(day)
+        if on_progress:
+            on_progress(day, done, len(days))
+    AnalyticsWatermark.objects.update_or_create(name=WATERMARK, defaults={'aggregated_until': started})
+    return len(days)
+
+
+def daily_series(course_id, start, end):
+    """One dict of the course metrics per day from ``start`` to ``end`` inclusive, zeros where nothing happened"""
+    rows = {row['day']: row for row in CourseDailyStats.objects.filter(
+        course_id=course_id, day__gte=start, day__lte=end
+    ).values('day', *COURSE_METRICS)}
+    series = []
+    day = start
+    while day <= end:
+        series.append(rows.get(day) or dict({'day': day}, **{metric: 0 for metric in COURSE_METRICS}))
+        day += timedelta(days=1)
+    return series
+
+
+def totals(course_id, start=None):
+    """The course metrics summed over every day (or the days from ``start``)"""
+    rows = CourseDailyStats.objects.filter(course_id=course_id)
+    if start is not None:
+        rows = rows.filter(day__gte=start)
+    sums = rows.aggregate(**{metric: Sum(metric) for metric in COURSE_METRICS})
+    return {metric: sums[metric] or 0 for metric in COURSE_METRICS}
+
+
+def funnel(course_id, enrollments):
+    """
+    The course's pages in order with how many learners completed each, as a
+    share of ``enrollments``, and how many were lost since the page before.
+    """
+    completions = dict(PageDailyStats.objects.filter(course_id=course_id).values_list('course_page_id').annotate(
+        n=Sum('page_completions')
+    ).order_by())
+    steps = []
+    previous = enrollments
+    for entry in CourseManifest.for_course(course_id).entries:
+        completed = completions.get(entry.coursepage_id, 0)
+        steps.append({
+            'page': entry,
+            'completed': completed,
+            'share': completed / enrollments if enrollments else 0.0,
+            'drop_off': max(previous - completed, 0),
+            'drop_off_share': max(previous - completed, 0) / previous if previous else 0.0,
+        })
+        previous = completed
+    return steps
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ElevatelearningappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'elevatelearningapp'
+
+    def ready(self):
+        # certificates registers its job handler
+        from . import certificates, metrics, signals  # noqa: F401
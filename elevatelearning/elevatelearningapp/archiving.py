@@ -0,0 +1,48 @@
+"""
+Archiving and restoring rows in bulk.
+
+Courses, pages, interactions and comments are hidden from their default
+managers once archived (see ``ActiveManager``), and the page counters,
+manifests, cached fragments and search index only count what is visible.
+Saving a single row keeps those in step through signals, but
+``queryset.update(is_archived=...)`` sends none, so bulk archiving goes
+through ``set_archived``: it updates the rows and then repairs what depends
+on them with a few set-based statements.
+"""
+
+from django.db import transaction
+from . import fragments, search
+from .models import CourseComment, CourseInteraction, CourseManifest, CoursePage, CoursePageStats, CourseProgress
+
+
+def set_archived(queryset, archived):
+    """Archive (or restore) every row of ``queryset``; returns the number of rows changed"""
+    model = queryset.model
+    with transaction.atomic():
+        changed = model._base_manager.filter(
+            pk__in=queryset.values('pk'), is_archived=not archived
+        ).select_for_update()
+        ids = list(changed.values_list('pk', flat=True))
+        if not ids:
+            return 0
+        model._base_manager.filter(pk__in=ids).update(is_archived=archived)
+
+        if model is CoursePage:
+            course_ids = set(CoursePage.all_objects.filter(pk__in=ids).values_list('course_id', flat=True))
+            CourseProgress.objects.filter(course_id__in=course_ids).refresh_counters()
+            for course_id in course_ids:
+                CourseManifest.rebuild(course_id)
+            page_ids = ids
+        elif model in (CourseInteraction, CourseComment):
+            page_ids = set(model.all_objects.filter(pk__in=ids).values_list('course_page_id', flat=True))
+            CoursePageStats.ensure_for_pages(page_ids)
+        else:
+            page_ids = ()
+
+        if model is CourseComment:
+            for comment in CourseComment.all_objects.filter(pk__in=ids):
+                search.index_comment(comment)
+        if model in (CoursePage, CourseComment):
+            for page_id in page_ids:
+                fragments.invalidate_page(page_id)
+    return len(ids)
@@ -0,0 +1,88 @@
+"""
+Concurrent ORM calls for async views.
+
+Django's async ORM methods (``aget``, ``aexists``, ...) all run in the one
+thread a request's synchronous code shares, so awaiting two queries still
+runs them one after the other. ``gather`` runs each synchronous callable in
+its own worker thread instead, each with its own database connection, so a
+view waits for its slowest query rather than the sum of them::
+
+    enrolled, manifest = await async_db.gather(
+        lambda: user.enrolled_courses.filter(pk=course_id).exists(),
+        lambda: CourseManifest.for_course(course_id),
+    )
+
+Worker threads close their connection after each call, which returns it
+to the pool with the pooled backend; without the pool every call opens a
+new one, so ``ASYNC_CONCURRENT_QUERIES`` is only on by default with the
+pool. A process never has more than ``ASYNC_QUERY_CONNECTIONS`` calls
+(by default half the pool) in worker threads at once: when those are all
+busy, the remaining calls run one after another in the request's thread
+instead of waiting for a connection. Only gather reads and independent
+writes: the calls don't share a transaction. With
+``ASYNC_CONCURRENT_QUERIES = False`` (tests, whose data lives in the test
+case's transaction) the calls run one at a time in the request's thread.
+"""
+
+import asyncio
+import threading
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import connection
+
+_slots = None
+_slots_lock = threading.Lock()
+
+
+def connection_limit():
+    """Calls that may run in worker threads at once across the process"""
+    limit = getattr(settings, 'ASYNC_QUERY_CONNECTIONS', None)
+    if limit is None:
+        pool = settings.DATABASES['default'].get('OPTIONS', {}).get('pool')
+        if pool:
+            # Half the pool, leaving the rest for requests' own threads
+            limit = (pool if isinstance(pool, dict) else {}).get('max_size', 10) // 2
+        else:
+            limit = 4
+    return max(limit, 1)
+
+
+def _get_slots():
+    global _slots
+    if _slots is None:
+        with _slots_lock:
+            if _slots is None:
+                _slots = threading.BoundedSemaphore(connection_limit())
+    return _slots
+
+
+def _in_worker(call, slots):
+    def run():
+        try:
+            return call()
+        finally:
+            connection.close()
+            slots.release()
+    return sync_to_async(run, thread_sensitive=False)
+
+
+async def _in_request_thread(calls):
+    return [await sync_to_async(call)() for call in calls]
+
+
+async def gather(*calls):
+    """Run synchronous ORM callables and return their results in order"""
+    if len(calls) < 2 or not getattr(settings, 'ASYNC_CONCURRENT_QUERIES', True):
+        return await _in_request_thread(calls)
+    # One call always stays in the request's thread, which has a connection already
+    slots = _get_slots()
+    workers = 0
+    while workers < len(calls) - 1 and slots.acquire(blocking=False):
+        workers += 1
+    if not workers:
+        return await _in_request_thread(calls)
+    *results, rest = await asyncio.gather(
+        *(_in_worker(call, slots)() for call in calls[:workers]),
+        _in_request_thread(calls[workers:]),
+    )
+    return results + rest
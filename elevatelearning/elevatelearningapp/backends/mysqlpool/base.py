@@ -0,0 +1,108 @@
+"""
+MySQL backend with a per-process connection pool.
+
+Use it as ``ENGINE`` and configure the pool the way Django's PostgreSQL
+backend is configured, through ``OPTIONS['pool']``::
+
+    'ENGINE': 'elevatelearningapp.backends.mysqlpool',
+    'CONN_MAX_AGE': 0,
+    'OPTIONS': {'pool': {'max_size': 10, 'timeout': 10, 'max_lifetime': 1800, 'pre_ping': True}},
+
+Django closes the connection at the end of every request; here that returns
+it to the pool instead, so requests skip the TCP and auth handshake.
+Connections that saw errors, or were closed inside a transaction, are
+thrown away rather than reused.
+"""
+
+import threading
+from functools import partial
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.mysql import base as mysql_base
+from ... import metrics
+from .pool import ConnectionPool, PoolTimeout
+
+Database = mysql_base.Database
+
+POOL_DEFAULTS = {
+    'max_size': 10,
+    'timeout': 10.0,
+    'max_lifetime': 1800.0,
+    'pre_ping': True,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class DatabaseWrapper(mysql_base.DatabaseWrapper):
+    @property
+    def pool(self):
+        pool = _pools.get(self.alias)
+        if pool is None:
+            with _pools_lock:
+                pool = _pools.get(self.alias)
+                if pool is None:
+                    options = self.settings_dict['OPTIONS'].get('pool', True)
+                    options = {**POOL_DEFAULTS, **(options if isinstance(options, dict) else {})}
+                    conn_params = self.get_connection_params()
+                    pool = _pools[self.alias] = ConnectionPool(
+                        connect=partial(mysql_base.DatabaseWrapper.get_new_connection, self, conn_params),
+                        ping=lambda connection: connection.ping(),
+                        **options,
+                    )
+        return pool
+
+    def get_connection_params(self):
+        if self.settings_dict['CONN_MAX_AGE'] != 0:
+            raise ImproperlyConfigured("The pooled MySQL backend needs CONN_MAX_AGE = 0; the pool keeps connections.")
+        params = super().get_connection_params()
+        # Pool settings aren't connection arguments
+        params.pop('pool', None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        try:
+            return self.pool.acquire()
+        except PoolTimeout as exc:
+            raise Database.OperationalError(str(exc)) from exc
+
+    def _close(self):
+        if self.connection is None:
+            return
+        discard = self.errors_occurred or self.in_atomic_block
+        if not discard:
+            try:
+                if not self.connection.get_autocommit():
+                    self.connection.rollback()
+            except Database.Error:
+                discard = True
+        self.pool.release(self.connection, discard=discard)
+
+
+POOL_METRICS = {
+    'elevatelearning_db_pool_connections': ('gauge', 'Open pooled database connections by state.'),
+    'elevatelearning_db_pool_max_size': ('gauge', 'Connections the pool may open.'),
+    'elevatelearning_db_pool_checkouts_total': ('counter', 'Connections handed out by the pool.'),
+    'elevatelearning_db_pool_waits_total': ('counter', 'Checkouts that had to wait for a free connection.'),
+    'elevatelearning_db_pool_wait_seconds_total': ('counter', 'Time spent waiting for a free connection.'),
+    'elevatelearning_db_pool_timeouts_total': ('counter', 'Checkouts that gave up waiting.'),
+    'elevatelearning_db_pool_opened_total': ('counter', 'Connections opened.'),
+    'elevatelearning_db_pool_closed_total': ('counter', 'Connections closed.'),
+    'elevatelearning_db_pool_recycled_total': ('counter', 'Connections closed for reaching max_lifetime.'),
+    'elevatelearning_db_pool_failed_pings_total': ('counter', 'Idle connections that failed the pre-ping.'),
+}
+
+
+def _collect_pool_metrics():
+    for alias, pool in list(_pools.items()):
+        stats = pool.get_stats()
+        labels = {'alias': alias}
+        yield 'elevatelearning_db_pool_connections', {**labels, 'state': 'idle'}, stats['idle']
+        yield 'elevatelearning_db_pool_connections', {**labels, 'state': 'in_use'}, stats['in_use']
+        yield 'elevatelearning_db_pool_max_size', labels, stats['max_size']
+        for name in ('checkouts', 'waits', 'wait_seconds', 'timeouts', 'opened', 'closed', 'recycled',
+                     'failed_pings'):
+            yield f'elevatelearning_db_pool_{name}_total', labels, stats[name]
+
+
+metrics.register_collector(_collect_pool_metrics, POOL_METRICS)
@@ -0,0 +1,175 @@
+"""
+A bounded, thread-safe pool of DB-API connections, one per process and alias.
+
+``acquire`` hands out an idle connection or opens a new one while fewer than
+``max_size`` exist, and otherwise waits up to ``timeout`` seconds for one to
+be released. Connections older than ``max_lifetime`` are closed rather than
+reused, and idle connections are pinged before they're handed out when
+``pre_ping`` is on. Pinging, connecting and closing talk to the server, so
+they happen without the lock held: a slow or dead connection only holds up
+the thread that drew it.
+"""
+
+import os
+import threading
+import time
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, ping, max_size=10, timeout=10.0, max_lifetime=1800.0, pre_ping=True):
+        self.connect = connect
+        self.ping = ping
+        self.max_size = max_size
+        self.timeout = timeout
+        self.max_lifetime = max_lifetime
+        self.pre_ping = pre_ping
+        self._condition = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []            # [(connection, opened at)], most recently released last
+        self._opened_at = {}       # id(connection) -> opened at, for every open connection
+        self.stats = {
+            'opened': 0, 'closed': 0, 'recycled': 0, 'failed_pings': 0,
+            'checkouts': 0, 'waits': 0, 'wait_seconds': 0.0, 'timeouts': 0,
+        }
+
+    def _check_fork(self):
+        # Connections opened before a fork belong to the parent; forget them
+        if self._pid != os.getpid():
+            self._reset()
+
+    @property
+    def size(self):
+        return len(self._opened_at)
+
+    @property
+    def in_use(self):
+        return len(self._opened_at) - len(self._idle)
+
+    def acquire(self):
+        start = time.monotonic()
+        waited = False
+        while True:
+            closing = []
+            placeholder = connection = None
+            try:
+                with self._condition:
+                    self._check_fork()
+                    while True:
+                        connection = self._pop_idle(closing)
+                        if connection is not None:
+                            break
+                        if self.size < self.max_size:
+                            # Reserve the slot, then connect without holding the lock
+                            placeholder = object()
+                            self._opened_at[id(placeholder)] = time.monotonic()
+                            break
+                        remaining = self.timeout - (time.monotonic() - start)
+                        if remaining <= 0:
+                            self.stats['timeouts'] += 1
+                            raise PoolTimeout(
+                                f"No database connection became free within {self.timeout}s "
+                                f"({self.max_size} in use)."
+                            )
+                        waited = True
+                        self._condition.wait(remaining)
+            finally:
+                # Closing talks to the server, so it happens outside the lock
+                for stale in closing:
+                    self._close(stale)
+            if placeholder is not None:
+                return self._open(placeholder, start, waited)
+            # So does pinging; the connection stays counted as in use meanwhile
+            if not self.pre_ping or self._ping(connection):
+                with self._condition:
+                    return self._checked_out(connection, start, waited)
+            with self._condition:
+                self._forget(connection, 'failed_pings')
+            self._close(connection)
+
+    def _pop_idle(self, closing):
+        # Called with the lock held; connections past max_lifetime are forgotten and put on ``closing``
+        while self._idle:
+            connection, opened_at = self._idle.pop()
+            if time.monotonic() - opened_at > self.max_lifetime:
+                self._forget(connection, 'recycled')
+                closing.append(connection)
+                continue
+            return connection
+        return None
+
+    def _open(self, placeholder, start, waited):
+        try:
+            connection = self.connect()
+        except BaseException:
+            with self._condition:
+                del self._opened_at[id(placeholder)]
+                self._condition.notify()
+            raise
+        with self._condition:
+            opened_at = self._opened_at.pop(id(placeholder))
+            self._opened_at[id(connection)] = opened_at
+            self.stats['opened'] += 1
+            return self._checked_out(connection, start, waited)
+
+    def _checked_out(self, connection, start, waited):
+        # Called with the lock held
+        self.stats['checkouts'] += 1
+        if waited:
+            self.stats['waits'] += 1
+            self.stats['wait_seconds'] += time.monotonic() - start
+        return connection
+
+    def _ping(self, connection):
+        try:
+            self.ping(connection)
+            return True
+        except Exception:
+            return False
+
+    def _forget(self, connection, reason=None):
+        # Called with the lock held; the caller closes the connection once the lock is released
+        self._opened_at.pop(id(connection), None)
+        self.stats['closed'] += 1
+        if reason:
+            self.stats[reason] += 1
+        self._condition.notify()
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def release(self, connection, discard=False):
+        """Return a connection; ``discard`` closes it instead (e.g. after errors)"""
+        with self._condition:
+            if self._pid != os.getpid() or id(connection) not in self._opened_at:
+                # Opened before a fork or already discarded
+                return
+            if not discard:
+                self._idle.append((connection, self._opened_at[id(connection)]))
+                self._condition.notify()
+                return
+            self._forget(connection)
+        self._close(connection)
+
+    def close_idle(self):
+        with self._condition:
+            closing = [connection for connection, opened_at in self._idle]
+            self._idle = []
+            for connection in closing:
+                self._forget(connection)
+        for connection in closing:
+            self._close(connection)
+
+    def get_stats(self):
+        with self._condition:
+            return {**self.stats, 'size': self.size, 'idle': len(self._idle),
+                    'in_use': self.in_use, 'max_size': self.max_size}
@@ -0,0 +1,532 @@
+"""
+Latency and query-count benchmarks for every URL in ``elevatelearningapp.urls``.
+
+Each URL pattern has a scenario: the role it is requested as, the method,
+and how to pick its arguments from a seeded dataset (see ``seeding.py``).
+``run`` requests every scenario through the test client against the
+configured database and reports p50/p95/p99 latency and query counts.
+Scenarios that post (likes, comments, moves, ...) change the dataset, so run
+benchmarks against a database seeded for the purpose.
+
+``run_concurrent`` measures throughput instead: it sends the same requests
+through a WSGI-style pool of workers, each handling one request at a time
+(``gunicorn --workers N``), and through the ASGI application with many
+requests in flight, optionally adding a fixed delay to every query to
+stand in for a database across the network.
+
+``explain_plans`` asks the database how it runs the hot lookups behind
+those pages (a course's visible pages, a page's likes and comments, a
+learner's progress, the catalog) and checks each plan uses the index meant
+for it, so a migration or query change that falls back to a table scan
+shows up in the report.
+"""
+
+import asyncio
+import random
+import statistics
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlencode
+from concurrent.futures import ThreadPoolExecutor
+from django import get_version
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.asgi import get_asgi_application
+from django.db import connection, connections
+from django.db.models import Count
+from django.db.backends.signals import connection_created
+from django.test import Client, override_settings
+from django.urls import get_resolver, reverse
+from django.utils import timezone
+from . import certificates, progress_buffer
+from .metrics import RequestRecord
+from .models import (Course, CourseComment, CourseInteraction, CourseManifest, CoursePage,
+                     CourseProgress, UserDetail)
+from .seeding import SEED_PASSWORD, WORDS
+
+
+def percentile(values, p):
+    """Linear-interpolated percentile of a list of numbers"""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * p / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+class Dataset:
+    """Random samples of the seeded data that scenarios draw their arguments from"""
+
+    def __init__(self, prefix='bench', samples=200, random_seed=0):
+        self.rng = random.Random(random_seed)
+        self.prefix = prefix
+        self.progress = self._sample(
+            CourseProgress.objects.filter(learner__username__startswith=f'{prefix}-learner-'),
+            ('learner_id', 'course_id', 'completed_at'), samples
+        )
+        self.courses = self._sample(
+            Course.objects.filter(creator__username__startswith=f'{prefix}-educator-'),
+            ('course_id', 'creator_id'), samples
+        )
+        if not self.progress or not self.courses:
+            raise ValueError(f"No seeded data with the prefix '{prefix}'; run seed_data first.")
+        self.staff, created = User.objects.get_or_create(
+            username=f'{prefix}-staff@example.com', defaults={'is_staff': True, 'email': f'{prefix}-staff@example.com'}
+        )
+        self.users = {user.pk: user for user in User.objects.filter(
+            pk__in={row[0] for row in self.progress} | {row[1] for row in self.courses}
+        )}
+        self._pages = {}
+
+    def _sample(self, queryset, fields, size):
+        # Random primary key probes; ORDER BY RAND() would sort millions of rows
+        ids = queryset.order_by().values_list('pk', flat=True)
+        low, high = ids.order_by('pk').first(), ids.order_by('-pk').first()
+        if low is None:
+            return []
+        rows = set()
+        for _ in range(size * 2):
+            row = queryset.filter(pk__gte=self.rng.randint(low, high)).order_by('pk').values_list(*fields).first()
+            if row:
+                rows.add(row)
+            if len(rows) >= size:
+                break
+        return sorted(rows, key=str)
+
+    def pages(self, course_id):
+        if course_id not in self._pages:
+            self._pages[course_id] = [entry[0] for entry in CourseManifest.for_course(course_id).pages]
+        return self._pages[course_id]
+
+    def enrollment(self, completed=False):
+        rows = [row for row in self.progress if row[2]] if completed else self.progress
+        learner_id, course_id, completed_at = self.rng.choice(rows or self.progress)
+        return self.users[learner_id], course_id
+
+    def enrolled_page(self):
+        while True:
+            learner, course_id = self.enrollment()
+            pages = self.pages(course_id)
+            if pages:
+                return learner, self.rng.choice(pages)
+
+    def learner(self):
+        return self.enrollment()[0]
+
+    def educator_course(self):
+        course_id, creator_id = self.rng.choice(self.courses)
+        return self.users[creator_id], course_id
+
+
+def _request(user=None, kwargs=None, data=None, headers=None):
+    return {'user': user, 'kwargs': kwargs or {}, 'data': data, 'headers': headers or {}}
+
+
+def _learner_page(dataset, **extra):
+    learner, page_id = dataset.enrolled_page()
+    return _request(learner, {'coursepage_id': page_id}, **extra)
+
+
+def _educator_page(dataset):
+    while True:
+        educator, course_id = dataset.educator_course()
+        pages = dataset.pages(course_id)
+        if pages:
+            return educator, course_id, dataset.rng.choice(pages), len(pages)
+
+
+def _move_page(dataset):
+    educator, course_id, page_id, count = _educator_page(dataset)
+    return _request(educator, {'course_id': course_id, 'coursepage_id': page_id},
+                    {'position': dataset.rng.randint(1, count)})
+
+
+def _edit_page(dataset):
+    educator, course_id, page_id, count = _educator_page(dataset)
+    return _request(educator, {'course_id': course_id, 'coursepage_id': page_id})
+
+
+def _educator_course_kwargs(educator_course):
+    educator, course_id = educator_course
+    return educator, {'course_id': course_id}
+
+
+def _course_kwargs(enrollment):
+    learner, course_id = enrollment
+    return learner, {'course_id': course_id}
+
+
+def _search(dataset):
+    return _request(dataset.learner(), data={'q': ' '.join(dataset.rng.sample(WORDS, 2))})
+
+
+def _verify_certificate(dataset):
+    learner, course_id = dataset.enrollment(completed=True)
+    return _request(kwargs={'code': certificates.certificate_code(learner.pk, course_id)})
+
+
+# name -> (url name, method, build(dataset) -> request)
+SCENARIOS = {
+    'index': ('index', 'get', lambda d: _request()),
+    'dashboard': ('dashboard', 'get', lambda d: _request()),
+    'login form': ('login', 'get', lambda d: _request()),
+    'login': ('login', 'post', lambda d: _request(data={
+        'email': d.learner().username, 'password': SEED_PASSWORD, 'user-role': 'learner'
+    })),
+    'logout': ('logout', 'get', lambda d: _request(d.learner())),
+    'register form': ('register', 'get', lambda d: _request()),
+    'coursecreate form': ('coursecreate', 'get', lambda d: _request(d.educator_course()[0])),
+    'coursepage': ('coursepage', 'get', _learner_page),
+    'toggle_like': ('toggle_like', 'post', _learner_page),
+    'add_comment': ('add_comment', 'post', lambda d: _learner_page(d, data={'text': 'Benchmark comment'})),
+    'page_comments': ('page_comments', 'get', _learner_page),
+    'record_share': ('record_share', 'post', lambda d: _learner_page(d, headers={'referer': '/'})),
+    'qrgen': ('qrgen', 'get', lambda d: _request(d.learner())),
+    'mycourse': ('mycourse', 'get', lambda d: _request(d.learner())),
+    'createdcourses': ('createdcourses', 'get', lambda d: _request(d.educator_course()[0])),
+    'addpage': ('addpage', 'get', lambda d: _request(*_educator_course_kwargs(d.educator_course()))),
+    'course_analytics': ('course_analytics', 'get', lambda d: _request(*_educator_course_kwargs(d.educator_course()))),
+    'bulk_enroll': ('bulk_enroll', 'post', lambda d: _request(*_educator_course_kwargs(d.educator_course()), {
+        'learners': ' '.join(d.learner().username for _ in range(20))
+    })),
+    'newpage form': ('newpage', 'get', lambda d: _request(*_educator_course_kwargs(d.educator_course()))),
+    'newpage edit form': ('newpage', 'get', _edit_page),
+    'move_page': ('move_page', 'post', _move_page),
+    'enroll_course': ('enroll_course', 'get', lambda d: _request(d.learner(), {
+        'course_id': d.rng.choice(d.courses)[0]
+    })),
+    'continue_course': ('continue_course', 'get', lambda d: _request(*_course_kwargs(d.enrollment()))),
+    'certificate': ('certificate', 'get', lambda d: _request(*_course_kwargs(d.enrollment(completed=True)))),
+    'verify_certificate': ('verify_certificate', 'get', lambda d: _verify_certificate(d)),
+    'catalog': ('catalog', 'get', lambda d: _request(d.learner(), data={'not_enrolled': '1'})),
+    'catalog_api': ('catalog_api', 'get', lambda d: _request(d.learner(), data={
+        'category': d.rng.choice(Course.CATEGORY_CHOICES)[0]
+    })),
+    'search': ('search', 'get', lambda d: _search(d)),
+    'search_api': ('search_api', 'get', lambda d: _search(d)),
+    'fragment_cache_stats': ('fragment_cache_stats', 'get', lambda d: _request(d.staff)),
+    'prometheus_metrics': ('prometheus_metrics', 'get', lambda d: _request()),
+}
+
+
+def uncovered_patterns():
+    """URL patterns of the app that no scenario requests"""
+    covered = {url_name for url_name, method, build in SCENARIOS.values()}
+    resolver = get_resolver('elevatelearningapp.urls')
+    return sorted({pattern.name for pattern in resolver.url_patterns if pattern.name not in covered})
+
+
+def run_scenario(client, dataset, name, iterations, warmup=2):
+    url_name, method, build = SCENARIOS[name]
+    latencies = []
+    queries = []
+    statuses = Counter()
+    for iteration in range(warmup + iterations):
+        request = build(dataset)
+        # Log in outside the timed part; sessions don't survive logout/login scenarios
+        if request['user'] is None:
+            client.logout()
+        else:
+            client.force_login(request['user'])
+        url = reverse(url_name, kwargs=request['kwargs'])
+        record = RequestRecord()
+        with connection.execute_wrapper(record):
+            start = time.perf_counter()
+            response = getattr(client, method)(url, request['data'], headers=request['headers'])
+            elapsed = time.perf_counter() - start
+        if iteration < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        queries.append(record.queries)
+        statuses[response.status_code] += 1
+
+    return {
+        'name': name,
+        'url_name': url_name,
+        'method': method.upper(),
+        'iterations': iterations,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(statistics.mean(latencies), 3),
+            'max': round(max(latencies), 3),
+        },
+        'queries': {
+            'p50': percentile(queries, 50),
+            'max': max(queries),
+            'mean': round(statistics.mean(queries), 2),
+        },
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+# name -> (build(dataset) -> queryset, index the plan should use; None to only report the plan)
+EXPLAINED_QUERIES = {
+    'course pages': (lambda d: CoursePage.objects.filter(course_id=d.enrollment()[1]).order_by('page_no')
+                     .values_list('coursepage_id', 'page_no', 'page_title'), 'page_course_active_idx'),
+    'page likes': (lambda d: CourseInteraction.objects.filter(course_page_id=d.enrolled_page()[1], liked=True)
+                   .values('course_page_id').annotate(n=Count('*')).order_by(), 'interaction_page_liked_idx'),
+    'page comments': (lambda d: CourseComment.objects.filter(course_page_id=d.enrolled_page()[1])
+                      .order_by('-created_at', '-id')[:21], 'comment_page_recent_idx'),
+    'learner progress': (lambda d: CourseProgress.objects.filter(
+        learner_id=d.enrollment()[0].pk, course_id=d.enrollment()[1]), None),
+    'catalog': (lambda d: Course.objects.order_by('-created_date', '-course_id')[:21], 'course_catalog_idx'),
+}
+
+
+def explain_plans(prefix='bench', random_seed=0, dataset=None):
+    """Query plan of every EXPLAINED_QUERIES entry and whether it uses the expected index"""
+    dataset = dataset or Dataset(prefix=prefix, random_seed=random_seed)
+    plans = []
+    for name, (build, index) in EXPLAINED_QUERIES.items():
+        plan = build(dataset).explain()
+        plans.append({
+            'name': name,
+            'index': index,
+            'uses_index': None if index is None else index in plan,
+            'plan': plan,
+        })
+    return plans
+
+
+def dataset_counts():
+    return {
+        'users': User.objects.count(),
+        'learners': UserDetail.objects.filter(role='learner').count(),
+        'courses': Course.all_objects.count(),
+        'pages': CoursePage.all_objects.count(),
+        'progress': CourseProgress.objects.count(),
+        'completed_pages': CourseProgress.completed_pages.through.objects.count(),
+        'interactions': CourseInteraction.all_objects.count(),
+        'comments': CourseComment.all_objects.count(),
+    }
+
+
+def run(names=None, iterations=50, warmup=2, prefix='bench', random_seed=0, on_result=None, explain=False):
+    """Run the named scenarios (all by default) and return the report as a dict, with query plans if ``explain``"""
+    names = names or list(SCENARIOS)
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}.")
+    started_at = timezone.now()
+    dataset = Dataset(prefix=prefix, random_seed=random_seed)
+    client = Client(raise_request_exception=False)
+    results = []
+    # Queries async views run in worker threads would escape the per-request count
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], ASYNC_CONCURRENT_QUERIES=False):
+        for name in names:
+            result = run_scenario(client, dataset, name, iterations, warmup)
+            results.append(result)
+            if on_result:
+                on_result(result)
+    progress_buffer.flush()
+    plans = explain_plans(dataset=dataset) if explain else None
+    return {
+        'meta': {
+            'started_at': started_at.isoformat(),
+            'django': get_version(),
+            'database': connection.vendor,
+            'iterations': iterations,
+            'prefix': prefix,
+            'dataset': dataset_counts(),
+            'uncovered_urls': uncovered_patterns(),
+            'query_plans': plans,
+        },
+        'results': results,
+    }
+
+
+def compare(previous, current):
+    """Rows of (scenario, p95 before, p95 after, queries before, queries after) for scenarios in both reports"""
+    before = {result['name']: result for result in previous['results']}
+    rows = []
+    for result in current['results']:
+        old = before.get(result['name'])
+        if old:
+            rows.append((result['name'], old['latency_ms']['p95'], result['latency_ms']['p95'],
+                         old['queries']['max'], result['queries']['max']))
+    return rows
+
+
+class QueryLatency:
+    """Sleeps before every query on connections opened while active, like a slower network to the database"""
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        if self.seconds:
+            time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+    def _install(self, sender, connection, **kwargs):
+        connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        # Connections only get the wrapper when they are opened
+        connections.close_all()
+        connection_created.connect(self._install, weak=False)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self._install)
+        self.seconds = 0
+
+
+def _session_cookies(requests):
+    """A session cookie per distinct user, logged in before anything is timed"""
+    cookies = {}
+    for request in requests:
+        user = request['user']
+        if user is not None and user.pk not in cookies:
+            # A fresh client each time; logging in as someone else would flush the previous session
+            client = Client()
+            client.force_login(user)
+            cookies[user.pk] = client.cookies[settings.SESSION_COOKIE_NAME].value
+    return cookies
+
+
+def _throughput(mode, workers, latencies, statuses, elapsed):
+    return {
+        'mode': mode,
+        'concurrency': workers,
+        'requests': len(latencies),
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'max': round(max(latencies), 3),
+        },
+        'statuses': {str(code): count for code, count in sorted(statuses.items())},
+    }
+
+
+def _run_wsgi(requests, cookies, workers):
+    # One request at a time per worker, like gunicorn's sync workers
+    local = threading.local()
+    latencies, statuses = [], Counter()
+
+    def send(request):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = Client(raise_request_exception=False)
+        client.cookies.clear()
+        if request['user'] is not None:
+            client.cookies[settings.SESSION_COOKIE_NAME] = cookies[request['user'].pk]
+        start = time.perf_counter()
+        response = client.get(request['url'], headers=request['headers'])
+        return (time.perf_counter() - start) * 1000, response.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for latency, status in executor.map(send, requests):
+            latencies.append(latency)
+            statuses[status] += 1
+    return latencies, statuses, time.perf_counter() - start
+
+
+async def _asgi_get(application, url, headers):
+    path, _, query = url.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path': path.encode(),
+        'query_string': query.encode(), 'root_path': '',
+        'headers': [(name.lower().encode(), value.encode()) for name, value in headers.items()],
+        'server': ('testserver', 80), 'client': ('127.0.0.1', 0),
+    }
+    body_sent = False
+    status = None
+
+    async def receive():
+        nonlocal body_sent
+        if not body_sent:
+            body_sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Django listens for a disconnect while the view runs and cancels this when it's done
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await application(scope, receive, send)
+    return status
+
+
+def _run_asgi(requests, cookies, concurrency):
+    # Many requests in flight in one process, like uvicorn workers
+    application = get_asgi_application()
+    latencies, statuses = [], Counter()
+
+    async def send(request, slots):
+        headers = {'host': 'testserver', **request['headers']}
+        if request['user'] is not None:
+            headers['cookie'] = f"{settings.SESSION_COOKIE_NAME}={cookies[request['user'].pk]}"
+        async with slots:
+            start = time.perf_counter()
+            status = await _asgi_get(application, request['url'], headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            statuses[status] += 1
+
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+        await asyncio.gather(*(send(request, slots) for request in requests))
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return latencies, statuses, time.perf_counter() - start
+
+
+ASYNC_SCENARIOS = ['coursepage', 'mycourse', 'continue_course', 'qrgen']
+
+
+def run_concurrent(names=None, requests=200, wsgi_workers=3, concurrency=30, query_latency_ms=5.0,
+                   prefix='bench', random_seed=0, on_result=None):
+    """Send the same GET requests through WSGI-style workers and through the ASGI app and report throughput"""
+    names = names or ASYNC_SCENARIOS
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        raise ValueError(f"Unknown scenarios: {', '.join(sorted(unknown))}.")
+    posts = [name for name in names if SCENARIOS[name][1] != 'get']
+    if posts:
+        raise ValueError(f"Only GET scenarios can be run concurrently: {', '.join(posts)}.")
+    dataset = Dataset(prefix=prefix, random_seed=random_seed)
+    batch = []
+    for index in range(requests):
+        url_name, method, build = SCENARIOS[names[index % len(names)]]
+        request = build(dataset)
+        request['url'] = reverse(url_name, kwargs=request['kwargs'])
+        if request['data']:
+            request['url'] += f"?{urlencode(request['data'])}"
+        batch.append(request)
+    cookies = _session_cookies(batch)
+
+    results = []
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+            QueryLatency(query_latency_ms / 1000):
+        # The sync baseline runs each request's queries one after another
+        with override_settings(ASYNC_CONCURRENT_QUERIES=False):
+            results.append(_throughput('wsgi', wsgi_workers, *_run_wsgi(batch, cookies, wsgi_workers)))
+        if on_result:
+            on_result(results[-1])
+        results.append(_throughput('asgi', concurrency, *_run_asgi(batch, cookies, concurrency)))
+        if on_result:
+            on_result(results[-1])
+    connections.close_all()
+    progress_buffer.flush()
+    return {
+        'meta': {
+            'django': get_version(),
+            'database': connection.vendor,
+            'scenarios': names,
+            'query_latency_ms': query_latency_ms,
+            'dataset': dataset_counts(),
+        },
+        'results': results,
+    }
@@ -0,0 +1,243 @@
+"""
+Streaming import/export of course bundles.
+
+A bundle is a Course with its ordered CoursePages. Bundles are exchanged as
+NDJSON, one record per line, each course followed by its pages in page_no
+order::
+
+    {"type": "course", "ref": 12, "title": "...", "description": "...", "category": "design", ...}
+    {"type": "page", "course_ref": 12, "page_no": 1, "page_title": "...", "page_description": "...", ...}
+
+or as a JSON array of ``{"course": {...}, "pages": [...]}`` objects. NDJSON
+is read and written a line at a time, so memory stays bounded by the batch
+size whatever the size of the library; a JSON array is parsed whole.
+
+An import runs in a single transaction, so a bad record anywhere in the
+file raises ``BundleError`` and leaves nothing imported.
+"""
+
+import json
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from . import search
+from .models import Course, CourseManifest, CoursePage, CoursePageStats
+
+COURSE_FIELDS = ('title', 'description', 'category', 'created_date', 'is_archived')
+PAGE_FIELDS = ('page_no', 'page_title', 'page_description', 'created_at', 'is_archived')
+
+
+class BundleError(ValueError):
+    pass
+
+
+def _json_default(value):
+    return value.isoformat()
+
+
+def _course_batches(courses, chunk_size):
+    last_pk = None
+    courses = courses.order_by('pk')
+    while True:
+        batch = courses if last_pk is None else courses.filter(pk__gt=last_pk)
+        batch = list(batch.values('course_id', *COURSE_FIELDS)[:chunk_size])
+        if not batch:
+            return
+        yield batch
+        last_pk = batch[-1]['course_id']
+
+
+def iter_bundle_records(courses, chunk_size=500):
+    """Yield (course, pages iterator) for each course, reading pages through iterator(chunk_size)"""
+    for batch in _course_batches(courses, chunk_size):
+        pages = CoursePage.all_objects.filter(
+            course_id__in=[course['course_id'] for course in batch]
+        ).order_by('course_id', 'page_no').values('course_id', *PAGE_FIELDS).iterator(chunk_size=chunk_size)
+        pending = next(pages, None)
+        for course in batch:
+            def course_pages(course_id=course['course_id']):
+                nonlocal pending
+                while pending is not None and pending['course_id'] == course_id:
+                    yield pending
+                    pending = next(pages, None)
+            course_pages = course_pages()
+            yield course, course_pages
+            # Skip whatever the caller didn't read so the next course starts on its own pages
+            for page in course_pages:
+                pass
+
+
+def export_ndjson(courses, chunk_size=500):
+    """Yield NDJSON lines for the given courses"""
+    for course, pages in iter_bundle_records(courses, chunk_size):
+        record = {'type': 'course', 'ref': course['course_id']}
+        record.update({field: course[field] for field in COURSE_FIELDS})
+        yield json.dumps(record, default=_json_default) + '\n'
+        for page in pages:
+            record = {'type': 'page', 'course_ref': page['course_id']}
+            record.update({field: page[field] for field in PAGE_FIELDS})
+            yield json.dumps(record, default=_json_default) + '\n'
+
+
+def export_json(courses, chunk_size=500):
+    """Yield a JSON array of bundles in pieces, one page at a time"""
+    yield '['
+    for index, (course, pages) in enumerate(iter_bundle_records(courses, chunk_size)):
+        course = {'ref': course['course_id'], **{field: course[field] for field in COURSE_FIELDS}}
+        yield (',' if index else '') + '{"course": ' + json.dumps(course, default=_json_default) + ', "pages": ['
+        for page_index, page in enumerate(pages):
+            page = {field: page[field] for field in PAGE_FIELDS}
+            yield (',' if page_index else '') + json.dumps(page, default=_json_default)
+        yield ']}'
+    yield ']\n'
+
+
+def _records_from_json(data):
+    if isinstance(data, dict):
+        data = [data]
+    for bundle in data:
+        if not isinstance(bundle, dict) or not isinstance(bundle.get('course'), dict):
+            raise BundleError("Each bundle must be an object with a 'course' object.")
+        ref = bundle['course'].get('ref')
+        yield {'type': 'course', **bundle['course'], 'ref': ref}
+        for page in bundle.get('pages', []):
+            yield {'type': 'page', **page, 'course_ref': ref}
+
+
+def parse_lines(lines):
+    """Turn NDJSON lines (str or bytes), or a single JSON document, into flat course/page records"""
+    lines = iter(lines)
+    first = True
+    for line_no, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        if first and line.startswith('['):
+            # A JSON array of bundles; it has to be read in full
+            rest = (l.decode('utf-8') if isinstance(l, bytes) else l for l in lines)
+            try:
+                data = json.loads(line + ''.join(rest))
+            except ValueError as exc:
+                raise BundleError(f"Invalid JSON ({exc}).")
+            yield from _records_from_json(data)
+            return
+        first = False
+        try:
+            record = json.loads(line)
+        except ValueError as exc:
+            raise BundleError(f"Line {line_no}: invalid JSON ({exc}).")
+        if not isinstance(record, dict):
+            raise BundleError(f"Line {line_no}: expected a JSON object.")
+        if 'course' in record and 'type' not in record:
+            yield from _records_from_json(record)
+        else:
+            yield record
+
+
+def sync_course_pages(course_ids):
+    """Bring derived page data up to date after pages were written without signals (bulk_create)"""
+    page_ids = CoursePage.all_objects.filter(course_id__in=course_ids, stats__isnull=True).values_list('pk', flat=True)
+    CoursePageStats.ensure_for_pages(page_ids)
+    for course_id in course_ids:
+        CourseManifest.rebuild(course_id)
+    search.index_new(course_ids)
+
+
+def _parse_datetime(record, field):
+    if not record.get(field):
+        return None
+    try:
+        value = parse_datetime(str(record[field]))
+    except ValueError:
+        value = None
+    if value is None:
+        raise BundleError(f"{field} {record[field]!r} isn't a valid date and time.")
+    return value
+
+
+def _page_no(record, used):
+    """The record's page_no, checked to be a positive whole number its course doesn't have yet"""
+    page_no = record['page_no']
+    if isinstance(page_no, bool) or not isinstance(page_no, int) or page_no < 1:
+        raise BundleError(f"Page '{record.get('page_title')}' has page_no {page_no!r}; "
+                          f"page numbers must be positive whole numbers.")
+    if page_no in used:
+        raise BundleError(f"Page '{record.get('page_title')}' repeats page_no {page_no} of its course.")
+    return page_no
+
+
+def import_bundles(records, creator, batch_size=1000, on_progress=None):
+    """
+    Create courses and pages from parsed records for ``creator``, all in one
+    transaction: on ``BundleError`` nothing is imported.
+
+    Pages are written with bulk_create in batches of ``batch_size``;
+    ``on_progress(courses, pages)`` is called after every batch.
+    Returns (courses created, pages created).
+    """
+    with transaction.atomic():
+        return _import(records, creator, batch_size, on_progress)
+
+
+def _import(records, creator, batch_size, on_progress):
+    course_ids = {}        # bundle ref -> new course_id
+    next_page_no = {}      # new course_id -> page_no for pages without one
+    used_page_nos = {}     # new course_id -> page_nos taken so far
+    pending = []
+    created = {'courses': 0, 'pages': 0}
+
+    def flush():
+        if not pending:
+            return
+        CoursePage.objects.bulk_create(pending, batch_size=batch_size)
+        sync_course_pages({page.course_id for page in pending})
+        created['pages'] += len(pending)
+        pending.clear()
+        if on_progress:
+            on_progress(created['courses'], created['pages'])
+
+    for record in records:
+        kind = record.get('type')
+        if kind == 'course':
+            if not record.get('title'):
+                raise BundleError("Course records need a title.")
+            created_date = _parse_datetime(record, 'created_date')
+            course = Course.objects.create(
+                title=record['title'],
+                description=record.get('description', ''),
+                category=record.get('category') or 'programming',
+                is_archived=bool(record.get('is_archived', False)),
+                creator=creator,
+                **({'created_date': created_date} if created_date else {})
+            )
+            course_ids[record.get('ref')] = course.course_id
+            next_page_no[course.course_id] = 1
+            used_page_nos[course.course_id] = set()
+            created['courses'] += 1
+        elif kind == 'page':
+            course_id = course_ids.get(record.get('course_ref'))
+            if course_id is None:
+                raise BundleError(f"Page '{record.get('page_title')}' refers to a course that hasn't been imported.")
+            if record.get('page_no') is None:
+                page_no = next_page_no[course_id]
+            else:
+                page_no = _page_no(record, used_page_nos[course_id])
+            used_page_nos[course_id].add(page_no)
+            next_page_no[course_id] = max(next_page_no[course_id], page_no + 1)
+            created_at = _parse_datetime(record, 'created_at')
+            pending.append(CoursePage(
+                course_id=course_id,
+                page_no=page_no,
+                page_title=record.get('page_title', ''),
+                page_description=record.get('page_description', ''),
+                is_archived=bool(record.get('is_archived', False)),
+                **({'created_at': created_at} if created_at else {})
+            ))
+            if len(pending) >= batch_size:
+                flush()
+        else:
+            raise BundleError(f"Unknown record type {kind!r}.")
+
+    flush()
+    return created['courses'], created['pages']
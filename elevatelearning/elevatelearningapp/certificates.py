@@ -0,0 +1,187 @@
+"""
+Certificates of completion.
+
+A ``Certificate`` is issued once per learner and course, when their
+progress first reaches completion (``progress_buffer.write_events`` and
+``CourseProgress.update_progress`` call ``issue``). It keeps the learner's
+name and the course title as they were then, and its code is a keyed hash
+of the learner and course, so issuing again for the same pair is a no-op.
+
+The PNG and PDF are rendered with Pillow by the ``render_certificates`` job
+and stored under ``MEDIA_ROOT/certificates/`` with a name derived from a
+hash of what was rendered (as in ``qrcodes.py``). A given name therefore
+always holds the same bytes, so nginx serves ``/media/certificates/`` with
+far-future cache headers. The ``issue_certificates`` command covers
+completions from before certificates existed.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import django
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Trim
+from django.urls import reverse
+from django.utils.crypto import salted_hmac
+from . import jobs
+from .models import Certificate, CourseProgress, Job
+
+CERTIFICATE_DIR = 'certificates'
+FORMATS = ('png', 'pdf')
+SIZE = (1600, 1130)
+
+# Bump whenever the rendering below changes so new artifacts get new names
+RENDER_VERSION = 1
+
+
+# 80 bits, so two pairs sharing a code (which bulk_create would silently skip) is out of
+# reach; certificates issued with the earlier 12 character codes keep them
+CODE_LENGTH = 20
+
+
+def certificate_code(learner_id, course_id):
+    """Code printed on a certificate and used to verify it; the same for a learner and course every time"""
+    return salted_hmac('elevatelearning.certificates', f'{learner_id}:{course_id}').hexdigest()[:CODE_LENGTH].upper()
+
+
+def issue(progress_ids):
+    """Issue certificates for the completed progress records among ``progress_ids`` and queue their rendering"""
+    rows = CourseProgress.objects.filter(pk__in=progress_ids, completed_at__isnull=False).annotate(
+        full_name=Trim(Concat('learner__first_name', Value(' '), 'learner__last_name')),
+    ).values_list('learner_id', 'course_id', 'completed_at', 'full_name', 'learner__username', 'course__title')
+    certificates = [
+        Certificate(code=certificate_code(learner_id, course_id), learner_id=learner_id, course_id=course_id,
+                    learner_name=full_name or username, course_title=title, completed_at=completed_at)
+        for learner_id, course_id, completed_at, full_name, username, title in rows
+    ]
+    if certificates:
+        # Certificates that were already issued are left as they are
+        Certificate.objects.bulk_create(certificates, ignore_conflicts=True)
+        transaction.on_commit(queue_rendering)
+
+
+def queue_rendering():
+    """Queue a render_certificates job unless one is already waiting"""
+    if not Job.objects.filter(kind='render_certificates', status='queued').exists():
+        jobs.enqueue('render_certificates')
+
+
+def _fields(certificate):
+    # Everything printed, worked out here: render runs in pool processes that may not have loaded Django
+    return (certificate.code, certificate.learner_name, certificate.course_title,
+            certificate.completed_at.date().isoformat(), reverse('verify_certificate', args=[certificate.code]))
+
+
+def artifact_digest(fields):
+    return hashlib.sha256(':'.join((str(RENDER_VERSION), *fields)).encode()).hexdigest()[:32]
+
+
+def artifact_name(digest, fmt):
+    """Path of a certificate artifact relative to MEDIA_ROOT"""
+    return f'{CERTIFICATE_DIR}/{digest}.{fmt}'
+
+
+def artifact_url(digest, fmt):
+    return settings.MEDIA_URL + artifact_name(digest, fmt)
+
+
+def _font(size):
+    from PIL import ImageFont
+    return ImageFont.load_default(size=size)
+
+
+def render(fields):
+    """
+    Render a certificate from ``(code, learner name, course title,
+    completion date, verify URL)``; returns a PIL image.
+    """
+    from PIL import Image, ImageDraw
+
+    code, learner_name, course_title, completed_on, verify_url = fields
+    width, height = SIZE
+    image = Image.new('RGB', SIZE, '#f0f9ff')
+    draw = ImageDraw.Draw(image)
+    draw.rectangle((20, 20, width - 21, height - 21), outline='#4F46E5', width=24)
+
+    def centered(y, text, size, fill):
+        draw.text((width / 2, y), text, font=_font(size), fill=fill, anchor='mm')
+
+    centered(210, "Certificate of Completion", 72, '#3730A3')
+    centered(330, "This certificate is proudly presented to", 32, '#4B5563')
+    centered(450, learner_name[:60], 64, '#111827')
+    centered(560, "for successfully completing", 32, '#4B5563')
+    centered(660, course_title[:70], 48, '#4338CA')
+    centered(850, f"Completed {completed_on}", 30, '#111827')
+    centered(910, f"Certificate ID {code}", 30, '#111827')
+    centered(1000, f"Verify at {verify_url}", 24, '#6B7280')
+    return image
+
+
+def _write(fields, media_root):
+    """Render and store a certificate's artifacts unless they exist; returns their digest"""
+    digest = artifact_digest(fields)
+    paths = {fmt: os.path.join(media_root, artifact_name(digest, fmt)) for fmt in FORMATS}
+    if all(os.path.exists(path) for path in paths.values()):
+        return digest
+    image = render(fields)
+    for fmt, path in paths.items():
+        buffer = io.BytesIO()
+        image.save(buffer, fmt.upper(), **({'resolution': 150.0} if fmt == 'pdf' else {}))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file and rename so nginx never serves a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(buffer.getvalue())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    return digest
+
+
+def render_pending(batch_size=200, workers=1, on_progress=None):
+    """
+    Render every certificate that has no artifacts yet, ``batch_size`` at a
+    time, over ``workers`` processes. ``on_progress(done, total)`` is called
+    after each batch. Returns the number rendered.
+    """
+    pending = Certificate.objects.filter(artifact_digest='').order_by('pk')
+    total = pending.count()
+    media_root = str(settings.MEDIA_ROOT)
+    # Children set Django up themselves, since under spawn they import this module afresh
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=django.setup) if workers > 1 else None
+    done = 0
+    last_pk = 0
+    try:
+        while True:
+            batch = list(pending.filter(pk__gt=last_pk).only('code', 'learner_name', 'course_title', 'completed_at')
+                         [:batch_size])
+            if not batch:
+                break
+            fields = [_fields(certificate) for certificate in batch]
+            if pool is None:
+                digests = [_write(item, media_root) for item in fields]
+            else:
+                digests = list(pool.map(_write, fields, [media_root] * len(fields), chunksize=8))
+            for certificate, digest in zip(batch, digests):
+                certificate.artifact_digest = digest
+            Certificate.objects.bulk_update(batch, ['artifact_digest'])
+            last_pk = batch[-1].pk
+            done += len(batch)
+            if on_progress:
+                on_progress(done, total)
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return done
+
+
+@jobs.handler('render_certificates')
+def render_certificates(job):
+    """Render the artifacts of newly issued certificates"""
+    render_pending(on_progress=job.report_progress)
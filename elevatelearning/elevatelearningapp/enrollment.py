@@ -0,0 +1,109 @@
+"""
+Enrolling a cohort of learners in a course at once.
+
+``enroll`` takes learners' usernames (their email addresses) and works
+through them ``batch_size`` at a time. For each batch it resolves the
+usernames to learners in one query, reads which of them are already
+enrolled, and then inserts the ``Course.learners`` rows and the
+``CourseProgress`` rows with ``bulk_create(ignore_conflicts=True)``, so
+every batch takes four statements. The course's first page and page count
+come from its manifest, read once. Learners who were already enrolled are
+left as they are.
+
+``read_usernames`` pulls the usernames out of a CSV file or a pasted list.
+"""
+
+import csv
+import re
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .models import Course, CourseManifest, CourseProgress
+
+BATCH_SIZE = 1000
+
+
+def read_usernames(lines):
+    """
+    Usernames from CSV lines (str or bytes): the ``username`` or ``email``
+    column when the first row is a header naming one, otherwise the first
+    column. Blank rows and repeats are skipped.
+    """
+    rows = csv.reader(line.decode('utf-8-sig') if isinstance(line, bytes) else line for line in lines)
+    column = None
+    for row in rows:
+        cells = [cell.strip() for cell in row]
+        if not any(cells):
+            continue
+        if column is None:
+            header = [cell.lower() for cell in cells]
+            column = next((header.index(name) for name in ('username', 'email') if name in header), None)
+            if column is not None:
+                continue
+            column = 0
+        if column < len(cells) and cells[column]:
+            yield cells[column]
+
+
+def split_usernames(text):
+    """Usernames from a pasted list, separated by commas, semicolons or whitespace"""
+    return [username for username in re.split(r'[\s,;]+', text) if username]
+
+
+def _batches(usernames, batch_size):
+    batch = []
+    seen = set()
+    for username in usernames:
+        if username in seen:
+            continue
+        seen.add(username)
+        batch.append(username)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def enroll(course, usernames, batch_size=BATCH_SIZE):
+    """
+    Enroll the learners named in ``usernames`` (any iterable, read lazily)
+    in ``course``. Returns a dict with the number ``enrolled`` and
+    ``already_enrolled``, and the usernames ``not_found`` and
+    ``not_learners`` (users whose role isn't learner).
+    """
+    manifest = CourseManifest.for_course(course.course_id)
+    Enrollment = Course.learners.through
+    result = {'enrolled': 0, 'already_enrolled': 0, 'not_found': [], 'not_learners': []}
+    for batch in _batches(usernames, batch_size):
+        with transaction.atomic():
+            users = User.objects.filter(username__in=batch).values_list('pk', 'username', 'userdetail__role')
+            learner_ids = []
+            found = set()
+            for user_id, username, role in users:
+                found.add(username)
+                if (role or '').lower() == 'learner':
+                    learner_ids.append(user_id)
+                else:
+                    result['not_learners'].append(username)
+            result['not_found'].extend(username for username in batch if username not in found)
+            if not learner_ids:
+                continue
+
+            enrolled = set(Enrollment.objects.filter(
+                course_id=course.course_id, user_id__in=learner_ids
+            ).values_list('user_id', flat=True))
+            new_ids = [user_id for user_id in learner_ids if user_id not in enrolled]
+            now = timezone.now()
+            Enrollment.objects.bulk_create([
+                Enrollment(course_id=course.course_id, user_id=user_id) for user_id in new_ids
+            ], ignore_conflicts=True)
+            # bulk_create skips CourseProgress.save(), which would count the pages itself
+            CourseProgress.objects.bulk_create([
+                CourseProgress(learner_id=user_id, course_id=course.course_id, current_page_id=manifest.first_page_id,
+                               total_page_count=manifest.page_count, started_at=now)
+                for user_id in new_ids
+            ], ignore_conflicts=True)
+            result['enrolled'] += len(new_ids)
+            result['already_enrolled'] += len(enrolled)
+    return result
@@ -0,0 +1,134 @@
+"""
+Streaming CSV and NDJSON exports of learner data.
+
+``EXPORTS`` names each export: learners' progress through courses (with the
+percentage completed), enrollments (the ``Course.learners`` table, with when
+the learner enrolled) and likes/shares. Exports can be narrowed to some
+courses and to a date range on the export's date column.
+
+Rows are read ``chunk_size`` at a time, keyed on the primary key, and every
+column is computed by the database in the same query, so memory stays
+bounded by one chunk however many rows are exported. ``QuerySet.iterator``
+alone wouldn't do on MySQL, whose driver buffers the whole result.
+"""
+
+import csv
+import json
+from django.db.models import Case, F, FloatField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Least, Round
+from .analytics import day_bounds
+from .models import Course, CourseInteraction, CourseProgress
+
+CHUNK_SIZE = 2000
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def _percent_complete():
+    # From the stored page counters, computed by the database for the whole chunk
+    return Case(
+        When(total_page_count__gt=0, then=Round(
+            Least(F('completed_page_count') * 100.0 / F('total_page_count'), Value(100.0)), 1
+        )),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+
+def _enrollments():
+    enrolled_at = CourseProgress.objects.filter(
+        learner_id=OuterRef('user_id'), course_id=OuterRef('course_id')
+    ).values('started_at')[:1]
+    return Course.learners.through.objects.annotate(enrolled_at=Subquery(enrolled_at))
+
+
+# name -> (rows, [(column, field or lookup)], course lookup, date lookup)
+EXPORTS = {
+    'progress': (
+        lambda: CourseProgress.objects.annotate(percent_complete=_percent_complete()),
+        [('progress_id', 'id'), ('learner_id', 'learner_id'), ('username', 'learner__username'),
+         ('course_id', 'course_id'), ('course_title', 'course__title'), ('current_page_id', 'current_page_id'),
+         ('pages_completed', 'completed_page_count'), ('total_pages', 'total_page_count'),
+         ('percent_complete', 'percent_complete'), ('started_at', 'started_at'), ('completed_at', 'completed_at'),
+         ('last_updated', 'last_updated'), ('is_archived', 'is_archived')],
+        'course_id', 'started_at',
+    ),
+    'enrollments': (
+        _enrollments,
+        [('enrollment_id', 'id'), ('course_id', 'course_id'), ('course_title', 'course__title'),
+         ('learner_id', 'user_id'), ('username', 'user__username'), ('enrolled_at', 'enrolled_at')],
+        'course_id', 'enrolled_at',
+    ),
+    'interactions': (
+        lambda: CourseInteraction.all_objects.all(),
+        [('interaction_id', 'id'), ('learner_id', 'user_id'), ('username', 'user__username'),
+         ('course_id', 'course_page__course_id'), ('course_page_id', 'course_page_id'),
+         ('page_title', 'course_page__page_title'), ('liked', 'liked'), ('shared', 'shared'),
+         ('liked_at', 'liked_at'), ('shared_at', 'shared_at'), ('created_at', 'created_at'),
+         ('is_archived', 'is_archived')],
+        'course_page__course_id', 'created_at',
+    ),
+}
+
+
+def columns(name):
+    return [column for column, lookup in EXPORTS[name][1]]
+
+
+def rows(name, course_ids=None, since=None, until=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield lists of row dicts of an export, ``chunk_size`` rows per query,
+    optionally only for ``course_ids`` and for dates from ``since`` to
+    ``until`` inclusive.
+    """
+    source, fields, course_lookup, date_lookup = EXPORTS[name]
+    queryset = source()
+    if course_ids:
+        queryset = queryset.filter(**{f'{course_lookup}__in': course_ids})
+    if since:
+        queryset = queryset.filter(**{f'{date_lookup}__gte': day_bounds(since)[0]})
+    if until:
+        queryset = queryset.filter(**{f'{date_lookup}__lt': day_bounds(until)[1]})
+    # Columns named like their field are selected as they are; the rest are renamed expressions
+    queryset = queryset.order_by('pk').values(
+        *[lookup for column, lookup in fields if column == lookup],
+        **{column: F(lookup) for column, lookup in fields if column != lookup},
+        export_pk=F('pk'),
+    )
+    last_pk = None
+    while True:
+        batch = list((queryset if last_pk is None else queryset.filter(pk__gt=last_pk))[:chunk_size])
+        if not batch:
+            return
+        last_pk = batch[-1]['export_pk']
+        yield batch
+
+
+class _Echo:
+    # csv.writer target that hands each formatted line back instead of storing it
+    def write(self, value):
+        return value
+
+
+def _csv_value(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else value
+
+
+def _json_default(value):
+    return value.isoformat()
+
+
+def stream(name, fmt='csv', **filters):
+    """Yield an export as CSV (with a header line) or NDJSON text, one chunk of rows per piece"""
+    names = columns(name)
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(names)
+        for batch in rows(name, **filters):
+            yield ''.join(writer.writerow([_csv_value(row[column]) for column in names]) for row in batch)
+    else:
+        for batch in rows(name, **filters):
+            yield ''.join(json.dumps({column: row[column] for column in names}, default=_json_default) + '\n'
+                          for row in batch)
@@ -0,0 +1,116 @@
+"""
+Versioned cache for rendered course page fragments.
+
+Fragments are keyed by page id, the page's ``modified_at`` and a per-page
+version number. Bumping the version (see ``invalidate_page``) orphans every
+fragment of that page; orphans simply expire from the cache.
+
+Hit, miss and invalidation counters live in the same cache, so every worker
+sharing it adds to (and reports) the same totals.
+"""
+
+import time
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+STATS = ('hits', 'misses', 'invalidations')
+
+
+def _cache():
+    return caches[getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'default')]
+
+
+def _stats_key(name):
+    return f'fragments:stats:{name}'
+
+
+def _count(name, amount=1):
+    if not amount:
+        return
+    cache = _cache()
+    key = _stats_key(name)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        # First count since the key was evicted; another worker may add it first
+        if not cache.add(key, amount, timeout=None):
+            cache.incr(key, amount)
+
+
+def _version_key(page_id):
+    return f'fragments:page:{page_id}:version'
+
+
+def _new_version():
+    # Time based rather than starting at 1, so a version key that was evicted
+    # never comes back with a number that old fragments were stored under.
+    return int(time.time() * 1000)
+
+
+def page_version(page_id):
+    cache = _cache()
+    key = _version_key(page_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, _new_version(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_page(page_id):
+    """Drop every cached fragment of a page"""
+    cache = _cache()
+    key = _version_key(page_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), timeout=None)
+    _count('invalidations')
+
+
+def render_page_fragments(page, fragments):
+    """
+    Return rendered HTML for each of a page's fragments, using the cache where possible.
+
+    ``fragments`` maps a fragment name to ``(template_name, get_context)``;
+    ``get_context`` is only called on a miss, so the queries behind a fragment
+    only run when it has to be rendered.
+    """
+    cache = _cache()
+    version = page_version(page.coursepage_id)
+    modified = int(page.modified_at.timestamp() * 1000000)
+    keys = {
+        name: f'fragments:page:{page.coursepage_id}:{name}:{modified}:{version}'
+        for name in fragments
+    }
+    cached = cache.get_many(list(keys.values()))
+
+    rendered = {}
+    to_store = {}
+    for name, key in keys.items():
+        if key in cached:
+            rendered[name] = mark_safe(cached[key])
+            continue
+        template_name, get_context = fragments[name]
+        html = render_to_string(template_name, get_context())
+        rendered[name] = mark_safe(html)
+        to_store[key] = html
+
+    _count('hits', len(keys) - len(to_store))
+    _count('misses', len(to_store))
+    if to_store:
+        cache.set_many(to_store, timeout=getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 86400))
+    return rendered
+
+
+def get_stats():
+    """Hit/miss counters shared by every process using the fragment cache"""
+    cache = _cache()
+    stored = cache.get_many([_stats_key(name) for name in STATS])
+    stats = {name: stored.get(_stats_key(name), 0) for name in STATS}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+    stats['backend'] = _cache().__class__.__name__
+    return stats
@@ -0,0 +1,234 @@
+"""
+Database-backed queue for work too slow for a request.
+
+``enqueue(kind, user, **params)`` stores a ``Job``; the ``run_jobs`` command
+claims queued jobs oldest first and calls the handler registered for their
+kind with the job and its params. Handlers work through their rows in chunks
+of ``JOBS['CHUNK_SIZE']``, each chunk in its own transaction so no lock is
+held for long, and call ``job.report_progress`` as they go; the admin shows
+the progress.
+
+A running job whose worker stopped (no progress for ``STALE_AFTER``
+seconds) is queued again, up to ``MAX_ATTEMPTS`` runs, so handlers must be
+safe to re-run: each chunk picks up whatever rows are left.
+"""
+
+import logging
+import traceback
+from datetime import timedelta
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from .archiving import set_archived
+from .models import (Certificate, Course, CourseComment, CourseDailyStats, CourseInteraction, CoursePage,
+                     CoursePageStats, CourseProgress, Job, PageDailyStats, SearchPosting)
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'CHUNK_SIZE': 1000,
+    'POLL_INTERVAL': 2.0,
+    'STALE_AFTER': 600,
+    'MAX_ATTEMPTS': 3,
+}
+
+HANDLERS = {}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'JOBS', {})}
+
+
+def handler(kind):
+    """Register the decorated function as the handler for jobs of ``kind``"""
+    def register(func):
+        HANDLERS[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, user=None, **params):
+    """Queue a job; ``params`` must be JSON serializable. Returns the Job"""
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'.")
+    created_by = user if user is not None and user.is_authenticated else None
+    return Job.objects.create(kind=kind, params=params, created_by=created_by)
+
+
+def claim():
+    """Mark the oldest queued job as running and return it; None when the queue is empty"""
+    while True:
+        with transaction.atomic():
+            queued = Job.objects.filter(status='queued').order_by('created_at', 'pk')
+            if connection.features.has_select_for_update_skip_locked:
+                queued = queued.select_for_update(skip_locked=True)
+            job_id = queued.values_list('pk', flat=True).first()
+            if job_id is None:
+                return None
+            now = timezone.now()
+            # Without SKIP LOCKED two workers can pick the same row; only one update wins
+            claimed = Job.objects.filter(pk=job_id, status='queued').update(
+                status='running', started_at=now, heartbeat_at=now, attempts=F('attempts') + 1
+            )
+        if claimed:
+            return Job.objects.get(pk=job_id)
+
+
+def requeue_stale():
+    """Queue running jobs whose worker went quiet again, or fail them after MAX_ATTEMPTS; returns how many"""
+    config = get_config()
+    stale = Job.objects.filter(
+        status='running', heartbeat_at__lt=timezone.now() - timedelta(seconds=config['STALE_AFTER'])
+    )
+    failed = stale.filter(attempts__gte=config['MAX_ATTEMPTS']).update(
+        status='failed', error="The worker running this job stopped.", finished_at=timezone.now()
+    )
+    return failed + stale.update(status='queued')
+
+
+def run(job):
+    """Run a claimed job to completion; returns True if it succeeded"""
+    try:
+        HANDLERS[job.kind](job, **job.params)
+    except Exception:
+        logger.exception("Job %s failed", job)
+        Job.objects.filter(pk=job.pk).update(
+            status='failed', error=traceback.format_exc(), finished_at=timezone.now()
+        )
+        return False
+    Job.objects.filter(pk=job.pk).update(status='done', error='', finished_at=timezone.now())
+    return True
+
+
+def run_pending(limit=None):
+    """Run queued jobs until the queue is empty (or ``limit`` jobs ran); returns how many ran"""
+    ran = 0
+    while limit is None or ran < limit:
+        job = claim()
+        if job is None:
+            break
+        run(job)
+        ran += 1
+    return ran
+
+
+def _chunks(ids, chunk_size):
+    ids = list(ids)
+    for start in range(0, len(ids), chunk_size):
+        yield ids[start:start + chunk_size]
+
+
+def _delete_remaining(queryset, chunk_size, raw):
+    """Delete ``queryset`` a chunk at a time, yielding the number deleted after each chunk"""
+    model = queryset.model
+    while True:
+        ids = list(queryset.order_by().values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        with transaction.atomic():
+            chunk = model._base_manager.filter(pk__in=ids)
+            if raw:
+                # Skips loading the rows and their per-row delete signals
+                chunk._raw_delete(chunk.db)
+            else:
+                chunk.delete()
+        yield len(ids)
+
+
+def _course_rows(course_ids):
+    # Children before parents, so each chunk only deletes rows nothing else points to.
+    # Per-row signals keep page stats, search postings and fragments of surviving
+    # pages up to date; every page here is going, so interactions, comments and
+    # pages are deleted without them.
+    return [
+        (CourseProgress.completed_pages.through.objects.filter(courseprogress__course_id__in=course_ids), False),
+        (CourseInteraction.all_objects.filter(course_page__course_id__in=course_ids), True),
+        (CourseComment.all_objects.filter(course_page__course_id__in=course_ids), True),
+        (SearchPosting.objects.filter(course_id__in=course_ids), False),
+        (CoursePageStats.objects.filter(course_page__course_id__in=course_ids), False),
+        (PageDailyStats.objects.filter(course_id__in=course_ids), False),
+        (CourseDailyStats.objects.filter(course_id__in=course_ids), False),
+        (Certificate.objects.filter(course_id__in=course_ids), False),
+        (CourseProgress.objects.filter(course_id__in=course_ids), False),
+        (Course.learners.through.objects.filter(course_id__in=course_ids), False),
+        (CoursePage.all_objects.filter(course_id__in=course_ids), True),
+    ]
+
+
+@handler('delete_courses')
+def delete_courses(job, course_ids):
+    """Delete courses and everything under them"""
+    chunk_size = get_config()['CHUNK_SIZE']
+    steps = _course_rows(course_ids)
+    total = sum(queryset.count() for queryset, raw in steps) + len(course_ids)
+    done = 0
+    job.report_progress(done, total)
+    for queryset, raw in steps:
+        for deleted in _delete_remaining(queryset, chunk_size, raw):
+            done += deleted
+            job.report_progress(done)
+    with transaction.atomic():
+        # Every many-row child is gone; the cascade only reaches each course's QR code and manifest
+        Course.all_objects.filter(pk__in=course_ids).delete()
+    job.report_progress(total)
+
+
+@handler('delete_rows')
+def delete_rows(job, model, ids):
+    """Delete rows of ``model`` (an app_label.model_name label) a chunk at a time, with their signals"""
+    model = apps.get_model(model)
+    if model is Course:
+        return delete_courses(job, ids)
+    chunk_size = get_config()['CHUNK_SIZE']
+    job.report_progress(0, len(ids))
+    for done, chunk in enumerate(_chunks(ids, chunk_size)):
+        with transaction.atomic():
+            model._base_manager.filter(pk__in=chunk).delete()
+        job.report_progress(min((done + 1) * chunk_size, len(ids)))
+
+
+@handler('set_archived')
+def archive_rows(job, model, ids, archived):
+    """Archive or restore rows of ``model`` a chunk at a time (see archiving.set_archived)"""
+    model = apps.get_model(model)
+    chunk_size = get_config()['CHUNK_SIZE']
+    job.report_progress(0, len(ids))
+    for done, chunk in enumerate(_chunks(ids, chunk_size)):
+        set_archived(model._base_manager.filter(pk__in=chunk), archived)
+        job.report_progress(min((done + 1) * chunk_size, len(ids)))
+
+
+@handler('refresh_counters')
+def refresh_counters(job, course_ids=None):
+    """Recount progress counters and page stats, for some courses or all of them"""
+    chunk_size = get_config()['CHUNK_SIZE']
+    progress = CourseProgress.objects.all()
+    pages = CoursePage.all_objects.all()
+    if course_ids:
+        progress = progress.filter(course_id__in=course_ids)
+        pages = pages.filter(course_id__in=course_ids)
+    total = progress.count() + pages.count()
+    done = 0
+    job.report_progress(done, total)
+    for queryset, refresh in ((progress, lambda ids: CourseProgress.objects.filter(pk__in=ids).refresh_counters()),
+                              (pages, CoursePageStats.ensure_for_pages)):
+        last_pk = 0
+        while True:
+            ids = list(queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                refresh(ids)
+            last_pk = ids[-1]
+            done += len(ids)
+            job.report_progress(done)
+
+
+def delete_courses_later(queryset, user=None):
+    """Hide the courses now (by archiving them) and queue their deletion; returns the Job"""
+    with transaction.atomic():
+        course_ids = list(queryset.values_list('pk', flat=True))
+        set_archived(Course.all_objects.filter(pk__in=course_ids), True)
+        return enqueue('delete_courses', user, course_ids=course_ids)
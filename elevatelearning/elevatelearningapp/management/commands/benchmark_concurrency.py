@@ -0,0 +1,53 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from elevatelearningapp import benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Send the same requests through WSGI-style sync workers and through the ASGI app, with a "
+            "delay added to every query, and compare throughput and latency")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help=f"GET scenario to request (repeatable); default: "
+                                 f"{', '.join(benchmarks.ASYNC_SCENARIOS)}")
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--wsgi-workers', type=int, default=3,
+                            help="Requests handled at once by the WSGI baseline (gunicorn --workers)")
+        parser.add_argument('--concurrency', type=int, default=30, help="Requests in flight through ASGI")
+        parser.add_argument('--query-latency-ms', type=float, default=5.0,
+                            help="Delay added to every query; 0 for none")
+        parser.add_argument('--prefix', default='bench', help="Prefix the dataset was seeded with")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed")
+        parser.add_argument('--output', '-o', help="Save the report as JSON to this file")
+
+    def handle(self, *args, **options):
+        def on_result(result):
+            latency = result['latency_ms']
+            self.stdout.write(
+                f"{result['mode']:5} x{result['concurrency']:<4} {result['requests_per_second']:9.2f} req/s  "
+                f"p50 {latency['p50']:9.2f}ms  p95 {latency['p95']:9.2f}ms  "
+                f"{' '.join(f'{code}x{count}' for code, count in result['statuses'].items())}"
+            )
+
+        try:
+            report = benchmarks.run_concurrent(
+                names=options['scenarios'],
+                requests=options['requests'],
+                wsgi_workers=options['wsgi_workers'],
+                concurrency=options['concurrency'],
+                query_latency_ms=options['query_latency_ms'],
+                prefix=options['prefix'],
+                random_seed=options['seed'],
+                on_result=on_result,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        wsgi, asgi = report['results']
+        if wsgi['requests_per_second']:
+            self.stdout.write(f"ASGI throughput: {asgi['requests_per_second'] / wsgi['requests_per_second']:.2f}x")
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved the report to {options['output']}."))
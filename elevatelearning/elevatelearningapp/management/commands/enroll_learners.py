@@ -0,0 +1,44 @@
+import sys
+from itertools import chain
+from django.core.management.base import BaseCommand, CommandError
+from elevatelearningapp import enrollment
+from elevatelearningapp.models import Course
+
+
+class Command(BaseCommand):
+    help = ("Enroll learners in a course in bulk, from usernames on the command line or a CSV file "
+            "(the 'username' or 'email' column, or the first one)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('course_id', type=int)
+        parser.add_argument('usernames', nargs='*')
+        parser.add_argument('--file', '-f', help="CSV file of learners ('-' reads stdin)")
+        parser.add_argument('--batch-size', type=int, default=enrollment.BATCH_SIZE,
+                            help="Learners enrolled per transaction")
+
+    def handle(self, *args, **options):
+        course = Course.objects.filter(pk=options['course_id']).first()
+        if course is None:
+            raise CommandError(f"No course with id {options['course_id']}.")
+        if not options['usernames'] and not options['file']:
+            raise CommandError("Give usernames or --file.")
+
+        if options['file'] == '-':
+            source = sys.stdin
+        elif options['file']:
+            source = open(options['file'], encoding='utf-8-sig', newline='')
+        try:
+            usernames = options['usernames']
+            if options['file']:
+                usernames = chain(usernames, enrollment.read_usernames(source))
+            result = enrollment.enroll(course, usernames, batch_size=options['batch_size'])
+        finally:
+            if options['file'] and source is not sys.stdin:
+                source.close()
+
+        for key in ('not_found', 'not_learners'):
+            if result[key]:
+                self.stderr.write(f"{key.replace('_', ' ').capitalize()}: {', '.join(result[key])}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Enrolled {result['enrolled']} learners in '{course.title}'; {result['already_enrolled']} already were."
+        ))
@@ -0,0 +1,33 @@
+import sys
+from django.core.management.base import BaseCommand
+from elevatelearningapp.bundles import export_json, export_ndjson
+from elevatelearningapp.models import Course
+
+
+class Command(BaseCommand):
+    help = "Stream courses and their pages out as NDJSON (default) or JSON bundles"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help="Only export this course id (repeatable)")
+        parser.add_argument('--creator', help="Only export courses created by this username")
+        parser.add_argument('--format', choices=('ndjson', 'json'), default='ndjson')
+        parser.add_argument('--output', '-o', default='-', help="File to write to (default: stdout)")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Rows fetched per database round trip")
+
+    def handle(self, *args, **options):
+        courses = Course.all_objects.all()
+        if options['courses']:
+            courses = courses.filter(course_id__in=options['courses'])
+        if options['creator']:
+            courses = courses.filter(creator__username=options['creator'])
+
+        export = export_json if options['format'] == 'json' else export_ndjson
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8')
+        try:
+            for chunk in export(courses, chunk_size=options['chunk_size']):
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,40 @@
+import sys
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from elevatelearningapp import exports
+
+
+def _date(value):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f"'{value}' is not a date (YYYY-MM-DD).")
+
+
+class Command(BaseCommand):
+    help = "Stream learner progress, enrollments or interactions out as CSV (default) or NDJSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('export', choices=list(exports.EXPORTS))
+        parser.add_argument('--format', choices=list(exports.FORMATS), default='csv')
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help="Only export rows of this course id (repeatable)")
+        parser.add_argument('--since', metavar='YYYY-MM-DD', help="Only rows dated on or after this day")
+        parser.add_argument('--until', metavar='YYYY-MM-DD', help="Only rows dated on or before this day")
+        parser.add_argument('--output', '-o', default='-', help="File to write to (default: stdout)")
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE,
+                            help="Rows fetched per database round trip")
+
+    def handle(self, *args, **options):
+        chunks = exports.stream(
+            options['export'], options['format'], course_ids=options['courses'],
+            since=options['since'] and _date(options['since']), until=options['until'] and _date(options['until']),
+            chunk_size=options['chunk_size'],
+        )
+        output = sys.stdout if options['output'] == '-' else open(options['output'], 'w', encoding='utf-8', newline='')
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
@@ -0,0 +1,37 @@
+import sys
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from elevatelearningapp.bundles import BundleError, import_bundles, parse_lines
+
+
+class Command(BaseCommand):
+    help = "Import NDJSON or JSON course bundles, writing pages in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Bundle file to read ('-' for stdin)")
+        parser.add_argument('--creator', required=True, help="Username of the educator who will own the courses")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Pages inserted per bulk_create batch")
+
+    def handle(self, *args, **options):
+        try:
+            creator = User.objects.get(username=options['creator'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named '{options['creator']}'.")
+
+        def report(courses, pages):
+            # Nothing is committed until the whole file has been read
+            self.stdout.write(f"  {courses} courses, {pages} pages written...")
+
+        source = sys.stdin if options['path'] == '-' else open(options['path'], encoding='utf-8')
+        try:
+            courses, pages = import_bundles(
+                parse_lines(source), creator, batch_size=options['batch_size'], on_progress=report
+            )
+        except BundleError as exc:
+            raise CommandError(f"{exc} Nothing was imported.")
+        finally:
+            if source is not sys.stdin:
+                source.close()
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {courses} courses with {pages} pages."))
@@ -0,0 +1,46 @@
+import os
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from elevatelearningapp import certificates
+from elevatelearningapp.models import Certificate, CourseProgress
+
+
+class Command(BaseCommand):
+    help = ("Issue certificates for completed courses that don't have one yet (e.g. completions from before "
+            "certificates existed) and render every certificate missing its PNG and PDF")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Progress records issued, and certificates rendered, per batch")
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Number of render processes (defaults to the CPU count)")
+        parser.add_argument('--no-render', action='store_true',
+                            help="Only issue; leave rendering to the render_certificates job")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        issued = Certificate.objects.filter(learner_id=OuterRef('learner_id'), course_id=OuterRef('course_id'))
+        completed = CourseProgress.objects.filter(completed_at__isnull=False).exclude(Exists(issued)).order_by('pk')
+
+        before = Certificate.objects.count()
+        last_pk = 0
+        while True:
+            ids = list(completed.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                certificates.issue(ids)
+            last_pk = ids[-1]
+        self.stdout.write(f"Issued {Certificate.objects.count() - before} certificates.")
+
+        if options['no_render']:
+            return
+
+        def on_progress(done, total):
+            self.stdout.write(f"Rendered {done}/{total}")
+
+        rendered = certificates.render_pending(
+            batch_size=batch_size, workers=options['workers'] or os.cpu_count() or 1, on_progress=on_progress
+        )
+        self.stdout.write(self.style.SUCCESS(f"Rendered {rendered} certificates."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from elevatelearningapp import search
+
+
+class Command(BaseCommand):
+    help = "Re-index every course, page and comment for search, tokenizing batches in parallel processes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Number of tokenizer processes (defaults to the CPU count; 1 for none)")
+        parser.add_argument('--batch-size', type=int, default=500, help="Documents read per batch")
+
+    def handle(self, *args, **options):
+        def on_progress(kind, documents, postings):
+            self.stdout.write(f"  {kind}s: {documents} indexed, {postings} postings so far")
+
+        written = search.rebuild(batch_size=options['batch_size'], workers=options['workers'],
+                                 on_progress=on_progress)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} search postings."))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from elevatelearningapp.models import CoursePage, CoursePageStats
+
+
+class Command(BaseCommand):
+    help = "Recompute the like/share/comment counters on CoursePageStats from the source tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help="Only reconcile pages of this course id (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of pages reconciled per transaction")
+
+    def handle(self, *args, **options):
+        pages = CoursePage.all_objects.order_by('pk')
+        if options['courses']:
+            pages = pages.filter(course_id__in=options['courses'])
+
+        batch_size = options['batch_size']
+        reconciled = 0
+        last_pk = 0
+        while True:
+            ids = list(pages.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                CoursePageStats.ensure_for_pages(ids)
+            reconciled += len(ids)
+            last_pk = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Reconciled engagement counters for {reconciled} pages."))
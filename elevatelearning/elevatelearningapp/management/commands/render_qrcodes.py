@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from elevatelearningapp import qrcodes
+from elevatelearningapp.models import QRcode
+
+
+class Command(BaseCommand):
+    help = "Render the PNG and SVG images of every QR code that doesn't have them on disk yet"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None,
+                            help="Number of render processes (defaults to QR_RENDER_WORKERS)")
+
+    def handle(self, *args, **options):
+        urls = QRcode.objects.values_list('qrcode_url', flat=True).iterator(chunk_size=2000)
+        written = qrcodes.ensure_images(urls, workers=options['workers'] or settings.QR_RENDER_WORKERS)
+        self.stdout.write(self.style.SUCCESS(f"Rendered {written} QR code images."))
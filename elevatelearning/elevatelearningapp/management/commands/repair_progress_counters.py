@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from elevatelearningapp.models import CourseProgress
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored completed/total page counters on CourseProgress records"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--course', type=int, action='append', dest='courses',
+                            help="Only repair progress for this course id (repeatable)")
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help="Number of progress records updated per transaction")
+
+    def handle(self, *args, **options):
+        progress = CourseProgress.objects.order_by('pk')
+        if options['courses']:
+            progress = progress.filter(course_id__in=options['courses'])
+
+        batch_size = options['batch_size']
+        repaired = 0
+        last_pk = 0
+        while True:
+            ids = list(progress.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not ids:
+                break
+            with transaction.atomic():
+                repaired += CourseProgress.objects.filter(pk__in=ids).refresh_counters()
+            last_pk = ids[-1]
+
+        self.stdout.write(self.style.SUCCESS(f"Repaired counters on {repaired} progress records."))
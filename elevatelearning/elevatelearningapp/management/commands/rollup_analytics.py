@@ -0,0 +1,37 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from elevatelearningapp import analytics
+
+
+class Command(BaseCommand):
+    help = ("Aggregate the daily course and page analytics rollups, from where the last run stopped "
+            "(run it every few minutes, e.g. from cron)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', metavar='YYYY-MM-DD',
+                            help="Re-aggregate every day from this date instead of from the last run")
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Re-aggregate every day since the first recorded event")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['rebuild']:
+            since = analytics.first_event()
+            if since is None:
+                self.stdout.write("Nothing to aggregate.")
+                return
+        elif options['since']:
+            try:
+                day = date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError("--since must be a date (YYYY-MM-DD).")
+            since = analytics.day_bounds(day)[0]
+
+        def on_progress(day, done, total):
+            self.stdout.write(f"Aggregated {day} ({done}/{total})")
+
+        days = analytics.aggregate(since=since, on_progress=on_progress if options['verbosity'] > 1 else None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Aggregated {days} day{'' if days == 1 else 's'}; rollups are complete up to {timezone.localtime(analytics.watermark())}."
+        ))
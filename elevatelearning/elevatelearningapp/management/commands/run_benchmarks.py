@@ -0,0 +1,72 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from elevatelearningapp import benchmarks
+
+
+class Command(BaseCommand):
+    help = ("Request every URL of the app against a seeded dataset (see seed_data) and report "
+            "p50/p95/p99 latency and query counts")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help="Only run this scenario (repeatable); see --list")
+        parser.add_argument('--list', action='store_true', help="List the scenarios and exit")
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--prefix', default='bench', help="Prefix the dataset was seeded with")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed")
+        parser.add_argument('--output', '-o', help="Save the report as JSON to this file")
+        parser.add_argument('--explain', action='store_true',
+                            help="Also report the query plans of the hot lookups and check they use their indexes")
+        parser.add_argument('--compare', help="Print p95 and query changes against an earlier JSON report")
+
+    def handle(self, *args, **options):
+        if options['list']:
+            for name, (url_name, method, build) in benchmarks.SCENARIOS.items():
+                self.stdout.write(f"{name:24} {method.upper():5} {url_name}")
+            return
+
+        def on_result(result):
+            latency, queries = result['latency_ms'], result['queries']
+            self.stdout.write(
+                f"{result['name']:24} p50 {latency['p50']:9.2f}ms  p95 {latency['p95']:9.2f}ms  "
+                f"p99 {latency['p99']:9.2f}ms  queries {queries['p50']:g}/{queries['max']}  "
+                f"{' '.join(f'{code}x{count}' for code, count in result['statuses'].items())}"
+            )
+
+        try:
+            report = benchmarks.run(
+                names=options['scenarios'],
+                iterations=options['iterations'],
+                warmup=options['warmup'],
+                prefix=options['prefix'],
+                random_seed=options['seed'],
+                on_result=on_result,
+                explain=options['explain'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        if report['meta']['uncovered_urls']:
+            self.stdout.write(self.style.WARNING(
+                f"No scenario for: {', '.join(report['meta']['uncovered_urls'])}"
+            ))
+        for plan in report['meta']['query_plans'] or ():
+            if plan['uses_index'] is False:
+                self.stdout.write(self.style.WARNING(f"{plan['name']}: plan doesn't use {plan['index']}"))
+            else:
+                self.stdout.write(f"{plan['name']}: {'uses ' + plan['index'] if plan['index'] else 'plan below'}")
+            self.stdout.write(plan['plan'])
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Saved the report to {options['output']}."))
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as previous:
+                rows = benchmarks.compare(json.load(previous), report)
+            for name, p95_before, p95_after, queries_before, queries_after in rows:
+                change = (p95_after - p95_before) / p95_before * 100 if p95_before else 0
+                self.stdout.write(
+                    f"{name:24} p95 {p95_before:9.2f} -> {p95_after:9.2f}ms ({change:+.1f}%)  "
+                    f"queries {queries_before} -> {queries_after}"
+                )
@@ -0,0 +1,34 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from elevatelearningapp import jobs
+
+
+class Command(BaseCommand):
+    help = "Run queued background jobs (course deletes, bulk archiving, recounts), polling for new ones"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Run what is queued now and exit")
+        parser.add_argument('--max-jobs', type=int, help="Exit after running this many jobs")
+
+    def handle(self, *args, **options):
+        config = jobs.get_config()
+        ran = 0
+        while options['max_jobs'] is None or ran < options['max_jobs']:
+            close_old_connections()
+            requeued = jobs.requeue_stale()
+            if requeued:
+                self.stdout.write(self.style.WARNING(f"Requeued {requeued} stale jobs."))
+            job = jobs.claim()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(config['POLL_INTERVAL'])
+                continue
+            self.stdout.write(f"Running {job} ...")
+            if jobs.run(job):
+                self.stdout.write(self.style.SUCCESS(f"Finished {job.kind} #{job.pk}."))
+            else:
+                self.stdout.write(self.style.ERROR(f"{job.kind} #{job.pk} failed; see the job in the admin."))
+            ran += 1
+        self.stdout.write(f"Ran {ran} jobs.")
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from elevatelearningapp import seeding
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic dataset of educators, courses, pages, learners and their progress for benchmarking"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--courses', type=int, default=100)
+        parser.add_argument('--pages-per-course', type=int, default=10)
+        parser.add_argument('--learners', type=int, default=1000)
+        parser.add_argument('--educators', type=int, default=None,
+                            help="Defaults to one educator per ten courses")
+        parser.add_argument('--enrollments-per-learner', type=int, default=5)
+        parser.add_argument('--completion', type=float, default=0.5,
+                            help="Mean fraction of an enrolled course's pages a learner has completed")
+        parser.add_argument('--interaction-rate', type=float, default=0.2,
+                            help="Chance that a completed page was liked")
+        parser.add_argument('--comment-rate', type=float, default=0.05,
+                            help="Chance that a completed page was commented on")
+        parser.add_argument('--words-per-page', type=int, default=200)
+        parser.add_argument('--prefix', default='bench',
+                            help="Prefix of the seeded usernames; benchmarks look data up by it")
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=0, help="Random seed")
+
+    def handle(self, *args, **options):
+        def on_progress(stage, done, total):
+            if options['verbosity'] >= 1:
+                self.stdout.write(f"  {stage}: {done}/{total}")
+
+        try:
+            counts = seeding.seed(
+                courses=options['courses'],
+                pages_per_course=options['pages_per_course'],
+                learners=options['learners'],
+                educators=options['educators'],
+                enrollments_per_learner=options['enrollments_per_learner'],
+                completion=options['completion'],
+                interaction_rate=options['interaction_rate'],
+                comment_rate=options['comment_rate'],
+                words_per_page=options['words_per_page'],
+                prefix=options['prefix'],
+                batch_size=options['batch_size'],
+                random_seed=options['seed'],
+                on_progress=on_progress,
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        summary = ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f"Seeded {summary}."))
@@ -0,0 +1,439 @@
+"""
+Per-view request metrics in Prometheus text format.
+
+``MetricsMiddleware`` records, per URL name, a request latency histogram for
+every request and, for a sampled fraction of requests, the SQL query count,
+SQL time and template render time. A sampled request that runs the same SQL
+shape (the statement with literals and IN lists collapsed) more than
+``N_PLUS_ONE_THRESHOLD`` times is counted and logged as a likely N+1.
+
+Each process keeps its own totals. With ``DIR`` set, processes also write
+snapshots there (at most every ``FLUSH_INTERVAL`` seconds) and the endpoint
+sums all of them, so a scrape of any gunicorn worker sees the whole pod. A
+process removes its snapshot when it exits, and snapshots of processes that
+are gone are skipped and removed, so recycled workers don't linger. From a
+snapshot not rewritten for ``STALE_FLUSHES`` intervals (an idle worker) only
+the counters are summed: its gauges may no longer hold.
+
+Template time is only measured with ``TimedDjangoTemplates`` as the template
+backend.
+
+Only scrapers may read the endpoint (``scrape_allowed``): with ``TOKEN`` set
+they must send it as a bearer token, otherwise they must connect from an
+address in ``ALLOWED_IPS`` (loopback and private networks by default, where
+Prometheus scrapes the pod port). nginx refuses the path from outside, since
+proxied requests arrive from its private address.
+"""
+
+import atexit
+import contextvars
+import ipaddress
+import json
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from collections import Counter
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends.django import DjangoTemplates, Template as DjangoTemplate
+from django.utils.crypto import constant_time_compare
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'SAMPLE_RATE': 0.1,
+    'N_PLUS_ONE_THRESHOLD': 10,
+    'DIR': '',
+    'FLUSH_INTERVAL': 10.0,
+    'TOKEN': '',
+    'ALLOWED_IPS': ('127.0.0.0/8', '::1/128', '10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16', 'fc00::/7'),
+}
+
+STALE_FLUSHES = 3
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_current = contextvars.ContextVar('metrics_request', default=None)
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+_SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b")
+_SQL_PLACEHOLDER_LISTS = re.compile(r"\?(?:\s*,\s*\?)+")
+_SQL_VALUE_ROWS = re.compile(r"\(\?\.\.\.\)(?:\s*,\s*\(\?\.\.\.\))+")
+
+
+def sql_shape(sql):
+    """The statement with literals, placeholders and IN/VALUES lists collapsed"""
+    shape = _SQL_LITERALS.sub('?', sql.replace('%s', '?'))
+    shape = _SQL_PLACEHOLDER_LISTS.sub('?...', shape)
+    shape = shape.replace('(?)', '(?...)')
+    return _SQL_VALUE_ROWS.sub('(?...)...', shape)
+
+
+class RequestRecord:
+    """What one sampled request did"""
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.shapes = Counter()
+        # Async views run independent queries in several threads at once
+        self._lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        # Usable with connection.execute_wrapper()
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.sql_time += elapsed
+                self.queries += 1
+                self.shapes[sql_shape(sql)] += 1
+
+
+def _record_sql(execute, sql, params, many, context):
+    # Installed on every connection. The record travels in a context variable,
+    # which asgiref copies into the threads that run async views' queries.
+    record = _current.get()
+    if record is None:
+        return execute(sql, params, many, context)
+    return record(execute, sql, params, many, context)
+
+
+@receiver(connection_created)
+def _install_sql_recorder(sender, connection, **kwargs):
+    if _record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_sql)
+
+
+def _empty_view_stats():
+    return {
+        'latency_buckets': [0] * len(LATENCY_BUCKETS),
+        'latency_sum': 0.0,
+        'requests': 0,
+        'sampled': 0,
+        'queries': 0,
+        'query_buckets': [0] * len(QUERY_BUCKETS),
+        'sql_seconds': 0.0,
+        'template_seconds': 0.0,
+        'n_plus_one': 0,
+    }
+
+
+def _observe(buckets, bounds, value):
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            buckets[index] += 1
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._last_write = time.monotonic()
+
+    def record(self, view, duration, record=None, n_plus_one=0):
+        with self._lock:
+            stats = self._views.get(view)
+            if stats is None:
+                stats = self._views[view] = _empty_view_stats()
+            stats['requests'] += 1
+            stats['latency_sum'] += duration
+            _observe(stats['latency_buckets'], LATENCY_BUCKETS, duration)
+            if record is not None:
+                stats['sampled'] += 1
+                stats['queries'] += record.queries
+                _observe(stats['query_buckets'], QUERY_BUCKETS, record.queries)
+                stats['sql_seconds'] += record.sql_time
+                stats['template_seconds'] += record.template_time
+                stats['n_plus_one'] += n_plus_one
+
+    def snapshot(self):
+        with self._lock:
+            views = {view: {key: list(value) if isinstance(value, list) else value
+                            for key, value in stats.items()}
+                     for view, stats in self._views.items()}
+        samples = {}
+        for collect in _collectors:
+            for name, labels, value in collect():
+                key = json.dumps([name, sorted(labels.items())])
+                samples[key] = samples.get(key, 0) + value
+        return {'views': views, 'samples': samples}
+
+    def _snapshot_path(self, directory):
+        return os.path.join(directory, f'{os.getpid()}.json')
+
+    def write_snapshot(self, force=False):
+        """Write this process's totals to the shared directory, if one is configured"""
+        config = get_config()
+        directory = config['DIR']
+        if not directory:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._last_write < config['FLUSH_INTERVAL']:
+                return
+            self._last_write = now
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as tmp:
+            json.dump({**self.snapshot(), 'written_at': time.time()}, tmp)
+        os.replace(tmp_path, self._snapshot_path(directory))
+
+    def remove_snapshot(self):
+        """Remove this process's snapshot, at exit, so its totals stop counting towards the pod's"""
+        directory = get_config()['DIR']
+        if directory:
+            try:
+                os.remove(self._snapshot_path(directory))
+            except FileNotFoundError:
+                pass
+
+    def _other_snapshots(self, directory, stale_after):
+        own = os.path.basename(self._snapshot_path(directory))
+        for name in os.listdir(directory):
+            stem, ext = os.path.splitext(name)
+            if ext != '.json' or name == own or not stem.isdigit():
+                continue
+            path = os.path.join(directory, name)
+            if not _pid_alive(int(stem)):
+                # Left by a worker that didn't exit cleanly
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                continue
+            try:
+                with open(path) as snapshot:
+                    snapshot = json.load(snapshot)
+            except (OSError, ValueError):
+                continue
+            if time.time() - snapshot.get('written_at', 0) > stale_after:
+                snapshot['samples'] = {key: value for key, value in snapshot.get('samples', {}).items()
+                                       if _sample_type(key) != 'gauge'}
+            yield snapshot
+
+    def collect(self):
+        """Totals of every process sharing the directory, this one's taken live"""
+        config = get_config()
+        directory = config['DIR']
+        snapshots = [self.snapshot()]
+        if directory and os.path.isdir(directory):
+            snapshots.extend(self._other_snapshots(directory, STALE_FLUSHES * config['FLUSH_INTERVAL']))
+        totals = {}
+        samples = {}
+        for snapshot in snapshots:
+            for view, stats in snapshot.get('views', {}).items():
+                merged = totals.setdefault(view, _empty_view_stats())
+                for key, value in stats.items():
+                    if isinstance(value, list):
+                        merged[key] = [a + b for a, b in zip(merged[key], value)]
+                    else:
+                        merged[key] += value
+            for key, value in snapshot.get('samples', {}).items():
+                samples[key] = samples.get(key, 0) + value
+        return totals, samples
+
+    def reset(self):
+        with self._lock:
+            self._views = {}
+
+
+# Metrics other modules add to every snapshot, e.g. the database pool's
+_collectors = []
+_collector_metrics = {}
+
+
+def register_collector(collect, metrics):
+    """
+    Include ``collect()``, an iterable of (metric name, labels dict, value),
+    in the metrics. ``metrics`` maps each metric name to (type, help text).
+    Values are summed across processes like the per-view totals.
+    """
+    _collectors.append(collect)
+    _collector_metrics.update(metrics)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        # Exists but belongs to someone else
+        return True
+    return True
+
+
+def _sample_type(key):
+    # Metrics of collectors this process didn't load go by Prometheus naming
+    name = json.loads(key)[0]
+    return _collector_metrics.get(name, ('counter' if name.endswith('_total') else 'gauge',))[0]
+
+
+registry = Registry()
+atexit.register(registry.remove_snapshot)
+
+
+def _format_labels(view=None, **extra):
+    labels = {'view': view, **extra} if view is not None else extra
+    return '{' + ','.join(f'{key}="{value}"' for key, value in labels.items()) + '}'
+
+
+def scrape_allowed(request):
+    """Whether ``request`` may read the metrics: by bearer token when TOKEN is set, else by client address"""
+    config = get_config()
+    if config['TOKEN']:
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        return scheme.lower() == 'bearer' and constant_time_compare(token, config['TOKEN'])
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network) for network in config['ALLOWED_IPS'])
+
+
+def render_prometheus():
+    """The collected metrics in Prometheus text exposition format"""
+    totals, samples = registry.collect()
+    views = sorted(totals)
+    lines = []
+
+    def histogram(name, help_text, bounds, buckets_key, count_key, sum_key):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for view in views:
+            stats = totals[view]
+            for bound, count in zip(bounds, stats[buckets_key]):
+                lines.append(f'{name}_bucket{_format_labels(view, le=bound)} {count}')
+            lines.append(f'{name}_bucket{_format_labels(view, le="+Inf")} {stats[count_key]}')
+            lines.append(f'{name}_sum{_format_labels(view)} {stats[sum_key]}')
+            lines.append(f'{name}_count{_format_labels(view)} {stats[count_key]}')
+
+    def counter(name, help_text, key):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} counter')
+        for view in views:
+            lines.append(f'{name}{_format_labels(view)} {totals[view][key]}')
+
+    histogram('elevatelearning_request_duration_seconds', 'Request latency by URL name.',
+              LATENCY_BUCKETS, 'latency_buckets', 'requests', 'latency_sum')
+    counter('elevatelearning_sampled_requests_total', 'Requests whose SQL and templates were measured.', 'sampled')
+    histogram('elevatelearning_sql_queries_per_request', 'SQL queries per sampled request.',
+              QUERY_BUCKETS, 'query_buckets', 'sampled', 'queries')
+    counter('elevatelearning_sql_seconds_total', 'Time spent in SQL by sampled requests.', 'sql_seconds')
+    counter('elevatelearning_template_seconds_total', 'Time spent rendering templates by sampled requests.',
+            'template_seconds')
+    counter('elevatelearning_n_plus_one_total', 'Sampled requests that repeated one SQL shape too often.',
+            'n_plus_one')
+
+    by_metric = {}
+    for key, value in samples.items():
+        name, labels = json.loads(key)
+        by_metric.setdefault(name, []).append((dict(labels), value))
+    for name in sorted(by_metric):
+        metric_type, help_text = _collector_metrics.get(name, ('untyped', ''))
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for labels, value in sorted(by_metric[name], key=lambda sample: sorted(sample[0].items())):
+            lines.append(f'{name}{_format_labels(**labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        config = get_config()
+        if not config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = config['SAMPLE_RATE']
+        self.n_plus_one_threshold = config['N_PLUS_ONE_THRESHOLD']
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _start(self):
+        record = RequestRecord() if self.sample_rate and random.random() < self.sample_rate else None
+        return record, _current.set(record)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        start = time.perf_counter()
+        record, token = self._start()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, start, record)
+        return response
+
+    async def __acall__(self, request):
+        start = time.perf_counter()
+        record, token = self._start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        self._finish(request, start, record)
+        return response
+
+    def _finish(self, request, start, record=None):
+        duration = time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        n_plus_one = 0
+        if record is not None:
+            repeated = [(shape, count) for shape, count in record.shapes.items()
+                        if count > self.n_plus_one_threshold]
+            for shape, count in repeated:
+                logger.warning("Possible N+1 in %s: %d x %s", view, count, shape)
+            n_plus_one = 1 if repeated else 0
+        registry.record(view, duration, record, n_plus_one)
+        try:
+            registry.write_snapshot()
+        except OSError:
+            logger.exception("Could not write the metrics snapshot")
+
+
+class TimedTemplate(DjangoTemplate):
+    def render(self, context=None, request=None):
+        record = _current.get()
+        # Only time the outermost render; nested ones are already inside it
+        if record is None or record.template_depth:
+            return super().render(context, request)
+        record.template_depth += 1
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            record.template_time += time.perf_counter() - start
+            record.template_depth -= 1
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """DjangoTemplates backend that reports render time to MetricsMiddleware"""
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.7 on 2026-10-17 12:50
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    CourseProgress = apps.get_model('elevatelearningapp', 'CourseProgress')
+    CoursePage = apps.get_model('elevatelearningapp', 'CoursePage')
+    completed = CourseProgress.completed_pages.through.objects.filter(
+        courseprogress_id=models.OuterRef('pk')
+    ).order_by().values('courseprogress_id').annotate(n=models.Count('*')).values('n')
+    total = CoursePage.objects.filter(
+        course_id=models.OuterRef('course_id')
+    ).order_by().values('course_id').annotate(n=models.Count('*')).values('n')
+    CourseProgress.objects.update(
+        completed_page_count=Coalesce(models.Subquery(completed), 0),
+        total_page_count=Coalesce(models.Subquery(total), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevatelearningapp', '0004_course_is_archived_coursecomment_is_archived_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseprogress',
+            name='completed_page_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='courseprogress',
+            name='total_page_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
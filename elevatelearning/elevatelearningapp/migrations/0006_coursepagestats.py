@@ -0,0 +1,53 @@
+# Generated by Django 5.1.7 on 2026-10-17 12:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def populate_stats(apps, schema_editor):
+    CoursePage = apps.get_model('elevatelearningapp', 'CoursePage')
+    CoursePageStats = apps.get_model('elevatelearningapp', 'CoursePageStats')
+    CourseInteraction = apps.get_model('elevatelearningapp', 'CourseInteraction')
+    CourseComment = apps.get_model('elevatelearningapp', 'CourseComment')
+
+    def count(queryset):
+        return Coalesce(models.Subquery(
+            queryset.filter(course_page_id=models.OuterRef('pk'))
+            .order_by().values('course_page_id').annotate(n=models.Count('*')).values('n')
+        ), 0)
+
+    page_ids = CoursePage.objects.values_list('pk', flat=True).iterator(chunk_size=2000)
+    CoursePageStats.objects.bulk_create(
+        (CoursePageStats(course_page_id=page_id) for page_id in page_ids),
+        batch_size=2000,
+    )
+    CoursePageStats.objects.update(
+        like_count=count(CourseInteraction.objects.filter(liked=True)),
+        share_count=count(CourseInteraction.objects.filter(shared=True)),
+        comment_count=count(CourseComment.objects.all()),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevatelearningapp', '0005_courseprogress_page_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CoursePageStats',
+            fields=[
+                ('course_page', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='elevatelearningapp.coursepage')),
+                ('like_count', models.PositiveIntegerField(default=0)),
+                ('share_count', models.PositiveIntegerField(default=0)),
+                ('comment_count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Course Page Stats',
+                'verbose_name_plural': 'Course Page Stats',
+            },
+        ),
+        migrations.RunPython(populate_stats, migrations.RunPython.noop),
+    ]
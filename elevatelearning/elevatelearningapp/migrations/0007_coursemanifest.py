@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 12:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevatelearningapp', '0006_coursepagestats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseManifest',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='manifest', serialize=False, to='elevatelearningapp.course')),
+                ('pages', models.JSONField(default=list)),
+                ('page_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
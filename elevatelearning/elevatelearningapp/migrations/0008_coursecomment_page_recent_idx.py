@@ -0,0 +1,19 @@
+# Generated by Django 5.1.7 on 2026-10-17 12:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevatelearningapp', '0007_coursemanifest'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coursecomment',
+            index=models.Index(fields=['course_page', 'is_archived', '-created_at', '-id'], name='comment_page_recent_idx'),
+        ),
+    ]
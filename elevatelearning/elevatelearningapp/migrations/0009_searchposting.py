@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-17 13:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevatelearningapp', '0008_coursecomment_page_recent_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchPosting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64)),
+                ('kind', models.CharField(choices=[('course', 'Course'), ('page', 'Page'), ('comment', 'Comment')], max_length=10)),
+                ('object_id', models.PositiveIntegerField()),
+                ('weight', models.PositiveIntegerField()),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='elevatelearningapp.course')),
+                ('course_page', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='elevatelearningapp.coursepage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['token'], name='search_posting_token_idx')],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'object_id', 'token'), name='search_posting_document_token_uniq')],
+            },
+        ),
+    ]
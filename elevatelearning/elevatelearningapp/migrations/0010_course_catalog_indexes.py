@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 13:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevatelearningapp', '0009_searchposting'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['is_archived', '-created_date', '-course_id'], name='course_catalog_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['is_archived', 'category', '-created_date', '-course_id'], name='course_catalog_category_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 13:26
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevatelearningapp', '0010_course_catalog_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='courseinteraction',
+            index=models.Index(fields=['course_page', 'is_archived', 'liked'], name='interaction_page_liked_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='coursepage',
+            index=models.Index(fields=['course', 'is_archived', 'page_no'], name='page_course_active_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-17 13:35
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevatelearningapp', '0012_job'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Certificate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('code', models.CharField(max_length=12, unique=True)),
+                ('learner_name', models.CharField(max_length=300)),
+                ('course_title', models.CharField(max_length=200)),
+                ('completed_at', models.DateTimeField()),
+                ('issued_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('artifact_digest', models.CharField(blank=True, db_index=True, max_length=32)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='certificates', to='elevatelearningapp.course')),
+                ('learner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='certificates', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('learner', 'course'), name='certificate_learner_course_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,151 @@
+# Generated by Django 5.1.7 on 2026-10-17 13:38
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_completed_at(apps, schema_editor):
+    # When earlier completions happened wasn't recorded; the progress record's
+    # completion (or its last update) is the closest known time
+    PageCompletion = apps.get_model('elevatelearningapp', 'PageCompletion')
+    CourseProgress = apps.get_model('elevatelearningapp', 'CourseProgress')
+    progress = CourseProgress.objects.filter(pk=OuterRef('courseprogress_id'))
+    PageCompletion.objects.update(completed_at=Subquery(
+        progress.annotate(at=Coalesce('completed_at', 'last_updated')).values('at')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevatelearningapp', '0013_certificate'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # The implicit completed_pages through table becomes PageCompletion as it
+        # is, then gains the time each page was completed
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.CreateModel(
+                    name='PageCompletion',
+                    fields=[
+                        ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                        ('courseprogress', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='elevatelearningapp.courseprogress')),
+                        ('coursepage', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='elevatelearningapp.coursepage')),
+                    ],
+                    options={
+                        'db_table': 'elevatelearningapp_courseprogress_completed_pages',
+                        'unique_together': {('courseprogress', 'coursepage')},
+                    },
+                ),
+                migrations.AlterField(
+                    model_name='courseprogress',
+                    name='completed_pages',
+                    field=models.ManyToManyField(blank=True, related_name='completed_by', through='elevatelearningapp.PageCompletion', to='elevatelearningapp.coursepage'),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name='pagecompletion',
+            name='completed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(backfill_completed_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='pagecompletion',
+            index=models.Index(fields=['completed_at'], name='page_completion_time_idx'),
+        ),
+        migrations.CreateModel(
+            name='AnalyticsWatermark',
+            fields=[
+                ('name', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('aggregated_until', models.DateTimeField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CourseDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('enrollments', models.PositiveIntegerField(default=0)),
+                ('completions', models.PositiveIntegerField(default=0)),
+                ('page_completions', models.PositiveIntegerField(default=0)),
+                ('likes', models.PositiveIntegerField(default=0)),
+                ('shares', models.PositiveIntegerField(default=0)),
+                ('comments', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Course Daily Stats',
+            },
+        ),
+        migrations.CreateModel(
+            name='PageDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('page_completions', models.PositiveIntegerField(default=0)),
+                ('likes', models.PositiveIntegerField(default=0)),
+                ('shares', models.PositiveIntegerField(default=0)),
+                ('comments', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'Page Daily Stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='coursecomment',
+            index=models.Index(fields=['created_at'], name='comment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseinteraction',
+            index=models.Index(fields=['created_at'], name='interaction_created_idx'),
+        ),
+        migrations.AddField(
+            model_name='coursedailystats',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='elevatelearningapp.course'),
+        ),
+        migrations.AddIndex(
+            model_name='courseprogress',
+            index=models.Index(fields=['started_at'], name='progress_started_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseprogress',
+            index=models.Index(fields=['completed_at'], name='progress_completed_idx'),
+        ),
+        migrations.AddField(
+            model_name='pagedailystats',
+            name='course',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='elevatelearningapp.course'),
+        ),
+        migrations.AddField(
+            model_name='pagedailystats',
+            name='course_page',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='elevatelearningapp.coursepage'),
+        ),
+        migrations.AddIndex(
+            model_name='coursedailystats',
+            index=models.Index(fields=['day'], name='course_daily_stats_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='coursedailystats',
+            constraint=models.UniqueConstraint(fields=('course', 'day'), name='course_daily_stats_uniq'),
+        ),
+        migrations.AddIndex(
+            model_name='pagedailystats',
+            index=models.Index(fields=['course', 'day'], name='page_daily_stats_course_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pagedailystats',
+            index=models.Index(fields=['day'], name='page_daily_stats_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pagedailystats',
+            constraint=models.UniqueConstraint(fields=('course_page', 'day'), name='page_daily_stats_uniq'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.1.7 on 2026-10-17 14:21
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_liked_shared_at(apps, schema_editor):
+    # When existing likes and shares happened wasn't recorded; the interaction's
+    # creation is the closest known time
+    CourseInteraction = apps.get_model('elevatelearningapp', 'CourseInteraction')
+    CourseInteraction.objects.filter(liked=True).update(liked_at=F('created_at'))
+    CourseInteraction.objects.filter(shared=True).update(shared_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevatelearningapp', '0014_analytics_rollups'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='courseinteraction',
+            name='liked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='courseinteraction',
+            name='shared_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(backfill_liked_shared_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='courseinteraction',
+            index=models.Index(fields=['liked_at'], name='interaction_liked_at_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='courseinteraction',
+            index=models.Index(fields=['shared_at'], name='interaction_shared_at_idx'),
+        ),
+    ]
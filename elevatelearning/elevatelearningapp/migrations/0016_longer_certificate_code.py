@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('elevatelearningapp', '0015_interaction_liked_shared_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='certificate',
+            name='code',
+            field=models.CharField(max_length=20, unique=True),
+        ),
+    ]
@@ -1,6 +1,11 @@
+import bisect
+from collections import namedtuple
+from datetime import datetime
 from django.contrib.auth.models import User
-from django.db import models
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.utils import timezone
+from .pagination import decode_cursor, encode_cursor
 
 class UserDetail(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)  # Link to Django's built-in User model
@@ -14,6 +19,72 @@ class UserDetail(models.Model):
     def __str__(self):
         return f"Details for {self.user.username}"
 
+class ActiveManager(models.Manager):
+    """Leaves out archived rows; models using it keep an unfiltered ``all_objects`` for admin and bookkeeping"""
+    def get_queryset(self):
+        # Compared to a value: is_archived=False renders as NOT is_archived on SQLite, which its
+        # planner can't match to the (..., is_archived, ...) indexes
+        return super().get_queryset().filter(is_archived=models.Value(False))
+
+class CourseQuerySet(models.QuerySet):
+    def with_progress_for(self, user):
+        """Annotate each course with the user's page totals, completed count and next incomplete page"""
+        progress = CourseProgress.objects.filter(learner=user, course_id=models.OuterRef('pk'))
+        page_count = CoursePage.objects.filter(
+            course_id=models.OuterRef('pk')
+        ).order_by().values('course_id').annotate(n=models.Count('*')).values('n')
+        completed_by_user = CourseProgress.completed_pages.through.objects.filter(
+            courseprogress__learner=user,
+            coursepage_id=models.OuterRef('pk'),
+        )
+        next_page = CoursePage.objects.filter(
+            course_id=models.OuterRef('pk')
+        ).exclude(models.Exists(completed_by_user)).order_by('page_no')
+        return self.annotate(
+            progress_id=models.Subquery(progress.values('pk')[:1]),
+            completed_total=Coalesce(models.Subquery(progress.values('completed_page_count')[:1]), 0),
+            page_total=Coalesce(
+                models.Subquery(progress.values('total_page_count')[:1]),
+                models.Subquery(page_count),
+                0,
+            ),
+            next_page_id=models.Subquery(next_page.values('coursepage_id')[:1]),
+            next_page_title=models.Subquery(next_page.values('page_title')[:1]),
+        )
+
+    def catalog_page(self, user=None, category=None, archived=False, not_enrolled=False, cursor=None, limit=20):
+        """
+        Return one page of the catalog, newest first, and the cursor for the
+        next page (None when there are no more). ``archived`` is True, False
+        or None for both. With a ``user`` each course is annotated with
+        ``is_enrolled``, and ``not_enrolled`` leaves out their courses.
+        Call it on ``Course.all_objects``; ``Course.objects`` has no archived
+        courses to list.
+        """
+        courses = self.order_by('-created_date', '-course_id')
+        if archived is not None:
+            courses = courses.filter(is_archived=models.Value(archived))
+        if category:
+            courses = courses.filter(category=category)
+        if user is not None:
+            # A NOT EXISTS probe per course on the enrollment table's (course, user) index
+            courses = courses.annotate(is_enrolled=models.Exists(Course.learners.through.objects.filter(
+                course_id=models.OuterRef('pk'), user_id=user.pk
+            )))
+            if not_enrolled:
+                courses = courses.filter(is_enrolled=False)
+        after = decode_cursor(cursor, datetime, int)
+        if after:
+            created_date, course_id = after
+            courses = courses.filter(
+                models.Q(created_date__lt=created_date) | models.Q(created_date=created_date, course_id__lt=course_id)
+            )
+        rows = list(courses[:limit + 1])
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].created_date, rows[-1].course_id)
+
 class Course(models.Model):
     CATEGORY_CHOICES = [
         ('programming', 'Programming'),
@@ -47,9 +118,25 @@ class Course(models.Model):
     modified_date = models.DateTimeField(auto_now=True)
     is_archived = models.BooleanField(default=False)
 
+    objects = ActiveManager.from_queryset(CourseQuerySet)()
+    all_objects = CourseQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Serve the newest-first keyset pagination in CourseQuerySet.catalog_page, with and without a category
+            models.Index(fields=['is_archived', '-created_date', '-course_id'], name='course_catalog_idx'),
+            models.Index(fields=['is_archived', 'category', '-created_date', '-course_id'],
+                         name='course_catalog_category_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} (Course ID: {self.course_id})"
 
+    @classmethod
+    def lock(cls, course_id):
+        """Lock a course row for the rest of the transaction; serializes changes to its page order"""
+        cls.all_objects.select_for_update().filter(pk=course_id).values_list('pk', flat=True).first()
+
 class QRcode(models.Model):
     qrcode_id = models.AutoField(primary_key=True)
     course = models.OneToOneField(
@@ -65,6 +152,18 @@ class QRcode(models.Model):
     def __str__(self):
         return f"QR Code for {self.course.title} (ID: {self.qrcode_id})"
 
+    @property
+    def png_url(self):
+        """Media URL of the rendered PNG image"""
+        from . import qrcodes
+        return qrcodes.image_url(self.qrcode_url, 'png')
+
+    @property
+    def svg_url(self):
+        """Media URL of the rendered SVG image"""
+        from . import qrcodes
+        return qrcodes.image_url(self.qrcode_url, 'svg')
+
     class Meta:
         verbose_name = "QR Code"
         verbose_name_plural = "QR Codes"
@@ -84,21 +183,153 @@ class CoursePage(models.Model):
     modified_at = models.DateTimeField(auto_now=True)
     is_archived = models.BooleanField(default=False)
 
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
     def __str__(self):
         return f"{self.page_title} (Course: {self.course.title}, Page: {self.page_no})"
 
     class Meta:
         ordering = ['page_no']  # Ensures pages are ordered by page number
         unique_together = ('course', 'page_no')  # Ensures page numbers are unique per course
+        indexes = [
+            # A course's visible pages in order (manifest, next incomplete page, page counts)
+            models.Index(fields=['course', 'is_archived', 'page_no'], name='page_course_active_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember whether the page was archived so signals can tell when that changes
+        if 'is_archived' in field_names:
+            instance._saved_archived = instance.is_archived
+        return instance
 
     def save(self, *args, **kwargs):
-        # Auto-increment page_no if not provided
+        # Auto-increment page_no if not provided; archived pages keep their numbers
         if not self.page_no:
-            last_page = CoursePage.objects.filter(course=self.course).order_by('-page_no').first()
-            self.page_no = last_page.page_no + 1 if last_page else 1
+            with transaction.atomic():
+                self.page_no = self.allocate_page_no(self.course_id)
+                super().save(*args, **kwargs)
+            return
         super().save(*args, **kwargs)
 
+    @classmethod
+    def allocate_page_no(cls, course_id):
+        """Next free page_no for a course; call inside a transaction, which then holds the course row lock"""
+        Course.lock(course_id)
+        highest = cls.all_objects.filter(course_id=course_id).aggregate(highest=models.Max('page_no'))['highest']
+        return (highest or 0) + 1
+
+ManifestEntry = namedtuple('ManifestEntry', ['coursepage_id', 'page_no', 'page_title'])
+
+class CourseManifest(models.Model):
+    """Ordered list of a course's pages (id, page_no, title) used for navigation without loading page bodies"""
+    course = models.OneToOneField(
+        Course,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='manifest'
+    )
+    pages = models.JSONField(default=list)  # [[coursepage_id, page_no, page_title], ...] ordered by page_no
+    page_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Manifest for course {self.course_id} ({self.page_count} pages)"
+
+    @classmethod
+    def rebuild(cls, course_id):
+        """Rebuild a course's manifest from its unarchived pages"""
+        entries = CoursePage.objects.filter(course_id=course_id).order_by('page_no').values_list(
+            'coursepage_id', 'page_no', 'page_title'
+        )
+        pages = [list(entry) for entry in entries]
+        manifest, created = cls.objects.update_or_create(
+            course_id=course_id,
+            defaults={'pages': pages, 'page_count': len(pages)}
+        )
+        return manifest
+
+    @classmethod
+    def for_course(cls, course_id):
+        """Return a course's manifest, building it on first use"""
+        try:
+            return cls.objects.get(course_id=course_id)
+        except cls.DoesNotExist:
+            return cls.rebuild(course_id)
+
+    @classmethod
+    def patch_page(cls, page):
+        """Insert or update a single page's entry in its course's manifest; archiving a page drops it"""
+        with transaction.atomic():
+            manifest = cls.objects.select_for_update().filter(course_id=page.course_id).first()
+            if manifest is None:
+                return
+            pages = [entry for entry in manifest.pages if entry[0] != page.coursepage_id]
+            if not page.is_archived:
+                position = bisect.bisect([entry[1] for entry in pages], page.page_no)
+                pages.insert(position, [page.coursepage_id, page.page_no, page.page_title])
+            manifest.pages = pages
+            manifest.page_count = len(pages)
+            manifest.save()
+
+    @classmethod
+    def remove_page(cls, course_id, coursepage_id):
+        """Drop a deleted page's entry from its course's manifest"""
+        with transaction.atomic():
+            manifest = cls.objects.select_for_update().filter(course_id=course_id).first()
+            if manifest is None:
+                return
+            manifest.pages = [entry for entry in manifest.pages if entry[0] != coursepage_id]
+            manifest.page_count = len(manifest.pages)
+            manifest.save()
+
+    @property
+    def entries(self):
+        return [ManifestEntry(*entry) for entry in self.pages]
+
+    @property
+    def first_page_id(self):
+        return self.pages[0][0] if self.pages else None
+
+    def neighbours(self, page):
+        """
+        Return ``(position, previous, next)`` for a page: its 1-based position among the
+        course's visible pages and the ManifestEntry on either side (None at either end).
+        All three are None if the page isn't in the manifest.
+        """
+        page_nos = [entry[1] for entry in self.pages]
+        index = bisect.bisect_left(page_nos, page.page_no)
+        if index >= len(self.pages) or self.pages[index][0] != page.coursepage_id:
+            # Manifest is out of date for this page; fall back to a linear search by id
+            ids = [entry[0] for entry in self.pages]
+            if page.coursepage_id not in ids:
+                return None, None, None
+            index = ids.index(page.coursepage_id)
+        previous_page = ManifestEntry(*self.pages[index - 1]) if index > 0 else None
+        next_page = ManifestEntry(*self.pages[index + 1]) if index < len(self.pages) - 1 else None
+        return index + 1, previous_page, next_page
+
+class CourseProgressQuerySet(models.QuerySet):
+    def refresh_counters(self):
+        """Recompute the stored page counters from the pages and completed_pages tables; archived pages don't count"""
+        completed = CourseProgress.completed_pages.through.objects.filter(
+            courseprogress_id=models.OuterRef('pk'), coursepage__is_archived=False
+        ).order_by().values('courseprogress_id').annotate(n=models.Count('*')).values('n')
+        total = CoursePage.objects.filter(
+            course_id=models.OuterRef('course_id')
+        ).order_by().values('course_id').annotate(n=models.Count('*')).values('n')
+        return self.update(
+            completed_page_count=Coalesce(models.Subquery(completed), 0),
+            total_page_count=Coalesce(models.Subquery(total), 0),
+        )
+
 class CourseProgress(models.Model):
+    # Maintained by signals (see signals.py) and only ever written with
+    # set-based UPDATEs, so a plain save() must not overwrite them.
+    COUNTER_FIELDS = ('completed_page_count', 'total_page_count')
+
     learner = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -119,34 +350,56 @@ class CourseProgress(models.Model):
     )
     completed_pages = models.ManyToManyField(
         CoursePage,
+        through='PageCompletion',
         related_name='completed_by',
         blank=True
     )
+    completed_page_count = models.PositiveIntegerField(default=0)
+    total_page_count = models.PositiveIntegerField(default=0)
     started_at = models.DateTimeField(default=timezone.now)
     completed_at = models.DateTimeField(null=True, blank=True)
     last_updated = models.DateTimeField(auto_now=True)
     is_archived = models.BooleanField(default=False)
 
+    objects = CourseProgressQuerySet.as_manager()
+
     class Meta:
         unique_together = ('learner', 'course')  # One progress record per learner per course
         verbose_name_plural = 'Course Progress Records'
+        indexes = [
+            # Daily enrollment and completion rollups read one day of each (see analytics.py)
+            models.Index(fields=['started_at'], name='progress_started_idx'),
+            models.Index(fields=['completed_at'], name='progress_completed_idx'),
+        ]
 
     def __str__(self):
         return f"{self.learner.username}'s progress in {self.course.title}"
 
+    def save(self, *args, **kwargs):
+        if self._state.adding:
+            self.total_page_count = CoursePage.objects.filter(course_id=self.course_id).count()
+        elif kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
+    def refresh_counters_from_db(self):
+        """Reload the stored page counters after they were changed in the database"""
+        self.refresh_from_db(fields=self.COUNTER_FIELDS)
+
     @property
     def is_completed(self):
         """Check if the course is fully completed"""
-        total_pages = self.course.pages.count()
-        return total_pages > 0 and self.completed_pages.count() == total_pages
+        return self.total_page_count > 0 and self.completed_page_count >= self.total_page_count
 
     @property
     def progress_percentage(self):
         """Calculate progress as a float between 0 and 1"""
-        total_pages = self.course.pages.count()
-        if total_pages == 0:
+        if self.total_page_count == 0:
             return 0.0
-        return float(self.completed_pages.count()) / float(total_pages)
+        return min(float(self.completed_page_count) / float(self.total_page_count), 1.0)
 
     def get_progress_display(self):
         """Return progress as percentage string"""
@@ -158,17 +411,36 @@ class CourseProgress(models.Model):
             self.completed_pages.add(page)
         else:
             self.completed_pages.remove(page)
+        self.refresh_counters_from_db()
         
         self.current_page = self.get_next_incomplete_page()
-        if self.is_completed:
+        newly_completed = self.is_completed and self.completed_at is None
+        if newly_completed:
             self.completed_at = timezone.now()
         self.save()
+        if newly_completed:
+            from . import certificates
+            certificates.issue([self.pk])
 
     def get_next_incomplete_page(self):
         """Get the next page that hasn't been completed"""
         completed_ids = self.completed_pages.values_list('coursepage_id', flat=True)
         return self.course.pages.exclude(coursepage_id__in=completed_ids).order_by('page_no').first()
     
+class PageCompletion(models.Model):
+    """A page a learner has completed; the through table of CourseProgress.completed_pages"""
+    courseprogress = models.ForeignKey(CourseProgress, on_delete=models.CASCADE)
+    coursepage = models.ForeignKey(CoursePage, on_delete=models.CASCADE)
+    completed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        # The table Django created for the implicit through model
+        db_table = 'elevatelearningapp_courseprogress_completed_pages'
+        unique_together = ('courseprogress', 'coursepage')
+        indexes = [
+            models.Index(fields=['completed_at'], name='page_completion_time_idx'),
+        ]
+
 class CourseInteraction(models.Model):
     course_page = models.ForeignKey(
         CoursePage, 
@@ -182,11 +454,77 @@ class CourseInteraction(models.Model):
     )
     liked = models.BooleanField(default=False)
     shared = models.BooleanField(default=False)
+    # When the page was (last) liked and shared, set on save; the daily rollups count them by these
+    liked_at = models.DateTimeField(null=True, blank=True)
+    shared_at = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     is_archived = models.BooleanField(default=False)
 
+    objects = ActiveManager()
+    all_objects = models.Manager()
+
     class Meta:
         unique_together = ('course_page', 'user')
+        indexes = [
+            # Counting a page's likes for CoursePageStats.refresh_counts without reading the rows
+            models.Index(fields=['course_page', 'is_archived', 'liked'], name='interaction_page_liked_idx'),
+            models.Index(fields=['created_at'], name='interaction_created_idx'),
+            models.Index(fields=['liked_at'], name='interaction_liked_at_idx'),
+            models.Index(fields=['shared_at'], name='interaction_shared_at_idx'),
+        ]
+
+    TIMESTAMPS = {'liked': 'liked_at', 'shared': 'shared_at'}
+
+    def save(self, *args, **kwargs):
+        now = timezone.now()
+        for flag, stamp in self.TIMESTAMPS.items():
+            if not getattr(self, flag):
+                setattr(self, stamp, None)
+            elif getattr(self, stamp) is None:
+                setattr(self, stamp, now)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, *(self.TIMESTAMPS[flag] for flag in self.TIMESTAMPS
+                                                         if flag in update_fields)}
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored flags so signals can turn a save into counter deltas
+        if {'liked', 'shared', 'is_archived'} <= set(field_names):
+            instance._saved_flags = instance.counted_flags()
+        return instance
+
+    def restore_as_new(self):
+        """Un-archive without reviving the old like or share; saving is left to the caller"""
+        self.liked = self.shared = self.is_archived = False
+        self.liked_at = self.shared_at = None
+
+    def counted_flags(self):
+        """(liked, shared) as they count towards the page's stats; archived interactions count for nothing"""
+        if self.is_archived:
+            return False, False
+        return self.liked, self.shared
+
+class CourseCommentQuerySet(models.QuerySet):
+    def page_for(self, course_page, cursor=None, limit=20):
+        """
+        Return one page of a course page's visible comments, newest first,
+        and the cursor for the next page (None when there are no more).
+        """
+        comments = self.filter(course_page=course_page).select_related('user').order_by('-created_at', '-id')
+        after = decode_cursor(cursor, datetime, int)
+        if after:
+            created_at, comment_id = after
+            comments = comments.filter(
+                models.Q(created_at__lt=created_at) | models.Q(created_at=created_at, id__lt=comment_id)
+            )
+        rows = list(comments[:limit + 1])
+        if len(rows) <= limit:
+            return rows, None
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
 
 class CourseComment(models.Model):
     course_page = models.ForeignKey(
@@ -204,10 +542,249 @@ class CourseComment(models.Model):
     updated_at = models.DateTimeField(auto_now=True)
     is_archived = models.BooleanField(default=False)
 
+    objects = ActiveManager.from_queryset(CourseCommentQuerySet)()
+    all_objects = CourseCommentQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Serves the newest-first keyset pagination in CourseCommentQuerySet.page_for
+            models.Index(fields=['course_page', 'is_archived', '-created_at', '-id'], name='comment_page_recent_idx'),
+            models.Index(fields=['created_at'], name='comment_created_idx'),
+        ]
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember whether the comment was archived so signals can adjust the page's comment count
+        if 'is_archived' in field_names:
+            instance._saved_archived = instance.is_archived
+        return instance
 
+class CoursePageStatsQuerySet(models.QuerySet):
+    def refresh_counts(self):
+        """Recompute like/share/comment counts from the unarchived interactions and comments"""
+        def count(queryset):
+            return Coalesce(models.Subquery(
+                queryset.filter(course_page_id=models.OuterRef('pk'))
+                .order_by().values('course_page_id').annotate(n=models.Count('*')).values('n')
+            ), 0)
+        return self.update(
+            like_count=count(CourseInteraction.objects.filter(liked=True)),
+            share_count=count(CourseInteraction.objects.filter(shared=True)),
+            comment_count=count(CourseComment.objects.all()),
+        )
 
+class CoursePageStats(models.Model):
+    course_page = models.OneToOneField(
+        CoursePage,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    like_count = models.PositiveIntegerField(default=0)
+    share_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+
+    objects = CoursePageStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Course Page Stats"
+        verbose_name_plural = "Course Page Stats"
+
+    def __str__(self):
+        return f"Engagement for page {self.course_page_id}"
+
+    @classmethod
+    def ensure_for_pages(cls, page_ids):
+        """Create missing stats rows for the given pages with counts taken from the source tables"""
+        page_ids = list(page_ids)
+        cls.objects.bulk_create([cls(course_page_id=page_id) for page_id in page_ids], ignore_conflicts=True)
+        cls.objects.filter(course_page_id__in=page_ids).refresh_counts()
+
+    @classmethod
+    def for_page(cls, page):
+        """Return the stats row for a page, creating it if it is missing"""
+        try:
+            return page.stats
+        except cls.DoesNotExist:
+            cls.ensure_for_pages([page.coursepage_id])
+            return cls.objects.get(course_page_id=page.coursepage_id)
+
+    @classmethod
+    def bump(cls, page_id, create_missing=True, **deltas):
+        """Atomically add the given deltas (e.g. like_count=-1) to a page's counters"""
+        changes = {}
+        for field, delta in deltas.items():
+            if delta > 0:
+                changes[field] = models.F(field) + delta
+            elif delta < 0:
+                # Counters are unsigned; never take them below zero
+                changes[field] = models.Case(
+                    models.When(**{f'{field}__gte': -delta}, then=models.F(field) + delta),
+                    default=models.Value(0),
+                )
+        updated = cls.objects.filter(course_page_id=page_id).update(**changes) if changes else 1
+        if not updated and create_missing:
+            cls.ensure_for_pages([page_id])
+
+class SearchPosting(models.Model):
+    """One token of one indexed course, page or comment, with its field-weighted term frequency (see search.py)"""
+    KIND_CHOICES = [
+        ('course', 'Course'),
+        ('page', 'Page'),
+        ('comment', 'Comment'),
+    ]
 
-# Create your models here.
+    token = models.CharField(max_length=64)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveIntegerField()
+    # Results are courses and pages; comment hits count towards their page
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    course_page = models.ForeignKey(CoursePage, on_delete=models.CASCADE, null=True, related_name='+')
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id', 'token'], name='search_posting_document_token_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['token'], name='search_posting_token_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.token} in {self.kind} {self.object_id} ({self.weight})"
+
+class Certificate(models.Model):
+    """Issued once when a learner completes a course; see certificates.py"""
+    code = models.CharField(max_length=20, unique=True)
+    learner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='certificates')
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='certificates')
+    # As they were when the certificate was issued
+    learner_name = models.CharField(max_length=300)
+    course_title = models.CharField(max_length=200)
+    completed_at = models.DateTimeField()
+    issued_at = models.DateTimeField(default=timezone.now)
+    # Names the rendered PNG and PDF; empty until the render job has run
+    artifact_digest = models.CharField(max_length=32, blank=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['learner', 'course'], name='certificate_learner_course_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Certificate {self.code} for {self.learner_name} ({self.course_title})"
+
+    @property
+    def png_url(self):
+        """Media URL of the rendered PNG, or None until it is rendered"""
+        from . import certificates
+        return certificates.artifact_url(self.artifact_digest, 'png') if self.artifact_digest else None
+
+    @property
+    def pdf_url(self):
+        """Media URL of the rendered PDF, or None until it is rendered"""
+        from . import certificates
+        return certificates.artifact_url(self.artifact_digest, 'pdf') if self.artifact_digest else None
+
+class CourseDailyStats(models.Model):
+    """A course's activity on one day, aggregated by analytics.py"""
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    enrollments = models.PositiveIntegerField(default=0)
+    completions = models.PositiveIntegerField(default=0)
+    page_completions = models.PositiveIntegerField(default=0)
+    likes = models.PositiveIntegerField(default=0)
+    shares = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Course Daily Stats"
+        constraints = [
+            models.UniqueConstraint(fields=['course', 'day'], name='course_daily_stats_uniq'),
+        ]
+        indexes = [
+            # Re-aggregating a day replaces all of its rows
+            models.Index(fields=['day'], name='course_daily_stats_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Course {self.course_id} on {self.day}"
+
+class PageDailyStats(models.Model):
+    """A page's activity on one day, aggregated by analytics.py"""
+    course_page = models.ForeignKey(CoursePage, on_delete=models.CASCADE, related_name='daily_stats')
+    # Copied from the page so a course's pages are read with one index range
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='+')
+    day = models.DateField()
+    page_completions = models.PositiveIntegerField(default=0)
+    likes = models.PositiveIntegerField(default=0)
+    shares = models.PositiveIntegerField(default=0)
+    comments = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name_plural = "Page Daily Stats"
+        constraints = [
+            models.UniqueConstraint(fields=['course_page', 'day'], name='page_daily_stats_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['course', 'day'], name='page_daily_stats_course_idx'),
+            models.Index(fields=['day'], name='page_daily_stats_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"Page {self.course_page_id} on {self.day}"
+
+class AnalyticsWatermark(models.Model):
+    """How far the daily rollups have been aggregated"""
+    name = models.CharField(max_length=50, primary_key=True)
+    aggregated_until = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} until {self.aggregated_until}"
+
+class Job(models.Model):
+    """A unit of background work, run by the run_jobs command (see jobs.py)"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    params = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    progress_done = models.PositiveIntegerField(default=0)
+    progress_total = models.PositiveIntegerField(default=0)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers claim the oldest queued job and look for running ones that went quiet
+            models.Index(fields=['status', 'created_at'], name='job_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk} ({self.status})"
+
+    def report_progress(self, done, total=None):
+        """Store how far the job has got; also tells other workers it is still alive"""
+        self.progress_done = done
+        changes = {'progress_done': done, 'heartbeat_at': timezone.now()}
+        if total is not None:
+            self.progress_total = changes['progress_total'] = total
+        Job.objects.filter(pk=self.pk).update(**changes)
+
+    @property
+    def progress_percentage(self):
+        if not self.progress_total:
+            return 1.0 if self.status == 'done' else 0.0
+        return min(self.progress_done / self.progress_total, 1.0)
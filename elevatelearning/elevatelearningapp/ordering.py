@@ -0,0 +1,62 @@
+"""
+Set-based page ordering for courses.
+
+Every operation here runs a fixed number of statements however long the
+course is. ``unique_together = ('course', 'page_no')`` is checked row by row
+on MySQL, so a block of pages is never renumbered in place: it is first
+lifted above the course's highest page_no and then dropped into its new
+range, which cannot collide with any row outside the block.
+
+All functions must be called inside ``transaction.atomic()``; they lock the
+course row so concurrent reorders and page_no allocation for the same
+course are serialized. Archived pages keep their place in the numbering, so
+everything here goes through ``CoursePage.all_objects``.
+"""
+
+from django.db.models import F, Max
+from .models import Course, CourseManifest, CoursePage
+
+
+def _shift(course_id, low, high, delta, ceiling):
+    """Add ``delta`` to the page_no of pages numbered ``low``..``high``"""
+    CoursePage.all_objects.filter(course_id=course_id, page_no__gte=low, page_no__lte=high).update(
+        page_no=F('page_no') + ceiling
+    )
+    CoursePage.all_objects.filter(course_id=course_id, page_no__gt=ceiling).update(
+        page_no=F('page_no') - ceiling + delta
+    )
+
+
+def close_gap(course_id, page_no):
+    """Renumber the pages after a removed ``page_no`` down by one"""
+    Course.lock(course_id)
+    highest = CoursePage.all_objects.filter(course_id=course_id).aggregate(highest=Max('page_no'))['highest']
+    if highest is not None and highest > page_no:
+        _shift(course_id, page_no + 1, highest, -1, highest)
+    CourseManifest.rebuild(course_id)
+
+
+def move_page(page, position):
+    """
+    Move ``page`` to ``position`` (1-based) within its course, shifting the
+    pages in between by one. Returns the page's new page_no.
+    """
+    course_id = page.course_id
+    Course.lock(course_id)
+    highest = CoursePage.all_objects.filter(course_id=course_id).aggregate(highest=Max('page_no'))['highest']
+    current = CoursePage.all_objects.filter(pk=page.pk).values_list('page_no', flat=True).get()
+    position = max(1, min(position, highest))
+    if position == current:
+        return current
+
+    # Park the page on 0 (never used by a real page) while the others move
+    CoursePage.all_objects.filter(pk=page.pk).update(page_no=0)
+    if position < current:
+        _shift(course_id, position, current - 1, 1, highest)
+    else:
+        _shift(course_id, current + 1, position, -1, highest)
+    CoursePage.all_objects.filter(pk=page.pk).update(page_no=position)
+
+    page.page_no = position
+    CourseManifest.rebuild(course_id)
+    return position
@@ -0,0 +1,42 @@
+"""
+Opaque cursors for keyset ("seek") pagination.
+
+A cursor is the ordering key of the last row on a page, e.g.
+``(created_at, id)``; the next page is everything strictly after it in the
+same ordering, which an index on those columns serves without an OFFSET scan.
+"""
+
+import base64
+import json
+from datetime import datetime
+
+
+def encode_cursor(*values):
+    """Encode the ordering key of the last row returned"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, *types):
+    """
+    Decode a cursor back into its values, converting each with ``types``.
+
+    Returns None for a missing or malformed cursor so callers fall back to
+    the first page.
+    """
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        if not isinstance(payload, list) or len(payload) != len(types):
+            return None
+        values = tuple(
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for kind, value in zip(types, payload)
+        )
+    except (ValueError, TypeError, OverflowError):
+        return None
+    # Keys the database couldn't compare (ids beyond a BIGINT) make the cursor as bad as garbage
+    if any(isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63 for value in values):
+        return None
+    return values
@@ -0,0 +1,153 @@
+"""
+Users loaded together with their UserDetail, cached between requests.
+
+``ProfileBackend`` is ``ModelBackend`` except that it loads users with their
+UserDetail in one joined query and keeps the pair in the cache for
+``PROFILE_CACHE_TIMEOUT`` seconds, so ``request.user.userdetail`` never
+queries and a warm request doesn't touch the database to authenticate.
+The password hash is never cached: the entry holds the other fields and
+the user's session auth hashes, so cached users come back with
+``password`` deferred and still pass ``get_user``'s session check.
+Saving or deleting a User or UserDetail drops the cached copy (see
+``signals.py``); with a per-process cache other processes catch up when
+their copy expires.
+
+``role_required`` guards views, sync or async, by ``UserDetail.role``.
+"""
+
+from functools import partial, wraps
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.shortcuts import redirect
+from django.utils.crypto import salted_hmac
+from .models import UserDetail
+
+User = get_user_model()
+
+USER_FIELDS = [field.attname for field in User._meta.concrete_fields if field.attname != 'password']
+DETAIL_FIELDS = [field.attname for field in UserDetail._meta.concrete_fields]
+
+
+def _cache():
+    return caches[getattr(settings, 'PROFILE_CACHE_ALIAS', 'default')]
+
+
+def _key(user_id):
+    # The cached session hashes depend on the secret keys, so rotating them starts afresh
+    keys = salted_hmac('elevatelearning.profiles', ':'.join(settings.SECRET_KEY_FALLBACKS)).hexdigest()[:8]
+    return f'profiles:user:{keys}:{user_id}'
+
+
+def _secrets():
+    # None is SECRET_KEY, which _get_session_auth_hash uses by default
+    return [None, *settings.SECRET_KEY_FALLBACKS]
+
+
+def _session_auth_hash(user, hashes, secret=None):
+    # Cached hashes stand in for the deferred password until a new one is set
+    if 'password' in user.__dict__:
+        return User._get_session_auth_hash(user, secret)
+    return hashes[secret]
+
+
+def _to_cache(user):
+    detail = user.userdetail if hasattr(user, 'userdetail') else None
+    return {
+        'user': [getattr(user, name) for name in USER_FIELDS],
+        'detail': [getattr(detail, name) for name in DETAIL_FIELDS] if detail is not None else None,
+        'session_hashes': [user._get_session_auth_hash(secret) for secret in _secrets()],
+    }
+
+
+def _from_cache(data):
+    user = User.from_db(DEFAULT_DB_ALIAS, USER_FIELDS, data['user'])
+    user._get_session_auth_hash = partial(_session_auth_hash, user, dict(zip(_secrets(), data['session_hashes'])))
+    detail = None
+    if data['detail'] is not None:
+        detail = UserDetail.from_db(DEFAULT_DB_ALIAS, DETAIL_FIELDS, data['detail'])
+        UserDetail.user.field.set_cached_value(detail, user)
+    User.userdetail.related.set_cached_value(user, detail)
+    return user
+
+
+def load_user(user_id):
+    """The user with its UserDetail, from the cache or one query; None if there is no such user"""
+    cache = _cache()
+    data = cache.get(_key(user_id))
+    if data is not None:
+        return _from_cache(data)
+    user = User._default_manager.select_related('userdetail').filter(pk=user_id).first()
+    if user is not None:
+        cache.set(_key(user_id), _to_cache(user), getattr(settings, 'PROFILE_CACHE_TIMEOUT', 300))
+    return user
+
+
+def invalidate_user(user_id):
+    """Drop a user's cached copy, now and again once the current transaction commits"""
+    _cache().delete(_key(user_id))
+    transaction.on_commit(lambda: _cache().delete(_key(user_id)))
+
+
+class ProfileBackend(ModelBackend):
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        user = User._default_manager.select_related('userdetail').filter(
+            **{User.USERNAME_FIELD: username}
+        ).first()
+        if user is None:
+            # Run the hasher anyway so missing users take as long as wrong passwords
+            User().set_password(password)
+            return None
+        if user.check_password(password) and self.user_can_authenticate(user):
+            return user
+        return None
+
+    def get_user(self, user_id):
+        user = load_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+def get_role(user):
+    """The user's role in lower case, or None for anonymous users and users without details"""
+    if not user.is_authenticated:
+        return None
+    try:
+        return user.userdetail.role.lower()
+    except User.userdetail.RelatedObjectDoesNotExist:
+        return None
+
+
+async def aget_role(user):
+    # Users from ProfileBackend already carry their UserDetail
+    if not user.is_authenticated or User.userdetail.is_cached(user):
+        return get_role(user)
+    return await sync_to_async(get_role)(user)
+
+
+def role_required(role, message, redirect_to='dashboard'):
+    """Send users whose role isn't ``role`` to ``redirect_to`` with ``message`` instead of running the view"""
+    def decorator(view):
+        if iscoroutinefunction(view):
+            @wraps(view)
+            async def wrapper(request, *args, **kwargs):
+                if await aget_role(await request.auser()) != role:
+                    messages.error(request, message)
+                    return redirect(redirect_to)
+                return await view(request, *args, **kwargs)
+        else:
+            @wraps(view)
+            def wrapper(request, *args, **kwargs):
+                if get_role(request.user) != role:
+                    messages.error(request, message)
+                    return redirect(redirect_to)
+                return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,173 @@
+"""
+Write-behind buffer for page-view progress tracking.
+
+Viewing a course page marks it completed and makes it the learner's current
+page. Rather than writing that on every request, views record the event
+here and the buffer writes all pending events in one batch:
+
+* completed pages are inserted into the ``completed_pages`` through table
+  with a single ``bulk_create(ignore_conflicts=True)``;
+* current-page updates are coalesced to the latest page per learner/course
+  and applied with a single UPDATE;
+* page counters and ``completed_at`` are refreshed set-wise afterwards, and
+  progress that has just been completed is issued its certificate.
+
+A batch is flushed when it reaches ``MAX_EVENTS`` events, ``MAX_DELAY``
+seconds after its first event, and at interpreter shutdown. Progress read
+elsewhere (e.g. the My Courses page) can therefore lag by at most
+``MAX_DELAY`` seconds. With ``ENABLED`` off, every event is written
+immediately through the same code path.
+"""
+
+import atexit
+import logging
+import operator
+import threading
+from collections import defaultdict
+from functools import reduce
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Q, Value, When
+from django.utils import timezone
+from . import certificates
+from .models import CourseProgress
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_EVENTS': 500,
+    'MAX_DELAY': 5.0,
+}
+
+
+def get_config():
+    return {**DEFAULTS, **getattr(settings, 'PROGRESS_BUFFER', {})}
+
+
+def write_events(completed, current):
+    """
+    Persist a batch of page views.
+
+    ``completed`` is a set of (learner_id, course_id, coursepage_id) and
+    ``current`` maps (learner_id, course_id) to the latest page viewed.
+    """
+    if not current:
+        return
+    now = timezone.now()
+    # Only the buffered (learner, course) pairs: one term per course, so a batch
+    # doesn't read every progress row of every learner in every course it touches
+    learners_by_course = defaultdict(set)
+    for learner_id, course_id in current:
+        learners_by_course[course_id].add(learner_id)
+    pairs = reduce(operator.or_, (Q(course_id=course_id, learner_id__in=learner_ids)
+                                  for course_id, learner_ids in learners_by_course.items()))
+
+    with transaction.atomic():
+        def load_progress_ids():
+            rows = CourseProgress.objects.filter(pairs).values_list('learner_id', 'course_id', 'pk')
+            return {(learner_id, course_id): pk for learner_id, course_id, pk in rows}
+
+        progress_ids = load_progress_ids()
+        missing = [key for key in current if key not in progress_ids]
+        if missing:
+            CourseProgress.objects.bulk_create([
+                CourseProgress(learner_id=learner_id, course_id=course_id,
+                               current_page_id=current[(learner_id, course_id)], started_at=now)
+                for learner_id, course_id in missing
+            ], ignore_conflicts=True)
+            progress_ids = load_progress_ids()
+
+        Through = CourseProgress.completed_pages.through
+        Through.objects.bulk_create([
+            Through(courseprogress_id=progress_ids[(learner_id, course_id)], coursepage_id=page_id)
+            for learner_id, course_id, page_id in completed
+            if (learner_id, course_id) in progress_ids
+        ], ignore_conflicts=True)
+
+        affected = CourseProgress.objects.filter(pk__in=progress_ids.values())
+        affected.update(
+            current_page_id=Case(
+                *[When(pk=progress_id, then=Value(current[key])) for key, progress_id in progress_ids.items()],
+                output_field=IntegerField(),
+            ),
+            last_updated=now,
+        )
+        affected.refresh_counters()
+        completed_now = list(affected.filter(
+            completed_at__isnull=True,
+            total_page_count__gt=0,
+            completed_page_count__gte=F('total_page_count'),
+        ).values_list('pk', flat=True))
+        if completed_now:
+            CourseProgress.objects.filter(pk__in=completed_now).update(completed_at=now)
+            certificates.issue(completed_now)
+
+
+class ProgressBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._completed = set()
+        self._current = {}
+        self._timer = None
+
+    def record_page_view(self, learner_id, course_id, coursepage_id):
+        """Record that a learner viewed (and so completed) a page"""
+        config = get_config()
+        if not config['ENABLED']:
+            write_events({(learner_id, course_id, coursepage_id)}, {(learner_id, course_id): coursepage_id})
+            return
+
+        with self._lock:
+            self._completed.add((learner_id, course_id, coursepage_id))
+            self._current[(learner_id, course_id)] = coursepage_id
+            full = len(self._completed) >= config['MAX_EVENTS']
+            if not full:
+                self._schedule_flush(config)
+        if full:
+            self.flush()
+
+    def _schedule_flush(self, config):
+        # Called with the lock held
+        if self._timer is None:
+            self._timer = threading.Timer(config['MAX_DELAY'], self._flush_from_timer)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def pending(self):
+        with self._lock:
+            return len(self._completed)
+
+    def flush(self):
+        """Write every pending event now"""
+        with self._lock:
+            completed, current = self._completed, self._current
+            self._completed, self._current = set(), {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not current:
+            return
+        try:
+            write_events(completed, current)
+        except Exception:
+            logger.exception("Failed to flush %d buffered page views; keeping them for the next flush", len(completed))
+            with self._lock:
+                self._completed |= completed
+                for key, page_id in current.items():
+                    self._current.setdefault(key, page_id)
+                self._schedule_flush(get_config())
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        finally:
+            # Timer threads are one-shot; don't leave their connection open
+            connection.close()
+
+
+buffer = ProgressBuffer()
+record_page_view = buffer.record_page_view
+flush = buffer.flush
+
+atexit.register(flush)
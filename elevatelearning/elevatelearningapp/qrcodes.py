@@ -0,0 +1,100 @@
+"""
+Server-side QR code images for course links.
+
+Images are rendered once per URL and format and stored under
+``MEDIA_ROOT/qrcodes/`` with a name derived from a hash of what was
+rendered (URL, format and RENDER_VERSION). A given name therefore always
+holds the same bytes, so nginx can serve ``/media/qrcodes/`` with
+far-future cache headers. MEDIA_ROOT must be shared by every web pod and
+nginx (the ``media-pvc`` volume in k8s, ``media_volume`` in compose).
+"""
+
+import hashlib
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+
+QR_DIR = 'qrcodes'
+FORMATS = ('png', 'svg')
+
+# Bump whenever the rendering below changes so new images get new names
+RENDER_VERSION = 1
+
+
+def image_name(url, fmt):
+    """Path of a QR image relative to MEDIA_ROOT"""
+    digest = hashlib.sha256(f'{RENDER_VERSION}:{fmt}:{url}'.encode()).hexdigest()[:32]
+    return f'{QR_DIR}/{digest}.{fmt}'
+
+
+def image_url(url, fmt):
+    return settings.MEDIA_URL + image_name(url, fmt)
+
+
+def _image_path(url, fmt):
+    return os.path.join(settings.MEDIA_ROOT, image_name(url, fmt))
+
+
+def render(url, fmt):
+    """Render the QR code for ``url`` and return the image bytes"""
+    import qrcode
+    import qrcode.image.svg
+
+    qr = qrcode.QRCode(error_correction=qrcode.constants.ERROR_CORRECT_M, box_size=10, border=2)
+    qr.add_data(url)
+    qr.make(fit=True)
+    if fmt == 'svg':
+        image = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+    else:
+        image = qr.make_image(fill_color='black', back_color='white')
+    with tempfile.SpooledTemporaryFile() as buffer:
+        image.save(buffer)
+        buffer.seek(0)
+        return buffer.read()
+
+
+def _write(url, fmt, media_root):
+    path = os.path.join(media_root, image_name(url, fmt))
+    if os.path.exists(path):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary file and rename so readers never see a partial image
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(render(url, fmt))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return True
+
+
+def _write_all(url, media_root):
+    return sum(_write(url, fmt, media_root) for fmt in FORMATS)
+
+
+def missing_urls(urls):
+    """URLs that don't have every image format on disk yet"""
+    return [url for url in dict.fromkeys(urls)
+            if not all(os.path.exists(_image_path(url, fmt)) for fmt in FORMATS)]
+
+
+def ensure_images(urls, workers=1):
+    """
+    Render any missing images for ``urls``, in this process by default.
+    With ``workers`` above 1, batches larger than QR_RENDER_BATCH_THRESHOLD
+    are spread over a pool of that many processes; only the
+    ``render_qrcodes`` command does that, never a request. Returns the number
+    of image files written.
+    """
+    urls = missing_urls(urls)
+    if not urls:
+        return 0
+    threshold = getattr(settings, 'QR_RENDER_BATCH_THRESHOLD', 20)
+    media_root = str(settings.MEDIA_ROOT)
+    if workers <= 1 or len(urls) <= threshold:
+        return sum(_write_all(url, media_root) for url in urls)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(_write_all, urls, [media_root] * len(urls), chunksize=16))
@@ -0,0 +1,263 @@
+"""
+Inverted index over courses, pages and comments.
+
+Every indexed document (a course's title and description, a page's title
+and body, a comment's text) has one ``SearchPosting`` per distinct token,
+holding how often the token appears with title occurrences counting
+``TITLE_WEIGHT`` times. Signals re-index a document when it is saved, writing
+only the tokens that changed, and drop its postings when it is deleted;
+pages written with bulk_create are indexed by ``bundles.sync_course_pages``.
+
+``search`` ranks courses and pages by TF-IDF over the query's tokens,
+documents matching more of the tokens first. Comment hits count towards
+their page. Archived courses and pages are filtered out at query time;
+archived comments aren't indexed.
+"""
+
+import math
+import os
+import re
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, Count, F, FloatField, IntegerField, Q, Sum, Value, When
+from django.db.models.functions import Ln
+from django.utils.html import strip_tags
+from .models import Course, CourseComment, CoursePage, SearchPosting
+from .pagination import decode_cursor, encode_cursor
+
+TITLE_WEIGHT = 3
+MAX_TOKEN_LENGTH = 64
+MAX_QUERY_TOKENS = 8
+# Deeper result pages aren't worth ranking
+MAX_RESULTS = 500
+
+TOKEN_RE = re.compile(r'\w+')
+STOP_WORDS = frozenset(
+    'a an and are as at be by for from has in is it its of on or that the this to was were will with'.split()
+)
+
+
+def _stem(token):
+    # Plurals match their singular; anything smarter needs a stemmer per language
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    """Lower-cased, de-pluralized word tokens of a text, without stop words and single characters"""
+    return [
+        _stem(token)[:MAX_TOKEN_LENGTH] for token in TOKEN_RE.findall(text.lower())
+        if len(token) > 1 and token not in STOP_WORDS
+    ]
+
+
+def weigh(title, body):
+    """Token -> weighted term frequency for a document's title and body"""
+    weights = Counter()
+    for token in tokenize(title or ''):
+        weights[token] += TITLE_WEIGHT
+    # Page bodies are HTML from the editor
+    weights.update(tokenize(strip_tags(body or '')))
+    return weights
+
+
+def _documents(kind, rows):
+    # rows: (object_id, course_id, course_page_id, title, body)
+    return [(kind, object_id, course_id, page_id, weigh(title, body))
+            for object_id, course_id, page_id, title, body in rows]
+
+
+def _postings(documents):
+    return [
+        SearchPosting(kind=kind, object_id=object_id, course_id=course_id, course_page_id=page_id,
+                      token=token, weight=weight)
+        for kind, object_id, course_id, page_id, weights in documents
+        for token, weight in weights.items()
+    ]
+
+
+def index_document(kind, object_id, course_id, page_id, weights):
+    """Bring one document's postings in line with ``weights``, touching only the tokens that changed"""
+    existing = {token: (pk, weight) for pk, token, weight in SearchPosting.objects.filter(
+        kind=kind, object_id=object_id
+    ).values_list('pk', 'token', 'weight')}
+    stale = [pk for token, (pk, weight) in existing.items() if token not in weights]
+    changed = [SearchPosting(pk=existing[token][0], weight=weight)
+               for token, weight in weights.items() if token in existing and existing[token][1] != weight]
+    new = {token: weight for token, weight in weights.items() if token not in existing}
+    with transaction.atomic():
+        if stale:
+            SearchPosting.objects.filter(pk__in=stale).delete()
+        if changed:
+            SearchPosting.objects.bulk_update(changed, ['weight'])
+        if new:
+            SearchPosting.objects.bulk_create(_postings([(kind, object_id, course_id, page_id, new)]),
+                                              ignore_conflicts=True)
+
+
+def remove_document(kind, object_id):
+    SearchPosting.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def index_course(course):
+    index_document('course', course.course_id, course.course_id, None, weigh(course.title, course.description))
+
+
+def index_page(page):
+    index_document('page', page.coursepage_id, page.course_id, page.coursepage_id,
+                   weigh(page.page_title, page.page_description))
+
+
+def index_comment(comment):
+    if comment.is_archived:
+        remove_document('comment', comment.pk)
+        return
+    if CourseComment.course_page.is_cached(comment):
+        course_id = comment.course_page.course_id
+    else:
+        course_id = CoursePage.all_objects.filter(pk=comment.course_page_id).values_list('course_id', flat=True).first()
+    index_document('comment', comment.pk, course_id, comment.course_page_id, weigh('', comment.text))
+
+
+# Rows each kind of document is indexed from: (object_id, course_id, course_page_id, title, body)
+SOURCES = {
+    'course': lambda: Course.all_objects.annotate(page=Value(None, output_field=IntegerField())).values_list(
+        'pk', 'pk', 'page', 'title', 'description'),
+    'page': lambda: CoursePage.all_objects.values_list(
+        'pk', 'course_id', 'pk', 'page_title', 'page_description'),
+    'comment': lambda: CourseComment.objects.annotate(title=Value('')).values_list(
+        'pk', 'course_page__course_id', 'course_page_id', 'title', 'text'),
+}
+
+
+def index_new(course_ids):
+    """Index the courses and pages among ``course_ids`` that have no postings yet, e.g. after bulk_create"""
+    for kind in ('course', 'page'):
+        indexed = SearchPosting.objects.filter(kind=kind, course_id__in=course_ids).values('object_id')
+        rows = SOURCES[kind]().filter(course_id__in=course_ids).exclude(pk__in=indexed)
+        SearchPosting.objects.bulk_create(_postings(_documents(kind, rows)), batch_size=1000,
+                                          ignore_conflicts=True)
+
+
+def _weigh_batch(kind, rows):
+    # Runs in a worker process; returns plain tuples, which pickle cheaply
+    return [(kind, object_id, course_id, page_id, dict(weights))
+            for kind, object_id, course_id, page_id, weights in _documents(kind, rows)]
+
+
+def _batches(queryset, batch_size):
+    # Keyset over the primary key, so deep batches don't scan skipped rows
+    last = None
+    while True:
+        rows = list((queryset.filter(pk__gt=last) if last is not None else queryset).order_by('pk')[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+def rebuild(batch_size=500, workers=None, on_progress=None):
+    """
+    Re-index every course, page and comment from scratch.
+
+    Rows are read in batches of ``batch_size`` and tokenized by ``workers``
+    processes (one per CPU by default; 1 tokenizes in this process) while
+    this process writes the postings. Search results are incomplete until it
+    finishes. ``on_progress(kind, documents, postings)`` is called after
+    every batch. Returns the number of postings written.
+    """
+    workers = workers or os.cpu_count() or 1
+    SearchPosting.objects.all().delete()
+    cache.delete(_DOCUMENT_COUNT_KEY)
+    written = 0
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for kind, source in SOURCES.items():
+            done = 0
+            pending = deque()
+
+            def write(documents):
+                nonlocal done, written
+                postings = _postings(documents)
+                SearchPosting.objects.bulk_create(postings, batch_size=1000)
+                done += len(documents)
+                written += len(postings)
+                if on_progress:
+                    on_progress(kind, done, written)
+
+            for rows in _batches(source(), batch_size):
+                if executor is None:
+                    write(_weigh_batch(kind, rows))
+                    continue
+                pending.append(executor.submit(_weigh_batch, kind, rows))
+                # Keep a couple of batches per worker in flight, not the whole table
+                while len(pending) > workers * 2:
+                    write(pending.popleft().result())
+            while pending:
+                write(pending.popleft().result())
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return written
+
+
+_DOCUMENT_COUNT_KEY = 'search:document-count'
+
+
+def document_count():
+    """Indexed documents, for IDF; cached because it counts whole tables"""
+    return cache.get_or_set(_DOCUMENT_COUNT_KEY, lambda: (
+        Course.all_objects.count() + CoursePage.all_objects.count() + CourseComment.objects.count()
+    ), 3600)
+
+
+def search(query, cursor=None, limit=20):
+    """
+    One page of courses and pages matching ``query``, best first, and the
+    cursor for the next page (None when there are no more).
+
+    Each result is a dict with ``course``, ``page`` (None for course
+    results) and ``score``.
+    """
+    tokens = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TOKENS]
+    offset = (decode_cursor(cursor, int) or (0,))[0]
+    if not tokens or offset >= MAX_RESULTS:
+        return [], None
+
+    documents = max(document_count(), 1)
+    frequencies = dict(SearchPosting.objects.filter(token__in=tokens).values_list('token').annotate(n=Count('*'))
+                       .order_by())
+    tokens = [token for token in tokens if token in frequencies]
+    if not tokens:
+        return [], None
+    idf = {token: math.log(1 + documents / frequencies[token]) for token in tokens}
+
+    # Sub-linear term frequency, so a long body repeating a word doesn't swamp a title match
+    score = Sum(Case(
+        *(When(token=token, then=Ln(F('weight') + 1.0) * Value(idf[token])) for token in tokens),
+        output_field=FloatField(),
+    ))
+    rows = list(
+        SearchPosting.objects.filter(token__in=tokens, course__is_archived=False)
+        .filter(Q(course_page__isnull=True) | Q(course_page__is_archived=False))
+        .values('course_id', 'course_page_id')
+        .annotate(matched=Count('token', distinct=True), score=score)
+        .order_by('-matched', '-score', 'course_id', 'course_page_id')
+        [offset:offset + limit + 1]
+    )
+    next_cursor = encode_cursor(offset + limit) if len(rows) > limit and offset + limit < MAX_RESULTS else None
+    rows = rows[:limit]
+
+    courses = Course.objects.only('title', 'description', 'category').in_bulk({row['course_id'] for row in rows})
+    pages = CoursePage.objects.only('page_title', 'course_id').in_bulk(
+        {row['course_page_id'] for row in rows if row['course_page_id']}
+    )
+    results = [{
+        'course': courses[row['course_id']],
+        'page': pages.get(row['course_page_id']),
+        'score': round(row['score'], 4),
+    } for row in rows if row['course_id'] in courses]
+    return results, next_cursor
@@ -0,0 +1,207 @@
+"""
+Synthetic datasets for benchmarking.
+
+``seed`` writes educators, courses, pages, learners, enrollments, progress,
+likes/shares, comments and certificates with bulk inserts, in batches, so that datasets of
+millions of rows can be built in minutes. Derived data that signals would
+normally maintain (page stats, manifests, progress counters) is written or
+resynced explicitly.
+
+Every user gets the password ``SEED_PASSWORD``. Rows are generated from a
+seeded RNG, so the same arguments give the same dataset shape.
+"""
+
+import random
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from . import certificates
+from .bundles import sync_course_pages
+from .models import (Course, CourseComment, CourseInteraction, CoursePage, CoursePageStats,
+                     CourseProgress, UserDetail)
+
+SEED_PASSWORD = 'benchmark'
+
+WORDS = (
+    'learning design module practice review concept example project lesson theory data model '
+    'system method analysis result build test deploy structure pattern skill step guide idea '
+    'problem solution question answer topic course reading exercise summary detail overview'
+).split()
+
+
+def _text(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize() + '.'
+
+
+def _new_pks(model, after_pk):
+    # bulk_create doesn't return primary keys on MySQL, so read back the new id range
+    return list(model._base_manager.filter(pk__gt=after_pk).order_by('pk').values_list('pk', flat=True))
+
+
+def _max_pk(model):
+    return model._base_manager.aggregate(highest=Max('pk'))['highest'] or 0
+
+
+def _create_users(prefix, role, start, count, password, rng):
+    after = _max_pk(User)
+    User.objects.bulk_create([
+        User(username=f'{prefix}-{role}-{n}@example.com', email=f'{prefix}-{role}-{n}@example.com',
+             first_name=rng.choice(WORDS).capitalize(), last_name=rng.choice(WORDS).capitalize(),
+             password=password)
+        for n in range(start, start + count)
+    ])
+    user_ids = _new_pks(User, after)
+    UserDetail.objects.bulk_create([
+        UserDetail(user_id=user_id, firstname=role.capitalize(), surname=str(user_id),
+                   role=role, email=f'{prefix}-{role}-{n}@example.com')
+        for n, user_id in zip(range(start, start + count), user_ids)
+    ])
+    return user_ids
+
+
+def seed(courses=100, pages_per_course=10, learners=1000, educators=None, enrollments_per_learner=5,
+         completion=0.5, interaction_rate=0.2, comment_rate=0.05, words_per_page=200,
+         prefix='bench', batch_size=2000, random_seed=0, on_progress=None):
+    """
+    Seed a synthetic dataset and return the number of rows written per model.
+
+    ``completion`` is the mean fraction of an enrolled course's pages a
+    learner has completed; ``interaction_rate`` and ``comment_rate`` are the
+    chances that a completed page was liked (and maybe shared) or commented on.
+    ``on_progress(stage, done, total)`` is called after every batch.
+    """
+    if User.objects.filter(username__startswith=f'{prefix}-').exists():
+        raise ValueError(f"Users with the prefix '{prefix}' already exist; pick another prefix.")
+
+    rng = random.Random(random_seed)
+    password = make_password(SEED_PASSWORD)
+    now = timezone.now()
+    educators = educators or max(1, courses // 10)
+    counts = dict.fromkeys(['educators', 'courses', 'pages', 'learners', 'enrollments', 'progress',
+                            'completed_pages', 'interactions', 'comments'], 0)
+
+    def report(stage, done, total):
+        if on_progress:
+            on_progress(stage, done, total)
+
+    educator_ids = []
+    for start in range(0, educators, batch_size):
+        with transaction.atomic():
+            educator_ids += _create_users(prefix, 'educator', start, min(batch_size, educators - start),
+                                          password, rng)
+        report('educators', len(educator_ids), educators)
+    counts['educators'] = len(educator_ids)
+
+    # Page ids of every seeded course, in page order
+    course_pages = {}
+    categories = [choice for choice, label in Course.CATEGORY_CHOICES]
+    course_batch = max(1, batch_size // pages_per_course) if pages_per_course else batch_size
+    for start in range(0, courses, course_batch):
+        size = min(course_batch, courses - start)
+        with transaction.atomic():
+            after = _max_pk(Course)
+            Course.objects.bulk_create([
+                Course(title=f'{prefix.capitalize()} course {n}: {_text(rng, 3)[:-1]}',
+                       description=_text(rng, 40), creator_id=rng.choice(educator_ids),
+                       category=rng.choice(categories),
+                       created_date=now - timedelta(days=rng.randint(0, 365)))
+                for n in range(start, start + size)
+            ])
+            course_ids = _new_pks(Course, after)
+            after = _max_pk(CoursePage)
+            CoursePage.objects.bulk_create([
+                CoursePage(course_id=course_id, page_no=page_no, page_title=_text(rng, 4)[:-1],
+                           page_description='\n\n'.join(_text(rng, words_per_page // 4) for _ in range(4)))
+                for course_id in course_ids
+                for page_no in range(1, pages_per_course + 1)
+            ])
+            for course_id in course_ids:
+                course_pages[course_id] = []
+            for page_id, course_id in CoursePage.objects.filter(pk__gt=after).order_by(
+                'course_id', 'page_no'
+            ).values_list('pk', 'course_id'):
+                course_pages[course_id].append(page_id)
+            sync_course_pages(course_ids)
+        counts['courses'] += size
+        counts['pages'] += size * pages_per_course
+        report('courses', counts['courses'], courses)
+
+    all_course_ids = list(course_pages)
+    enrollments_per_learner = min(enrollments_per_learner, len(all_course_ids))
+    Enrollment = Course.learners.through
+    Completion = CourseProgress.completed_pages.through
+    learner_batch = max(1, batch_size // max(1, enrollments_per_learner))
+    for start in range(0, learners, learner_batch):
+        size = min(learner_batch, learners - start)
+        with transaction.atomic():
+            learner_ids = _create_users(prefix, 'learner', start, size, password, rng)
+            enrollments = [(learner_id, course_id) for learner_id in learner_ids
+                           for course_id in rng.sample(all_course_ids, enrollments_per_learner)]
+            Enrollment.objects.bulk_create([
+                Enrollment(user_id=learner_id, course_id=course_id) for learner_id, course_id in enrollments
+            ], batch_size=batch_size)
+
+            # How far each learner got through each course
+            progress = []
+            completed = {}
+            started_at = {}
+            for learner_id, course_id in enrollments:
+                pages = course_pages[course_id]
+                done = min(len(pages), int(rng.expovariate(1 / max(completion, 0.01)) * len(pages)))
+                completed[(learner_id, course_id)] = pages[:done]
+                started = now - timedelta(days=rng.randint(0, 180))
+                started_at[(learner_id, course_id)] = started
+                progress.append(CourseProgress(
+                    learner_id=learner_id, course_id=course_id,
+                    current_page_id=pages[min(done, len(pages) - 1)] if pages else None,
+                    completed_page_count=done, total_page_count=len(pages), started_at=started,
+                    completed_at=started + timedelta(days=rng.randint(0, 30)) if pages and done == len(pages) else None,
+                ))
+            after = _max_pk(CourseProgress)
+            CourseProgress.objects.bulk_create(progress, batch_size=batch_size)
+            progress_ids = {
+                (learner_id, course_id): pk for learner_id, course_id, pk in
+                CourseProgress.objects.filter(pk__gt=after).values_list('learner_id', 'course_id', 'pk')
+            }
+            # A page a day from the start, so the daily rollups have a history
+            completions = [Completion(courseprogress_id=progress_ids[key], coursepage_id=page_id,
+                                      completed_at=min(started_at[key] + timedelta(days=index), now))
+                           for key, page_ids in completed.items() for index, page_id in enumerate(page_ids)]
+            Completion.objects.bulk_create(completions, batch_size=batch_size)
+            certificates.issue([progress_ids[key] for key, page_ids in completed.items()
+                                if page_ids and len(page_ids) == len(course_pages[key[1]])])
+
+            interactions = []
+            comments = []
+            for (learner_id, course_id), page_ids in completed.items():
+                for page_id in page_ids:
+                    if rng.random() < interaction_rate:
+                        shared = rng.random() < 0.3
+                        interactions.append(CourseInteraction(
+                            course_page_id=page_id, user_id=learner_id, liked=True, shared=shared,
+                            liked_at=now, shared_at=now if shared else None
+                        ))
+                    if rng.random() < comment_rate:
+                        comments.append(CourseComment(course_page_id=page_id, user_id=learner_id,
+                                                      text=_text(rng, rng.randint(5, 40))))
+            CourseInteraction.objects.bulk_create(interactions, batch_size=batch_size, ignore_conflicts=True)
+            CourseComment.objects.bulk_create(comments, batch_size=batch_size)
+
+        counts['learners'] += size
+        counts['enrollments'] += len(enrollments)
+        counts['progress'] += len(progress)
+        counts['completed_pages'] += len(completions)
+        counts['interactions'] += len(interactions)
+        counts['comments'] += len(comments)
+        report('learners', counts['learners'], learners)
+
+    # bulk_create skipped the signals that keep the engagement counters in step
+    page_ids = [page_id for pages in course_pages.values() for page_id in pages]
+    for start in range(0, len(page_ids), batch_size):
+        with transaction.atomic():
+            CoursePageStats.objects.filter(course_page_id__in=page_ids[start:start + batch_size]).refresh_counts()
+        report('page stats', min(start + batch_size, len(page_ids)), len(page_ids))
+    return counts
@@ -0,0 +1,192 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from . import fragments, profiles, search
+from .models import UserDetail, Course, CourseComment, CourseInteraction, CourseManifest, CoursePage, CoursePageStats, CourseProgress
+
+
+# Keep CourseProgress.completed_page_count / total_page_count in step with
+# completed_pages and the course's unarchived pages. Every change is a single
+# UPDATE issued inside the transaction that made the change.
+
+@receiver(m2m_changed, sender=CourseProgress.completed_pages.through)
+def completed_pages_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # page.completed_by.add(...) / .remove(...): pk_set holds progress ids.
+        # A reverse clear() doesn't report which rows it touched.
+        progress = CourseProgress.objects.filter(course_id=instance.course_id)
+        if action != 'post_clear':
+            progress = progress.filter(pk__in=pk_set or ())
+    else:
+        progress = CourseProgress.objects.filter(pk=instance.pk)
+    progress.refresh_counters()
+
+    if not reverse:
+        instance.refresh_counters_from_db()
+
+
+@receiver(post_save, sender=CoursePage)
+def course_page_created(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        if not instance.is_archived:
+            CourseProgress.objects.filter(course_id=instance.course_id).update(
+                total_page_count=F('total_page_count') + 1
+            )
+    elif getattr(instance, '_saved_archived', None) != instance.is_archived:
+        # Archived or restored (or we don't know which); recount the course
+        CourseProgress.objects.filter(course_id=instance.course_id).refresh_counters()
+    instance._saved_archived = instance.is_archived
+
+
+@receiver(pre_delete, sender=CoursePage)
+def course_page_deleting(sender, instance, **kwargs):
+    # The completed_pages rows go away with the page without an m2m_changed
+    # signal, so take them off the completed counters here.
+    if not instance.is_archived:
+        CourseProgress.objects.filter(completed_pages=instance, completed_page_count__gt=0).update(
+            completed_page_count=F('completed_page_count') - 1
+        )
+
+
+@receiver(post_delete, sender=CoursePage)
+def course_page_deleted(sender, instance, **kwargs):
+    if not instance.is_archived:
+        CourseProgress.objects.filter(course_id=instance.course_id, total_page_count__gt=0).update(
+            total_page_count=F('total_page_count') - 1
+        )
+
+
+# Engagement counters on CoursePageStats, applied as atomic F() increments.
+
+@receiver(post_save, sender=CoursePage)
+def course_page_stats_created(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        CoursePageStats.objects.get_or_create(course_page=instance)
+
+
+@receiver(post_save, sender=CourseInteraction)
+def course_interaction_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = (False, False) if created else getattr(instance, '_saved_flags', None)
+    current = instance.counted_flags()
+    if previous is None:
+        # We don't know what was stored before this save; recount the page
+        CoursePageStats.ensure_for_pages([instance.course_page_id])
+    else:
+        CoursePageStats.bump(
+            instance.course_page_id,
+            like_count=int(current[0]) - int(previous[0]),
+            share_count=int(current[1]) - int(previous[1]),
+        )
+    instance._saved_flags = current
+
+
+@receiver(post_delete, sender=CourseInteraction)
+def course_interaction_deleted(sender, instance, **kwargs):
+    # Deletes also cascade from the page, so never recreate a missing stats row here
+    liked, shared = instance.counted_flags()
+    CoursePageStats.bump(
+        instance.course_page_id,
+        create_missing=False,
+        like_count=-int(liked),
+        share_count=-int(shared),
+    )
+
+
+@receiver(post_save, sender=CourseComment)
+def course_comment_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    # A new comment counts like one restored from the archive
+    previous = True if created else getattr(instance, '_saved_archived', None)
+    if previous is None:
+        # We don't know whether the comment was archived before this save; recount the page
+        CoursePageStats.ensure_for_pages([instance.course_page_id])
+    elif previous != instance.is_archived:
+        CoursePageStats.bump(instance.course_page_id, comment_count=1 if previous else -1)
+    instance._saved_archived = instance.is_archived
+
+
+@receiver(post_delete, sender=CourseComment)
+def course_comment_deleted(sender, instance, **kwargs):
+    if not instance.is_archived:
+        CoursePageStats.bump(instance.course_page_id, create_missing=False, comment_count=-1)
+
+
+# Course navigation manifest, patched in place as pages change.
+
+@receiver(post_save, sender=CoursePage)
+def course_page_manifest_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        CourseManifest.patch_page(instance)
+
+
+@receiver(post_delete, sender=CoursePage)
+def course_page_manifest_deleted(sender, instance, **kwargs):
+    CourseManifest.remove_page(instance.course_id, instance.coursepage_id)
+
+
+# Rendered page fragments (see fragments.py). Invalidated once the change is
+# committed, so a request can't re-cache the old page in between.
+
+@receiver(post_save, sender=CoursePage)
+@receiver(post_delete, sender=CoursePage)
+def course_page_fragments_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        page_id = instance.coursepage_id
+        transaction.on_commit(lambda: fragments.invalidate_page(page_id))
+
+
+@receiver(post_save, sender=CourseComment)
+@receiver(post_delete, sender=CourseComment)
+def course_comment_fragments_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        page_id = instance.course_page_id
+        transaction.on_commit(lambda: fragments.invalidate_page(page_id))
+
+
+# Users cached with their details (see profiles.py).
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    profiles.invalidate_user(instance.pk)
+
+
+@receiver(post_save, sender=UserDetail)
+@receiver(post_delete, sender=UserDetail)
+def user_detail_changed(sender, instance, **kwargs):
+    profiles.invalidate_user(instance.user_id)
+
+
+# Search index (see search.py). Deleting a course or page cascades to its postings.
+
+@receiver(post_save, sender=Course)
+def course_search_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_course(instance)
+
+
+@receiver(post_save, sender=CoursePage)
+def course_page_search_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_page(instance)
+
+
+@receiver(post_save, sender=CourseComment)
+def course_comment_search_changed(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_comment(instance)
+
+
+@receiver(post_delete, sender=CourseComment)
+def course_comment_search_deleted(sender, instance, **kwargs):
+    search.remove_document('comment', instance.pk)
@@ -1,3 +1,1233 @@
-from django.test import TestCase
+import base64
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .backends.mysqlpool.pool import ConnectionPool, PoolTimeout
+from .metrics import sql_shape
+from .pagination import decode_cursor, encode_cursor
+from .archiving import set_archived
+from .models import (Certificate, Course, CourseComment, CourseInteraction, CourseManifest, CoursePage, CoursePageStats,
+                     CourseProgress, PageCompletion, QRcode, SearchPosting, UserDetail)
+from . import (analytics, async_db, bundles, certificates, enrollment, exports, fragments, jobs, metrics,
+               ordering, profiles, progress_buffer, search, seeding)
 
-# Create your tests here.
+SMALL = {'courses': 2, 'pages_per_course': 2, 'learners': 2}
+LARGE = {'courses': 6, 'pages_per_course': 5, 'learners': 6}
+
+
+def seed(prefix, scale):
+    # One educator owning every course and learners enrolled in all of them,
+    # so per-user data (enrollments, pages, comments, likes) grows with the scale
+    seeding.seed(
+        educators=1, enrollments_per_learner=scale['courses'], completion=1.0,
+        interaction_rate=1.0, comment_rate=1.0, words_per_page=20, prefix=prefix, **scale
+    )
+
+
+def create_qrcodes():
+    QRcode.objects.bulk_create([
+        QRcode(course_id=course_id, qrcode_url=f'http://testserver/elevatelearning/continue/{course_id}/')
+        for course_id in Course.objects.values_list('pk', flat=True)
+    ], ignore_conflicts=True)
+
+
+@override_settings(
+    PROGRESS_BUFFER={'ENABLED': False},
+    METRICS={'ENABLED': True, 'SAMPLE_RATE': 0},
+    ASYNC_CONCURRENT_QUERIES=False,
+)
+class SeededTestCase(TestCase):
+    """The small dataset, an admin, and MEDIA_ROOT in a temporary directory"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.media_root = tempfile.mkdtemp()
+        cls.media_override = override_settings(MEDIA_ROOT=cls.media_root)
+        cls.media_override.enable()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.media_override.disable()
+        shutil.rmtree(cls.media_root, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        seed('small', SMALL)
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+
+    def setUp(self):
+        caches['default'].clear()
+
+
+class QueryBudgetTests(SeededTestCase):
+    """
+    Every view must run the same number of queries however much data it
+    shows. Each test requests a view for a small dataset, then for a larger
+    one, and fails listing the SQL shapes whose count grew.
+    """
+
+    def capture(self, user, url):
+        """SQL run by a cold request (caches empty, rows created lazily) and by a warm one"""
+        caches['default'].clear()
+        self.client.force_login(user)
+        runs = []
+        for attempt in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertLess(response.status_code, 400, f"{url} returned {response.status_code}")
+            runs.append([query['sql'] for query in queries.captured_queries])
+        return runs
+
+    def assertConstantQueries(self, small_runs, large_runs):
+        for run, small, large in zip(('cold', 'warm'), small_runs, large_runs):
+            if len(small) == len(large):
+                continue
+            small_shapes, large_shapes = Counter(map(sql_shape, small)), Counter(map(sql_shape, large))
+            grown = [f"  {small_shapes[shape]} -> {count} x {shape}"
+                     for shape, count in large_shapes.items() if count > small_shapes[shape]]
+            self.fail(f"{run} request ran {len(small)} queries on the small dataset and {len(large)} "
+                      f"on the large one; repeated queries:\n" + '\n'.join(grown))
+
+    def assertLearnerViewConstant(self, url_for):
+        """``url_for(learner)`` builds the URL to request as that learner"""
+        small_learner = User.objects.get(username='small-learner-0@example.com')
+        small_runs = self.capture(small_learner, url_for(small_learner))
+        seed('large', LARGE)
+        large_learner = User.objects.get(username='large-learner-0@example.com')
+        self.assertConstantQueries(small_runs, self.capture(large_learner, url_for(large_learner)))
+
+    def assertEducatorViewConstant(self, url_for):
+        small_educator = User.objects.get(username='small-educator-0@example.com')
+        small_runs = self.capture(small_educator, url_for(small_educator))
+        seed('large', LARGE)
+        large_educator = User.objects.get(username='large-educator-0@example.com')
+        self.assertConstantQueries(small_runs, self.capture(large_educator, url_for(large_educator)))
+
+    def assertAdminViewConstant(self, url):
+        create_qrcodes()
+        small_runs = self.capture(self.admin, url)
+        seed('large', LARGE)
+        create_qrcodes()
+        self.assertConstantQueries(small_runs, self.capture(self.admin, url))
+
+    def test_mycourse(self):
+        self.assertLearnerViewConstant(lambda learner: reverse('mycourse'))
+
+    def test_qrgen(self):
+        self.assertLearnerViewConstant(lambda learner: reverse('qrgen'))
+
+    def test_coursepage(self):
+        def busiest_page(learner):
+            page = CoursePage.objects.filter(course__learners=learner).order_by('-stats__comment_count').first()
+            return reverse('coursepage', args=[page.pk])
+        self.assertLearnerViewConstant(busiest_page)
+
+    def test_page_comments(self):
+        def busiest_page(learner):
+            page = CoursePage.objects.filter(course__learners=learner).order_by('-stats__comment_count').first()
+            return reverse('page_comments', args=[page.pk])
+        self.assertLearnerViewConstant(busiest_page)
+
+    def test_catalog(self):
+        self.assertLearnerViewConstant(lambda learner: f"{reverse('catalog')}?not_enrolled=1")
+
+    def test_search(self):
+        self.assertLearnerViewConstant(lambda learner: f"{reverse('search')}?q={seeding.WORDS[0]}+{seeding.WORDS[1]}")
+
+    def test_createdcourses(self):
+        self.assertEducatorViewConstant(lambda educator: reverse('createdcourses'))
+
+    def test_addpage(self):
+        def largest_course(educator):
+            return reverse('addpage', args=[educator.created_courses.order_by('-manifest__page_count').first().pk])
+        self.assertEducatorViewConstant(largest_course)
+
+    def test_course_analytics(self):
+        def aggregated_course(educator):
+            analytics.aggregate(since=analytics.first_event())
+            course = educator.created_courses.order_by('-manifest__page_count').first()
+            return reverse('course_analytics', args=[course.pk])
+        self.assertEducatorViewConstant(aggregated_course)
+
+    def test_warm_request_authenticates_without_queries(self):
+        # The session, the user and its details all come from the cache
+        learner = User.objects.get(username='small-learner-0@example.com')
+        cold, warm = self.capture(learner, reverse('dashboard'))
+        tables = ('"auth_user"', '"elevatelearningapp_userdetail"', '"django_session"')
+        self.assertEqual([sql for sql in warm if any(table in sql for table in tables)], [])
+
+    def test_admin_coursepagestats_changelist(self):
+        self.assertAdminViewConstant(reverse('admin:elevatelearningapp_coursepagestats_changelist'))
+
+    def test_admin_course_changelist(self):
+        self.assertAdminViewConstant(reverse('admin:elevatelearningapp_course_changelist'))
+
+    def test_admin_coursepage_changelist(self):
+        self.assertAdminViewConstant(reverse('admin:elevatelearningapp_coursepage_changelist'))
+
+    def test_admin_qrcode_changelist(self):
+        self.assertAdminViewConstant(reverse('admin:elevatelearningapp_qrcode_changelist'))
+
+    def test_admin_courseprogress_changelist(self):
+        self.assertAdminViewConstant(reverse('admin:elevatelearningapp_courseprogress_changelist'))
+
+    def test_admin_courseinteraction_changelist(self):
+        self.assertAdminViewConstant(reverse('admin:elevatelearningapp_courseinteraction_changelist'))
+
+    def test_admin_coursecomment_changelist(self):
+        self.assertAdminViewConstant(reverse('admin:elevatelearningapp_coursecomment_changelist'))
+
+    def test_admin_certificate_changelist(self):
+        self.assertAdminViewConstant(reverse('admin:elevatelearningapp_certificate_changelist'))
+
+    def test_admin_user_changelist(self):
+        self.assertAdminViewConstant(reverse('admin:auth_user_changelist'))
+
+
+class ProfileCacheTests(SeededTestCase):
+    """Cached users follow changes to their profile"""
+
+    def test_profile_change_reaches_cached_user(self):
+        learner = User.objects.get(username='small-learner-0@example.com')
+        self.client.force_login(learner)
+        # Caches the user and its details
+        self.assertEqual(self.client.get(reverse('mycourse')).status_code, 200)
+        learner.userdetail.role = 'educator'
+        learner.userdetail.save()
+        self.assertRedirects(self.client.get(reverse('mycourse')), reverse('dashboard'), fetch_redirect_response=False)
+
+    def test_cache_holds_no_password_hash(self):
+        learner = User.objects.get(username='small-learner-0@example.com')
+        self.client.force_login(learner)
+        self.assertEqual(self.client.get(reverse('mycourse')).status_code, 200)
+        cached = caches['default'].get(profiles._key(learner.pk))
+        self.assertNotIn(learner.password, repr(cached))
+        # A warm request still passes the session check with the cached user
+        response = self.client.get(reverse('mycourse'))
+        self.assertEqual((response.status_code, response.wsgi_request.user.pk), (200, learner.pk))
+
+    def test_password_change_ends_other_sessions(self):
+        learner = User.objects.get(username='small-learner-0@example.com')
+        self.client.force_login(learner)
+        self.assertEqual(self.client.get(reverse('mycourse')).status_code, 200)
+        cached_user = profiles.load_user(learner.pk)
+        cached_user.set_password('changed')
+        cached_user.save()
+        self.assertFalse(self.client.get(reverse('mycourse')).wsgi_request.user.is_authenticated)
+
+
+class ArchivingTests(SeededTestCase):
+    """Archiving keeps counters and manifests in step"""
+
+    def test_archived_page_leaves_counters_and_manifest(self):
+        page = CoursePage.objects.filter(completed_by__isnull=False).order_by('pk').first()
+        progress = CourseProgress.objects.filter(completed_pages=page).order_by('pk')
+        totals = list(progress.values_list('completed_page_count', 'total_page_count'))
+        page.is_archived = True
+        page.save()
+        self.assertFalse(CoursePage.objects.filter(pk=page.pk).exists())
+        self.assertNotIn(page.pk, [entry[0] for entry in CourseManifest.for_course(page.course_id).pages])
+        self.assertEqual(list(progress.values_list('completed_page_count', 'total_page_count')),
+                         [(completed - 1, total - 1) for completed, total in totals])
+        set_archived(CoursePage.all_objects.filter(pk=page.pk), False)
+        self.assertIn(page.pk, [entry[0] for entry in CourseManifest.for_course(page.course_id).pages])
+        self.assertEqual(list(progress.values_list('completed_page_count', 'total_page_count')), totals)
+
+    def test_like_and_share_restore_an_archived_interaction(self):
+        interaction = CourseInteraction.objects.filter(liked=True, shared=True).order_by('pk').first()
+        set_archived(CourseInteraction.objects.filter(pk=interaction.pk), True)
+        stats = CoursePageStats.objects.filter(course_page_id=interaction.course_page_id)
+        counts = stats.values_list('like_count', 'share_count').get()
+        self.client.force_login(interaction.user)
+        self.client.post(reverse('toggle_like', args=[interaction.course_page_id]))
+        # Comes back as a fresh interaction: liked by this click, not shared by the archived one
+        interaction.refresh_from_db()
+        self.assertEqual((interaction.is_archived, interaction.liked, interaction.shared), (False, True, False))
+        self.assertEqual(stats.values_list('like_count', 'share_count').get(), (counts[0] + 1, counts[1]))
+        set_archived(CourseInteraction.objects.filter(pk=interaction.pk), True)
+        self.client.post(reverse('record_share', args=[interaction.course_page_id]))
+        interaction.refresh_from_db()
+        self.assertEqual((interaction.is_archived, interaction.liked, interaction.shared), (False, False, True))
+        self.assertEqual(stats.values_list('like_count', 'share_count').get(), (counts[0], counts[1] + 1))
+
+
+class AnalyticsRollupTests(SeededTestCase):
+    """Daily rollups agree with the tables they count"""
+
+    def test_rollups_match_source_tables(self):
+        analytics.aggregate(since=analytics.first_event())
+        course = Course.objects.order_by('pk').first()
+        totals = analytics.totals(course.pk)
+        self.assertEqual(totals['enrollments'], CourseProgress.objects.filter(course=course).count())
+        self.assertEqual(totals['page_completions'], PageCompletion.objects.filter(coursepage__course=course).count())
+        self.assertEqual(totals['comments'], CourseComment.objects.filter(course_page__course=course).count())
+        steps = analytics.funnel(course.pk, totals['enrollments'])
+        self.assertEqual([step['completed'] for step in steps],
+                         [PageCompletion.objects.filter(coursepage_id=step['page'].coursepage_id).count()
+                          for step in steps])
+
+    def test_likes_and_shares_count_on_the_day_they_happen(self):
+        interaction = CourseInteraction.objects.filter(shared=False).order_by('pk').first()
+        course_id = interaction.course_page.course_id
+        week_ago = timezone.now() - timedelta(days=7)
+        CourseInteraction.objects.filter(pk=interaction.pk).update(created_at=week_ago, liked=False, liked_at=None)
+        interaction.refresh_from_db()
+        interaction.liked = interaction.shared = True
+        interaction.save(update_fields=['liked', 'shared'])
+        analytics.aggregate(since=week_ago)
+        today, then = timezone.localdate(), timezone.localdate(week_ago)
+        series = {row['day']: row for row in analytics.daily_series(course_id, then, today)}
+        expected = CourseInteraction.objects.filter(course_page__course_id=course_id, liked_at__date=today)
+        self.assertEqual((series[today]['likes'], series[today]['shares']),
+                         (expected.count(), expected.filter(shared=True).count()))
+        self.assertEqual((series[then]['likes'], series[then]['shares']), (0, 0))
+        # Withdrawing the like clears its time, so it no longer counts
+        interaction.liked = False
+        interaction.save(update_fields=['liked'])
+        interaction.refresh_from_db()
+        self.assertIsNone(interaction.liked_at)
+        self.assertIsNotNone(interaction.shared_at)
+
+
+class CourseDeletionJobTests(SeededTestCase):
+    """Courses are hidden at once and deleted by a background job"""
+
+    @override_settings(JOBS={'CHUNK_SIZE': 2})
+    def test_course_deletion_job(self):
+        course = Course.objects.order_by('pk').first()
+        job = jobs.delete_courses_later(Course.objects.filter(pk=course.pk))
+        self.assertFalse(Course.objects.filter(pk=course.pk).exists())
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress_done), ('done', job.progress_total))
+        self.assertFalse(Course.all_objects.filter(pk=course.pk).exists())
+        self.assertFalse(CoursePage.all_objects.filter(course_id=course.pk).exists())
+        self.assertFalse(CourseProgress.objects.filter(course_id=course.pk).exists())
+
+    def test_deletion_steps_cover_every_child_table(self):
+        # Anything left to the final cascade is deleted in one statement, however many rows it has
+        stepped = {queryset.model for queryset, raw in jobs._course_rows([0])}
+        for parent in (Course, CoursePage, CourseProgress):
+            for relation in parent._meta.related_objects:
+                if not relation.one_to_one:
+                    self.assertIn(relation.related_model, stepped, relation)
+
+
+class CertificateTests(SeededTestCase):
+    """Certificates are issued once per completion and rendered in the background"""
+
+    def test_certificates_issued_once_and_rendered(self):
+        completed = CourseProgress.objects.filter(completed_at__isnull=False)
+        self.assertEqual(Certificate.objects.count(), completed.count())
+        with self.captureOnCommitCallbacks(execute=True):
+            certificates.issue(completed.values_list('pk', flat=True))
+        self.assertEqual(Certificate.objects.count(), completed.count())
+        self.assertEqual(jobs.run_pending(), 1)
+        certificate = Certificate.objects.order_by('pk').first()
+        self.assertTrue(os.path.exists(os.path.join(self.media_root, certificates.artifact_name(
+            certificate.artifact_digest, 'pdf'))))
+        response = self.client.get(reverse('verify_certificate', args=[certificate.code]))
+        self.assertContains(response, certificate.learner_name)
+
+    def test_certificate_view_when_issuing_writes_nothing(self):
+        progress = CourseProgress.objects.filter(completed_at__isnull=False).order_by('pk').first()
+        Certificate.objects.filter(learner=progress.learner, course=progress.course).delete()
+        self.client.force_login(progress.learner)
+        url = reverse('certificate', args=[progress.course_id])
+        # As when bulk_create skips a certificate whose code is already taken
+        with mock.patch.object(certificates, 'issue'):
+            response = self.client.get(url)
+        self.assertRedirects(response, reverse('mycourse'), fetch_redirect_response=False)
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['certificate'].code), certificates.CODE_LENGTH)
+
+
+class LearnerExportTests(SeededTestCase):
+    """Learner data exports stream a chunk of rows per query"""
+
+    def test_progress_export_streams_in_chunks(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:courseprogress_export'), {'export': 'progress', 'format': 'csv'})
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['progress_id', 'learner_id', 'username'])
+        self.assertEqual(len(lines) - 1, CourseProgress.objects.count())
+        # One query per chunk, plus the one that finds nothing more
+        total = CourseProgress.objects.count()
+        with CaptureQueriesContext(connection) as queries:
+            chunks = list(exports.stream('progress', 'ndjson', chunk_size=2))
+        self.assertEqual(len(queries), (total + 1) // 2 + 1)
+        self.assertEqual(sum(chunk.count('\n') for chunk in chunks), total)
+
+
+class BulkEnrollmentTests(SeededTestCase):
+    """Cohorts are enrolled a batch at a time"""
+
+    def test_bulk_enroll(self):
+        educator = User.objects.get(username='small-educator-0@example.com')
+        course = Course.objects.filter(creator=educator).order_by('pk').first()
+        seed('large', LARGE)
+        cohort = list(User.objects.filter(username__startswith='large-learner-').values_list('username', flat=True))
+        self.client.force_login(educator)
+        others = ['small-learner-0@example.com', educator.username, 'nobody@example.com']
+        response = self.client.post(reverse('bulk_enroll', args=[course.pk]), {
+            'learners': ', '.join(cohort[::3] + others)
+        })
+        self.assertEqual(response.json(), {
+            'course_id': course.pk, 'enrolled': 2, 'already_enrolled': 1,
+            'not_found': ['nobody@example.com'], 'not_learners': [educator.username],
+        })
+        # The manifest once, then a savepoint and four statements for every batch with learners to enroll
+        with CaptureQueriesContext(connection) as queries:
+            result = enrollment.enroll(course, cohort, batch_size=2)
+        self.assertEqual((result['enrolled'], result['already_enrolled']), (len(cohort) - 2, 2))
+        self.assertEqual(len(queries), 1 + len(cohort) // 2 * 6)
+        manifest = CourseManifest.for_course(course.pk)
+        self.assertEqual(set(CourseProgress.objects.filter(course=course, learner__username__in=cohort).values_list(
+            'current_page_id', 'total_page_count')), {(manifest.first_page_id, manifest.page_count)})
+        self.assertEqual(enrollment.enroll(course, cohort)['already_enrolled'], len(cohort))
+
+
+class BundleImportTests(TestCase):
+    """Bundles import whole or not at all"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.creator = User.objects.create_user('bundles@example.com', 'bundles@example.com', 'x')
+
+    def bundle(self, *pages):
+        return [json.dumps({'type': 'course', 'ref': 1, 'title': 'Imported'})] + [
+            json.dumps({'type': 'page', 'course_ref': 1, 'page_title': f'Page {index}', **page})
+            for index, page in enumerate(pages)
+        ]
+
+    def import_lines(self, lines):
+        return bundles.import_bundles(bundles.parse_lines(lines), self.creator, batch_size=1)
+
+    def test_import_numbers_pages_and_builds_manifest(self):
+        self.assertEqual(self.import_lines(self.bundle({'page_no': 3}, {}, {'page_no': 1})), (1, 3))
+        course = Course.objects.get(title='Imported')
+        self.assertEqual(list(course.pages.values_list('page_no', 'page_title')),
+                         [(1, 'Page 2'), (3, 'Page 0'), (4, 'Page 1')])
+        self.assertEqual(CourseManifest.for_course(course.pk).page_count, 3)
+
+    def test_bad_record_leaves_nothing_imported(self):
+        # Earlier batches were written before the bad line is read
+        for lines in (self.bundle({}, {}) + ['{not json'], self.bundle({'page_no': 'two'}),
+                      self.bundle({'page_no': 0}), self.bundle({'page_no': 2}, {'page_no': 2}),
+                      self.bundle({}, {'page_no': 1}), self.bundle({'created_at': 'yesterday'})):
+            with self.assertRaises(bundles.BundleError):
+                self.import_lines(lines)
+            self.assertFalse(Course.all_objects.exists())
+            self.assertFalse(CoursePage.all_objects.exists())
+
+    def test_admin_reports_failed_import(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'admin'))
+        upload = SimpleUploadedFile('bundle.ndjson', '\n'.join(self.bundle({}, {'page_no': 1})).encode())
+        response = self.client.post(reverse('admin:course_import_bundles'), {'bundle': upload}, follow=True)
+        self.assertContains(response, "nothing was imported")
+        self.assertFalse(Course.all_objects.exists())
+
+
+@override_settings(ASYNC_CONCURRENT_QUERIES=True)
+class AsyncGatherTests(SimpleTestCase):
+    """gather never has more calls in worker threads than it has connection slots"""
+
+    def gather_threads(self, slots, calls):
+        with mock.patch.object(async_db, '_slots', slots):
+            return async_to_sync(async_db.gather)(*[threading.get_ident] * calls)
+
+    def test_calls_beyond_the_limit_run_in_the_request_thread(self):
+        slots = threading.BoundedSemaphore(1)
+        first, *rest = self.gather_threads(slots, 3)
+        self.assertNotEqual(first, threading.get_ident())
+        self.assertEqual(rest, [threading.get_ident()] * 2)
+        # The slot was given back
+        self.assertTrue(slots.acquire(blocking=False))
+
+    def test_no_free_slot_runs_everything_in_the_request_thread(self):
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        self.assertEqual(self.gather_threads(slots, 3), [threading.get_ident()] * 3)
+
+
+class MetricsAccessTests(SimpleTestCase):
+    """Only scrapers can read the metrics endpoint"""
+
+    def test_private_addresses_only(self):
+        url = reverse('prometheus_metrics')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(self.client.get(url, REMOTE_ADDR='203.0.113.7').status_code, 403)
+
+    def test_token_when_configured(self):
+        url = reverse('prometheus_metrics')
+        with override_settings(METRICS={'TOKEN': 'scrape-me'}):
+            self.assertEqual(self.client.get(url).status_code, 403)
+            self.assertEqual(self.client.get(url, headers={'authorization': 'Bearer scrape-me'}).status_code, 200)
+
+
+class PageOrderingTests(TestCase):
+    """Reordering keeps a course's page numbers contiguous and unique"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.educator = User.objects.create_user('ordering@example.com', 'ordering@example.com', 'x')
+        cls.course = Course.objects.create(title='Ordering', description='', category='design', creator=cls.educator)
+        cls.pages = [CoursePage.objects.create(course=cls.course, page_title=f'P{n}', page_description='')
+                     for n in range(1, 6)]
+
+    def titles(self):
+        return list(CoursePage.all_objects.filter(course=self.course).order_by('page_no').values_list(
+            'page_no', 'page_title'))
+
+    def numbered(self, *titles):
+        return list(enumerate(titles, start=1))
+
+    def move(self, title, position):
+        with transaction.atomic():
+            return ordering.move_page(CoursePage.objects.get(course=self.course, page_title=title), position)
+
+    def test_pages_are_numbered_in_creation_order(self):
+        self.assertEqual(self.titles(), self.numbered('P1', 'P2', 'P3', 'P4', 'P5'))
+
+    def test_move_to_first_and_last(self):
+        self.assertEqual(self.move('P4', 1), 1)
+        self.assertEqual(self.titles(), self.numbered('P4', 'P1', 'P2', 'P3', 'P5'))
+        self.assertEqual(self.move('P4', 5), 5)
+        self.assertEqual(self.titles(), self.numbered('P1', 'P2', 'P3', 'P5', 'P4'))
+        self.assertEqual([entry[0] for entry in CourseManifest.for_course(self.course.pk).pages],
+                         list(CoursePage.objects.filter(course=self.course).order_by('page_no').values_list(
+                             'pk', flat=True)))
+
+    def test_move_to_same_position_changes_nothing(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.move('P3', 3), 3)
+        self.assertFalse([query for query in queries.captured_queries if query['sql'].startswith('UPDATE')])
+        self.assertEqual(self.titles(), self.numbered('P1', 'P2', 'P3', 'P4', 'P5'))
+
+    def test_positions_out_of_range_are_clamped(self):
+        self.assertEqual(self.move('P2', 99), 5)
+        self.assertEqual(self.move('P2', -3), 1)
+        self.assertEqual(self.titles(), self.numbered('P2', 'P1', 'P3', 'P4', 'P5'))
+
+    def test_archived_pages_keep_their_number(self):
+        set_archived(CoursePage.all_objects.filter(page_title='P5'), True)
+        self.assertEqual(self.move('P1', 99), 5)
+        self.assertEqual(self.titles(), self.numbered('P2', 'P3', 'P4', 'P5', 'P1'))
+        # New pages go after the archived ones too
+        page = CoursePage.objects.create(course=self.course, page_title='P6', page_description='')
+        self.assertEqual(page.page_no, 6)
+
+    def test_course_page_shows_position_among_visible_pages(self):
+        set_archived(CoursePage.all_objects.filter(page_title='P2'), True)
+        learner = User.objects.create_user('ordering-learner@example.com', 'ordering-learner@example.com', 'x')
+        UserDetail.objects.create(user=learner, firstname='Ordering', surname='Learner', role='learner',
+                                  email=learner.email)
+        self.course.learners.add(learner)
+        self.client.force_login(learner)
+        with self.settings(PROGRESS_BUFFER={'ENABLED': False}):
+            response = self.client.get(reverse('coursepage', args=[self.pages[3].pk]))
+        # P4 keeps page_no 4 but is third of the four pages left
+        self.assertEqual(self.pages[3].page_no, 4)
+        self.assertContains(response, 'Page 3 of 4')
+        position, previous_page, next_page = CourseManifest.for_course(self.course.pk).neighbours(self.pages[3])
+        self.assertEqual((position, previous_page.coursepage_id, next_page.coursepage_id),
+                         (3, self.pages[2].pk, self.pages[4].pk))
+
+    def test_deleting_a_page_closes_the_gap(self):
+        self.client.force_login(self.educator)
+        self.client.post(reverse('addpage', args=[self.course.pk]), {
+            'delete_page': '1', 'page_id': self.pages[1].pk
+        })
+        self.assertEqual(self.titles(), self.numbered('P1', 'P3', 'P4', 'P5'))
+        self.assertEqual(CourseManifest.for_course(self.course.pk).page_count, 4)
+
+    def test_new_pages_and_moves_take_the_course_lock(self):
+        # The row lock is what serializes concurrent page creation and reordering on MySQL
+        with mock.patch.object(Course, 'lock', wraps=Course.lock) as lock:
+            CoursePage.objects.create(course=self.course, page_title='P6', page_description='')
+            self.move('P6', 1)
+        self.assertEqual([call.args for call in lock.call_args_list], [(self.course.pk,), (self.course.pk,)])
+        self.assertEqual(self.titles(), self.numbered('P6', 'P1', 'P2', 'P3', 'P4', 'P5'))
+
+    def test_move_page_view(self):
+        url = reverse('move_page', args=[self.course.pk, self.pages[0].pk])
+        self.client.force_login(self.educator)
+        self.assertEqual(self.client.post(url, {'position': 'last'}).status_code, 400)
+        response = self.client.post(url, {'position': 3})
+        self.assertEqual(response.json()['page_no'], 3)
+        self.assertEqual([entry[2] for entry in response.json()['pages']], ['P2', 'P3', 'P1', 'P4', 'P5'])
+        self.client.force_login(User.objects.create_user('other@example.com', 'other@example.com', 'x'))
+        self.assertEqual(self.client.post(url, {'position': 1}).status_code, 404)
+
+
+class CommentCursorTests(TestCase):
+    """Comment pages follow each other without gaps or repeats, and bad cursors start over"""
+
+    @classmethod
+    def setUpTestData(cls):
+        seed('cursor', SMALL)
+        cls.learner = User.objects.get(username='cursor-learner-0@example.com')
+        cls.page = CoursePage.objects.filter(course__learners=cls.learner).order_by('pk').first()
+        CourseComment.objects.filter(course_page=cls.page).delete()
+        comments = CourseComment.objects.bulk_create([
+            CourseComment(course_page=cls.page, user=cls.learner, text=f'Comment {n}') for n in range(7)
+        ])
+        # Several comments share a timestamp, so the id has to break the tie
+        stamps = [timezone.now() - timedelta(minutes=n // 3) for n in range(7)]
+        for comment, stamp in zip(comments, stamps):
+            CourseComment.objects.filter(pk=comment.pk).update(created_at=stamp)
+
+    def test_pages_cover_every_comment_once_in_order(self):
+        seen, cursor = [], None
+        while True:
+            rows, cursor = CourseComment.objects.page_for(self.page, cursor=cursor, limit=2)
+            seen += [comment.pk for comment in rows]
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(CourseComment.objects.filter(course_page=self.page).order_by(
+            '-created_at', '-id').values_list('pk', flat=True)))
+
+    def test_last_full_page_has_no_cursor(self):
+        rows, cursor = CourseComment.objects.page_for(self.page, limit=7)
+        self.assertEqual((len(rows), cursor), (7, None))
+
+    def test_malformed_cursors_decode_to_none(self):
+        def raw(text):
+            return base64.urlsafe_b64encode(text.encode()).decode().rstrip('=')
+        for cursor in ('', 'not base64!', raw('not json'), raw('{"a": 1, "b": 2}'), raw('"ab"'), raw('[1]'),
+                       raw('["yesterday", 1]'), raw('[null, 1]'), raw('["2024-01-01T00:00:00+00:00", [1]]'),
+                       raw('["2024-01-01T00:00:00+00:00", 1e400]'),
+                       raw(f'["2024-01-01T00:00:00+00:00", {2 ** 64}]')):
+            self.assertIsNone(decode_cursor(cursor, datetime, int), cursor)
+        stamp = timezone.now()
+        self.assertEqual(decode_cursor(encode_cursor(stamp, 5), datetime, int), (stamp, 5))
+
+    def test_view_starts_over_on_a_bad_cursor(self):
+        self.client.force_login(self.learner)
+        url = reverse('page_comments', args=[self.page.pk])
+        first = self.client.get(url).json()
+        self.assertEqual(self.client.get(url, {'cursor': 'garbage'}).json(), first)
+        self.assertEqual(self.client.get(url, {'cursor': encode_cursor(timezone.now(), 2 ** 64)}).json(), first)
+
+
+@override_settings(PROGRESS_BUFFER={'ENABLED': True, 'MAX_EVENTS': 100, 'MAX_DELAY': 3600})
+class ProgressBufferTests(TestCase):
+    """Buffered page views reach the database in one batch, and survive a failed one"""
+
+    @classmethod
+    def setUpTestData(cls):
+        educator = User.objects.create_user('buffer-educator@example.com', 'buffer-educator@example.com', 'x')
+        cls.course = Course.objects.create(title='Buffered', description='', category='design', creator=educator)
+        cls.pages = [CoursePage.objects.create(course=cls.course, page_title=f'P{n}', page_description='')
+                     for n in range(3)]
+        cls.learner = User.objects.create_user('buffer-learner@example.com', 'buffer-learner@example.com', 'x')
+        cls.course.learners.add(cls.learner)
+
+    def setUp(self):
+        self.buffer = progress_buffer.ProgressBuffer()
+        self.addCleanup(self.cancel_timer)
+
+    def cancel_timer(self):
+        if self.buffer._timer is not None:
+            self.buffer._timer.cancel()
+
+    def view(self, *pages):
+        for page in pages:
+            self.buffer.record_page_view(self.learner.pk, self.course.pk, page.pk)
+
+    def progress(self):
+        return CourseProgress.objects.filter(learner=self.learner, course=self.course).first()
+
+    def test_views_wait_for_flush_and_coalesce(self):
+        self.view(self.pages[0], self.pages[1], self.pages[0])
+        self.assertEqual(self.buffer.pending(), 2)
+        self.assertIsNone(self.progress())
+        with CaptureQueriesContext(connection) as queries:
+            self.buffer.flush()
+        writes = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('INSERT')]
+        # The missing progress row and every completed page, one statement each
+        self.assertEqual(len(writes), 2)
+        progress = self.progress()
+        self.assertEqual(progress.current_page_id, self.pages[0].pk)
+        self.assertEqual((progress.completed_page_count, progress.total_page_count), (2, 3))
+        self.assertIsNone(progress.completed_at)
+        self.assertEqual((self.buffer.pending(), self.buffer._timer), (0, None))
+
+    def test_max_events_flushes_at_once(self):
+        with self.settings(PROGRESS_BUFFER={'ENABLED': True, 'MAX_EVENTS': 2, 'MAX_DELAY': 3600}):
+            self.view(self.pages[0])
+            self.assertIsNone(self.progress())
+            self.view(self.pages[1])
+        self.assertEqual((self.buffer.pending(), self.progress().completed_page_count), (0, 2))
+
+    def test_completion_sets_completed_at_and_issues_certificate(self):
+        self.view(*self.pages)
+        with self.captureOnCommitCallbacks():
+            self.buffer.flush()
+        self.assertIsNotNone(self.progress().completed_at)
+        self.assertTrue(Certificate.objects.filter(learner=self.learner, course=self.course).exists())
+
+    def test_failed_flush_keeps_events_for_the_next_one(self):
+        self.view(self.pages[0])
+        with mock.patch.object(progress_buffer, 'write_events', side_effect=RuntimeError("database away")), \
+                self.assertLogs(progress_buffer.logger, 'ERROR'):
+            self.buffer.flush()
+        self.assertEqual(self.buffer.pending(), 1)
+        self.assertIsNotNone(self.buffer._timer)
+        # A page viewed since the failure stays the current page
+        self.view(self.pages[2])
+        self.buffer.flush()
+        progress = self.progress()
+        self.assertEqual((progress.current_page_id, progress.completed_page_count), (self.pages[2].pk, 2))
+
+    def test_only_buffered_pairs_are_written(self):
+        other_course = Course.objects.create(title='Other', description='', category='design',
+                                             creator=self.course.creator)
+        other_page = CoursePage.objects.create(course=other_course, page_title='O1', page_description='')
+        other = User.objects.create_user('buffer-other@example.com', 'buffer-other@example.com', 'x')
+        # The crossed pairs have progress too, and must be left alone
+        untouched = [CourseProgress.objects.create(learner=self.learner, course=other_course),
+                     CourseProgress.objects.create(learner=other, course=self.course)]
+        progress_buffer.write_events({(self.learner.pk, self.course.pk, self.pages[0].pk),
+                                      (other.pk, other_course.pk, other_page.pk)},
+                                     {(self.learner.pk, self.course.pk): self.pages[0].pk,
+                                      (other.pk, other_course.pk): other_page.pk})
+        self.assertEqual(self.progress().current_page_id, self.pages[0].pk)
+        self.assertEqual(CourseProgress.objects.get(learner=other, course=other_course).completed_page_count, 1)
+        for progress in untouched:
+            progress.refresh_from_db()
+            self.assertEqual((progress.current_page_id, progress.completed_page_count), (None, 0))
+
+
+class FakeConnection:
+    def __init__(self, number):
+        self.number = number
+        self.closed = False
+        self.alive = True
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """The pool's limits, recycling and pings, with fake connections"""
+
+    def make_pool(self, ping=None, **options):
+        opened = []
+
+        def connect():
+            opened.append(FakeConnection(len(opened) + 1))
+            return opened[-1]
+
+        def default_ping(connection):
+            if not connection.alive:
+                raise OSError("gone")
+
+        options = {'max_size': 2, 'timeout': 0.05, **options}
+        return ConnectionPool(connect, ping or default_ping, **options), opened
+
+    def test_max_size_then_timeout(self):
+        pool, opened = self.make_pool()
+        first, second = pool.acquire(), pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            pool.acquire()
+        self.assertEqual((pool.get_stats()['timeouts'], pool.in_use), (1, 2))
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(len(opened), 2)
+
+    def test_waiter_gets_a_released_connection(self):
+        pool, opened = self.make_pool(max_size=1, timeout=5)
+        connection = pool.acquire()
+        threading.Timer(0.05, pool.release, [connection]).start()
+        self.assertIs(pool.acquire(), connection)
+        self.assertEqual(pool.get_stats()['waits'], 1)
+
+    def test_connections_past_max_lifetime_are_recycled(self):
+        pool, opened = self.make_pool(max_lifetime=-1)
+        connection = pool.acquire()
+        pool.release(connection)
+        self.assertIsNot(pool.acquire(), connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual((pool.get_stats()['recycled'], pool.size), (1, 1))
+
+    def test_failed_ping_discards_the_connection(self):
+        pool, opened = self.make_pool()
+        connection = pool.acquire()
+        pool.release(connection)
+        connection.alive = False
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, connection)
+        self.assertTrue(connection.closed)
+        self.assertEqual((pool.get_stats()['failed_pings'], pool.size), (1, 1))
+
+    def test_ping_runs_without_the_lock(self):
+        other_thread_done = []
+
+        def slow_ping(connection):
+            # Another thread can use the pool while this one pings
+            thread = threading.Thread(target=lambda: other_thread_done.append(pool.get_stats()))
+            thread.start()
+            thread.join(timeout=2)
+
+        pool, opened = self.make_pool(ping=slow_ping)
+        pool.release(pool.acquire())
+        pool.acquire()
+        self.assertEqual(len(other_thread_done), 1)
+        self.assertEqual(other_thread_done[0]['in_use'], 1)
+
+    def test_failed_connect_frees_the_slot(self):
+        attempts = []
+
+        def connect():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise OSError("refused")
+            return FakeConnection(len(attempts))
+
+        pool = ConnectionPool(connect, lambda connection: None, max_size=1, timeout=0.05)
+        with self.assertRaises(OSError):
+            pool.acquire()
+        self.assertEqual(pool.size, 0)
+        self.assertEqual(pool.acquire().number, 2)
+
+    def test_fork_forgets_the_parents_connections(self):
+        pool, opened = self.make_pool()
+        parent_connection = pool.acquire()
+        pool.release(pool.acquire())
+        with mock.patch('os.getpid', return_value=pool._pid + 1):
+            child_connection = pool.acquire()
+            self.assertNotIn(child_connection, opened[:2])
+            self.assertEqual((pool.size, pool.get_stats()['opened']), (1, 1))
+            # Releasing a connection from before the fork doesn't touch the child's pool
+            pool.release(parent_connection)
+            self.assertEqual(pool.get_stats()['idle'], 0)
+        self.assertFalse(parent_connection.closed)
+
+
+class MetricsSnapshotTests(SimpleTestCase):
+    """Snapshots of other processes count only while their process is alive, and gauges only while fresh"""
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        override = override_settings(METRICS={'DIR': self.directory, 'FLUSH_INTERVAL': 10})
+        override.enable()
+        self.addCleanup(override.disable)
+        self.registry = metrics.Registry()
+
+    def write(self, pid, age, requests, gauge, counter):
+        snapshot = {
+            'views': {'other': {**metrics._empty_view_stats(), 'requests': requests}},
+            'samples': {
+                json.dumps(['elevatelearning_db_pool_connections', [('alias', 'default'), ('state', 'idle')]]): gauge,
+                json.dumps(['elevatelearning_db_pool_checkouts_total', [('alias', 'default')]]): counter,
+            },
+            'written_at': time.time() - age,
+        }
+        path = os.path.join(self.directory, f'{pid}.json')
+        with open(path, 'w') as file:
+            json.dump(snapshot, file)
+        return path
+
+    def gauge_and_counter(self, samples):
+        values = {json.loads(key)[0]: value for key, value in samples.items() if 'default' in key}
+        return values.get('elevatelearning_db_pool_connections', 0), values['elevatelearning_db_pool_checkouts_total']
+
+    def test_fresh_snapshots_are_summed(self):
+        self.write(os.getppid(), 0, 3, 2, 7)
+        totals, samples = self.registry.collect()
+        self.assertEqual(totals['other']['requests'], 3)
+        self.assertEqual(self.gauge_and_counter(samples), (2, 7))
+
+    def test_stale_snapshots_give_counters_but_not_gauges(self):
+        self.write(os.getppid(), 31, 3, 2, 7)
+        totals, samples = self.registry.collect()
+        self.assertEqual(totals['other']['requests'], 3)
+        self.assertEqual(self.gauge_and_counter(samples), (0, 7))
+
+    def test_snapshots_of_exited_processes_are_removed(self):
+        with mock.patch.object(metrics, '_pid_alive', return_value=False):
+            path = self.write(4194303, 0, 3, 2, 7)
+            totals, samples = self.registry.collect()
+        self.assertNotIn('other', totals)
+        self.assertFalse(os.path.exists(path))
+
+    def test_exit_removes_own_snapshot(self):
+        self.registry.write_snapshot(force=True)
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        self.assertTrue(os.path.exists(path))
+        self.registry.remove_snapshot()
+        self.assertFalse(os.path.exists(path))
+
+
+class FragmentCacheTests(TestCase):
+    """Cached page fragments are reused until the page or its comments change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        educator = User.objects.create_user('fragment-educator@example.com', 'fragment-educator@example.com', 'x')
+        course = Course.objects.create(title='Fragments', description='', category='design', creator=educator)
+        cls.page = CoursePage.objects.create(course=course, page_title='Cached', page_description='Body')
+        cls.learner = User.objects.create_user('fragment-learner@example.com', 'fragment-learner@example.com', 'x')
+
+    def setUp(self):
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def render(self):
+        page = CoursePage.objects.get(pk=self.page.pk)
+        get_context = mock.Mock(return_value={'page': page})
+        rendered = fragments.render_page_fragments(page, {'body': ('fragments/page_body.html', get_context)})
+        return rendered['body'], get_context.call_count
+
+    def test_hit_skips_the_render(self):
+        body, renders = self.render()
+        self.assertIn('Body', body)
+        self.assertEqual(renders, 1)
+        self.assertEqual(self.render(), (body, 0))
+        stats = fragments.get_stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 1, 0.5))
+
+    def test_page_save_invalidates_once_committed(self):
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            # Leaves modified_at as stored, so only the version bump can expire the fragment
+            page = CoursePage.objects.get(pk=self.page.pk)
+            page.page_description = 'Rewritten'
+            page.save(update_fields=['page_description'])
+            # Nothing is dropped until the transaction commits
+            self.assertEqual(self.render()[1], 0)
+        body, renders = self.render()
+        self.assertEqual(renders, 1)
+        self.assertIn('Rewritten', body)
+
+    def test_comment_invalidates_the_page(self):
+        self.render()
+        with self.captureOnCommitCallbacks(execute=True):
+            comment = CourseComment.objects.create(course_page=self.page, user=self.learner, text='First')
+        self.assertEqual(self.render()[1], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            comment.delete()
+        self.assertEqual(self.render()[1], 1)
+        self.assertEqual(fragments.get_stats()['invalidations'], 2)
+
+
+class SearchTests(TestCase):
+    """The index follows every save and delete, and search ranks what it finds"""
+
+    @classmethod
+    def setUpTestData(cls):
+        educator = User.objects.create_user('search-educator@example.com', 'search-educator@example.com', 'x')
+
+        def course(title, description):
+            return Course.objects.create(title=title, description=description, category='design', creator=educator)
+        cls.basics = course('Python basics', 'Start here.')
+        cls.snakes = course('Snakes', 'A python appears in this course.')
+        cls.cooking = course('Cooking', 'Cooking with python.')
+        cls.page = CoursePage.objects.create(course=cls.basics, page_title='Variables',
+                                             page_description='<p>Names for values</p>')
+        learner = User.objects.create_user('search-learner@example.com', 'search-learner@example.com', 'x')
+        cls.comment = CourseComment.objects.create(course_page=cls.page, user=learner, text='Loved the python bits')
+
+    def setUp(self):
+        # The document count used for IDF is cached
+        caches['default'].clear()
+        self.addCleanup(caches['default'].clear)
+
+    def postings(self, **filters):
+        return SearchPosting.objects.filter(**filters)
+
+    def found(self, query, **kwargs):
+        results, cursor = search.search(query, **kwargs)
+        return [(result['course'].pk, result['page'] and result['page'].pk) for result in results], cursor
+
+    def test_tokenize_and_weigh(self):
+        self.assertEqual(search.tokenize('The Cats and a DOG, x glass: 42'), ['cat', 'dog', 'glass', '42'])
+        self.assertEqual(search.tokenize('y' * 100), ['y' * search.MAX_TOKEN_LENGTH])
+        self.assertEqual(search.weigh('Cats', '<p>cats <b>dogs</b></p>'),
+                         Counter({'cat': search.TITLE_WEIGHT + 1, 'dog': 1}))
+        self.assertEqual(search.weigh(None, None), Counter())
+
+    def test_saving_rewrites_only_changed_tokens(self):
+        before = dict(self.postings(kind='page', object_id=self.page.pk).values_list('token', 'pk'))
+        self.assertEqual(set(before), {'variable', 'name', 'value'})
+        self.page.page_description = '<p>Names for values and values</p>'
+        self.page.save()
+        after = {token: (pk, weight) for token, pk, weight in self.postings(
+            kind='page', object_id=self.page.pk).values_list('token', 'pk', 'weight')}
+        # Unchanged rows are kept, the changed weight is updated in place
+        self.assertEqual(after, {'variable': (before['variable'], 3), 'name': (before['name'], 1),
+                                 'value': (before['value'], 2)})
+        self.page.page_description = 'Constants'
+        self.page.save()
+        self.assertEqual(set(self.postings(kind='page', object_id=self.page.pk).values_list('token', flat=True)),
+                         {'variable', 'constant'})
+        self.assertEqual(self.postings(kind='page', object_id=self.page.pk, token='variable').get().pk,
+                         before['variable'])
+
+    def test_deleting_drops_postings(self):
+        comment_id, page_id = self.comment.pk, self.page.pk
+        self.assertTrue(self.postings(kind='comment', object_id=comment_id).exists())
+        self.comment.delete()
+        self.assertFalse(self.postings(kind='comment', object_id=comment_id).exists())
+        self.page.delete()
+        self.assertFalse(self.postings(course_page_id=page_id).exists())
+        self.assertTrue(self.postings(kind='course', object_id=self.basics.pk).exists())
+
+    def test_title_matches_rank_first(self):
+        results, cursor = self.found('python')
+        self.assertEqual(results[0], (self.basics.pk, None))
+        self.assertEqual(set(results), {(self.basics.pk, None), (self.snakes.pk, None), (self.cooking.pk, None),
+                                        (self.basics.pk, self.page.pk)})
+        self.assertIsNone(cursor)
+
+    def test_documents_matching_more_tokens_rank_first(self):
+        # Basics has the stronger python match, but Cooking matches both tokens
+        self.assertEqual(self.found('python cooking')[0][0], (self.cooking.pk, None))
+
+    def test_archived_courses_and_pages_are_left_out(self):
+        set_archived(Course.objects.filter(pk=self.snakes.pk), True)
+        set_archived(CoursePage.objects.filter(pk=self.page.pk), True)
+        self.assertEqual(set(self.found('python')[0]), {(self.basics.pk, None), (self.cooking.pk, None)})
+
+    def test_cursor_stops_at_max_results(self):
+        with mock.patch.object(search, 'MAX_RESULTS', 3):
+            seen, cursor = self.found('python', limit=2)
+            self.assertEqual(len(seen), 2)
+            more, cursor = self.found('python', cursor=cursor, limit=2)
+            self.assertEqual((len(more), cursor), (2, None))
+            self.assertEqual(self.found('python', cursor=encode_cursor(3)), ([], None))
+        self.assertEqual(len(set(seen + more)), 4)
+
+    def test_rebuild_matches_incremental_index(self):
+        self.page.page_description = 'Rewritten body'
+        self.page.save()
+        columns = ('kind', 'object_id', 'course_id', 'course_page_id', 'token', 'weight')
+        incremental = Counter(SearchPosting.objects.values_list(*columns))
+        written = search.rebuild(batch_size=2, workers=1)
+        self.assertEqual(written, sum(incremental.values()))
+        self.assertEqual(Counter(SearchPosting.objects.values_list(*columns)), incremental)
+
+
+class CatalogTests(TestCase):
+    """The catalog walks every course once, newest first, under each filter"""
+
+    @classmethod
+    def setUpTestData(cls):
+        educator = User.objects.create_user('catalog-educator@example.com', 'catalog-educator@example.com', 'x')
+        categories = ['programming', 'design', 'programming', 'business', 'programming', 'design', 'science']
+        cls.courses = [Course.objects.create(title=f'C{n}', description='', category=category, creator=educator)
+                       for n, category in enumerate(categories)]
+        # Courses created in the same instant are ordered by id
+        stamp = timezone.now() - timedelta(days=1)
+        Course.objects.filter(pk__in=[course.pk for course in cls.courses[1:5]]).update(created_date=stamp)
+        cls.archived = cls.courses[6]
+        set_archived(Course.objects.filter(pk=cls.archived.pk), True)
+        cls.learner = User.objects.create_user('catalog-learner@example.com', 'catalog-learner@example.com', 'x')
+        cls.enrolled = cls.courses[:2]
+        cls.learner.enrolled_courses.add(*cls.enrolled)
+
+    def walk(self, **filters):
+        seen, cursor = [], None
+        while True:
+            courses, cursor = Course.all_objects.catalog_page(self.learner, cursor=cursor, limit=2, **filters)
+            seen += [course.pk for course in courses]
+            if cursor is None:
+                return seen
+
+    def expected(self, queryset):
+        return list(queryset.order_by('-created_date', '-course_id').values_list('pk', flat=True))
+
+    def test_walk_returns_each_course_once_in_order(self):
+        seen = self.walk()
+        self.assertEqual(seen, self.expected(Course.objects.all()))
+        self.assertEqual(len(seen), len(set(seen)))
+
+    def test_filters(self):
+        self.assertEqual(self.walk(category='programming'), self.expected(Course.objects.filter(
+            category='programming')))
+        self.assertEqual(self.walk(archived=True), [self.archived.pk])
+        self.assertEqual(self.walk(archived=None), self.expected(Course.all_objects.all()))
+        self.assertEqual(self.walk(not_enrolled=True), self.expected(Course.objects.exclude(
+            pk__in=[course.pk for course in self.enrolled])))
+
+    def test_api_filters_and_enrollment(self):
+        self.client.force_login(self.learner)
+        url = reverse('catalog_api')
+        courses = self.client.get(url, {'category': 'design', 'archived': 'any'}).json()['courses']
+        self.assertEqual([course['course_id'] for course in courses],
+                         self.expected(Course.all_objects.filter(category='design')))
+        self.assertEqual([course['is_enrolled'] for course in courses],
+                         [course['course_id'] in {c.pk for c in self.enrolled} for course in courses])
+        # An unknown category is ignored rather than matching nothing
+        self.assertEqual(self.client.get(url, {'category': 'nope'}).json(), self.client.get(url).json())
+
+    def test_tampered_cursor_starts_over(self):
+        self.client.force_login(self.learner)
+        url = reverse('catalog_api')
+        first = self.client.get(url).json()
+        for cursor in ('garbage', encode_cursor('not a date', 1), encode_cursor(timezone.now(), 'x'),
+                       encode_cursor(timezone.now(), 2 ** 64)):
+            self.assertEqual(self.client.get(url, {'cursor': cursor}).json(), first, cursor)
+
+
+class EngagementCounterTests(TestCase):
+    """Likes, shares and comments keep the page's counters in step"""
+
+    @classmethod
+    def setUpTestData(cls):
+        educator = User.objects.create_user('engagement-educator@example.com', 'engagement-educator@example.com', 'x')
+        course = Course.objects.create(title='Engagement', description='', category='design', creator=educator)
+        cls.page = CoursePage.objects.create(course=course, page_title='P1', page_description='')
+        cls.learners = [User.objects.create_user(f'engagement-{n}@example.com', f'engagement-{n}@example.com', 'x')
+                        for n in range(2)]
+
+    def counts(self):
+        return CoursePageStats.objects.filter(course_page=self.page).values_list(
+            'like_count', 'share_count', 'comment_count').get()
+
+    def recounted(self):
+        CoursePageStats.objects.filter(course_page=self.page).refresh_counts()
+        return self.counts()
+
+    def post(self, learner, name, **data):
+        self.client.force_login(learner)
+        self.client.post(reverse(name, args=[self.page.pk]), data)
+
+    def test_like_and_unlike(self):
+        self.post(self.learners[0], 'toggle_like')
+        self.post(self.learners[1], 'toggle_like')
+        self.assertEqual(self.counts(), (2, 0, 0))
+        self.post(self.learners[0], 'toggle_like')
+        self.assertEqual(self.counts(), (1, 0, 0))
+        self.assertEqual(self.recounted(), (1, 0, 0))
+
+    def test_share_counts_once(self):
+        self.post(self.learners[0], 'record_share')
+        self.post(self.learners[0], 'record_share')
+        self.post(self.learners[1], 'record_share')
+        self.assertEqual(self.counts(), (0, 2, 0))
+        self.assertEqual(self.recounted(), (0, 2, 0))
+
+    def test_archiving_and_deleting_interactions(self):
+        self.post(self.learners[0], 'toggle_like')
+        self.post(self.learners[0], 'record_share')
+        self.post(self.learners[1], 'toggle_like')
+        interaction = CourseInteraction.objects.get(user=self.learners[0])
+        interaction.is_archived = True
+        interaction.save()
+        self.assertEqual(self.counts(), (1, 0, 0))
+        interaction.is_archived = False
+        interaction.save()
+        self.assertEqual(self.counts(), (2, 1, 0))
+        CourseInteraction.objects.get(user=self.learners[1]).delete()
+        self.assertEqual(self.counts(), (1, 1, 0))
+        self.assertEqual(self.recounted(), (1, 1, 0))
+
+    def test_comments_added_archived_and_deleted(self):
+        self.post(self.learners[0], 'add_comment', text='First')
+        self.post(self.learners[1], 'add_comment', text='Second')
+        self.post(self.learners[1], 'add_comment', text='   ')
+        self.assertEqual(self.counts(), (0, 0, 2))
+        comment = CourseComment.objects.get(text='First')
+        comment.is_archived = True
+        comment.save()
+        self.assertEqual(self.counts(), (0, 0, 1))
+        # Deleting an archived comment doesn't count it twice
+        comment.delete()
+        CourseComment.objects.get(text='Second').delete()
+        self.assertEqual(self.counts(), (0, 0, 0))
+        self.assertEqual(self.recounted(), (0, 0, 0))
+
+    def test_counters_never_go_below_zero(self):
+        self.post(self.learners[0], 'toggle_like')
+        CoursePageStats.bump(self.page.pk, like_count=-5, share_count=-1, comment_count=2)
+        self.assertEqual(self.counts(), (0, 0, 2))
+
+
+class ProgressCounterTests(TestCase):
+    """Completed and total page counts follow completed_pages and the course's pages"""
+
+    @classmethod
+    def setUpTestData(cls):
+        educator = User.objects.create_user('counter-educator@example.com', 'counter-educator@example.com', 'x')
+        cls.course = Course.objects.create(title='Counters', description='', category='design', creator=educator)
+        cls.pages = [CoursePage.objects.create(course=cls.course, page_title=f'P{n}', page_description='')
+                     for n in range(3)]
+        learners = [User.objects.create_user(f'counter-{n}@example.com', f'counter-{n}@example.com', 'x')
+                    for n in range(2)]
+        cls.progress = [CourseProgress.objects.create(learner=learner, course=cls.course) for learner in learners]
+
+    def counts(self):
+        return [tuple(CourseProgress.objects.filter(pk=progress.pk).values_list(
+            'completed_page_count', 'total_page_count').get()) for progress in self.progress]
+
+    def test_forward_add_remove_and_clear(self):
+        first = self.progress[0]
+        first.completed_pages.add(*self.pages[:2])
+        self.assertEqual(self.counts(), [(2, 3), (0, 3)])
+        # The in-memory instance is refreshed too
+        self.assertEqual(first.completed_page_count, 2)
+        first.completed_pages.add(self.pages[0])
+        first.completed_pages.remove(self.pages[1])
+        self.assertEqual(self.counts(), [(1, 3), (0, 3)])
+        first.completed_pages.clear()
+        self.assertEqual(self.counts(), [(0, 3), (0, 3)])
+
+    def test_reverse_add_remove_and_clear(self):
+        page = self.pages[0]
+        page.completed_by.add(*self.progress)
+        self.pages[1].completed_by.add(self.progress[0])
+        self.assertEqual(self.counts(), [(2, 3), (1, 3)])
+        page.completed_by.remove(self.progress[1])
+        self.assertEqual(self.counts(), [(2, 3), (0, 3)])
+        page.completed_by.clear()
+        self.assertEqual(self.counts(), [(1, 3), (0, 3)])
+
+    def test_page_create_and_delete(self):
+        self.progress[0].completed_pages.add(self.pages[0])
+        page = CoursePage.objects.create(course=self.course, page_title='P3', page_description='')
+        self.assertEqual(self.counts(), [(1, 4), (0, 4)])
+        page.delete()
+        self.assertEqual(self.counts(), [(1, 3), (0, 3)])
+        CoursePage.objects.get(pk=self.pages[0].pk).delete()
+        self.assertEqual(self.counts(), [(0, 2), (0, 2)])
+        # Pages created archived don't count
+        CoursePage.objects.create(course=self.course, page_title='Hidden', page_description='', is_archived=True)
+        self.assertEqual(self.counts(), [(0, 2), (0, 2)])
+
+    def test_page_archive_and_restore(self):
+        self.progress[0].completed_pages.add(*self.pages[:2])
+        page = CoursePage.objects.get(pk=self.pages[1].pk)
+        page.is_archived = True
+        page.save()
+        self.assertEqual(self.counts(), [(1, 2), (0, 2)])
+        # Deleting an archived page changes nothing more
+        CoursePage.all_objects.get(pk=page.pk).delete()
+        self.assertEqual(self.counts(), [(1, 2), (0, 2)])
+        page = CoursePage.objects.get(pk=self.pages[0].pk)
+        page.is_archived = True
+        page.save()
+        self.assertEqual(self.counts(), [(0, 1), (0, 1)])
+        page.is_archived = False
+        page.save()
+        self.assertEqual(self.counts(), [(1, 2), (0, 2)])
@@ -9,6 +9,7 @@ urlpatterns = [
     path("coursepage/<int:coursepage_id>/", views.coursepage, name="coursepage"),
     path('coursepage/<int:coursepage_id>/like/', views.toggle_like, name='toggle_like'),
     path('coursepage/<int:coursepage_id>/comment/', views.add_comment, name='add_comment'),
+    path('coursepage/<int:coursepage_id>/comments/', views.page_comments, name='page_comments'),
     path('coursepage/<int:coursepage_id>/share/', views.record_share, name='record_share'),
     path("qrgen/", views.qrgen, name="qrgen"),
     path('login/', views.login_view, name='login'),
@@ -17,9 +18,19 @@ urlpatterns = [
     path('mycourse/', views.mycourse, name='mycourse'),
     path('createdcourses/', views.createdcourses, name='createdcourses'),
     path('course/<int:course_id>/pages/', views.addpage, name='addpage'),
+    path('course/<int:course_id>/analytics/', views.course_analytics, name='course_analytics'),
     path('course/<int:course_id>/pages/new/', views.newpage, name='newpage'),
     path('course/<int:course_id>/pages/<int:coursepage_id>/edit/', views.newpage, name='newpage'),
+    path('course/<int:course_id>/pages/<int:coursepage_id>/move/', views.move_page, name='move_page'),
     path('enroll/<int:course_id>/', views.enroll_course, name='enroll_course'),
+    path('enroll/<int:course_id>/bulk/', views.bulk_enroll, name='bulk_enroll'),
     path('continue/<int:course_id>/', views.continue_course, name='continue_course'),
     path('certificate/<int:course_id>/', views.certificate_view, name='certificate'),
+    path('certificates/verify/<str:code>/', views.verify_certificate, name='verify_certificate'),
+    path('catalog/', views.catalog, name='catalog'),
+    path('catalog/api/', views.catalog_api, name='catalog_api'),
+    path('search/', views.search_view, name='search'),
+    path('search/api/', views.search_api, name='search_api'),
+    path('cache/stats/', views.fragment_cache_stats, name='fragment_cache_stats'),
+    path('metrics/', views.prometheus_metrics, name='prometheus_metrics'),
 ]
\ No newline at end of file
@@ -1,17 +1,49 @@
-from django.shortcuts import render, redirect, get_object_or_404
+import json
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.views import View
 from django.contrib.auth import authenticate, login, logout
-from django.db.models import Subquery
+from django.db import transaction
+from django.db.models import Count, Subquery
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.http import require_POST
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
+from django.urls import reverse
+from urllib.parse import urlencode
+from datetime import timedelta
+from django.utils import timezone
 from django.contrib import messages
-from django.core.exceptions import ValidationError
+from django.core.exceptions import PermissionDenied, ValidationError
 from django.contrib.auth.hashers import make_password
-import uuid
-from django.utils import timezone
-from .models import UserDetail, Course, CoursePage, CourseProgress, QRcode, CourseInteraction, CourseComment
+from . import analytics, async_db, certificates, enrollment, fragments, jobs, metrics, ordering, progress_buffer, qrcodes, search
+from .profiles import aget_role, get_role, role_required
+from .models import UserDetail, Course, CoursePage, CourseProgress, QRcode, CourseInteraction, CourseComment, CoursePageStats, CourseManifest, Certificate
+
+# Comments shown per page on a course page and per "load more" request
+COMMENTS_PAGE_SIZE = 20
+
+# Search results per page
+SEARCH_PAGE_SIZE = 20
+
+# Courses per catalog page, and in the "Add New Course" dropdown on My Courses
+CATALOG_PAGE_SIZE = 20
+AVAILABLE_COURSES_SHOWN = 10
+
+# Periods (in days) educators can chart on the course analytics page; the second is the default
+ANALYTICS_PERIODS = (7, 30, 90)
+ANALYTICS_METRICS = [
+    ('Enrollments', 'enrollments'),
+    ('Completions', 'completions'),
+    ('Pages completed', 'page_completions'),
+    ('Likes', 'likes'),
+    ('Shares', 'shares'),
+    ('Comments', 'comments'),
+]
+
+# render() runs context processors that load request.user, which async code can't do
+arender = sync_to_async(render)
 
 def index(request):
     return render(request, "home.html")
@@ -27,7 +59,7 @@ def logout_view(request):
 def coursecreate(request):
     if request.method == 'POST':
         # Check if the user is an educator
-        if not hasattr(request.user, 'userdetail') or request.user.userdetail.role.lower() != 'educator':
+        if get_role(request.user) != 'educator':
             messages.error(request, "Only educators can create courses.")
             return redirect('dashboard')
         
@@ -57,98 +89,100 @@ def coursecreate(request):
     return render(request, "coursecreate.html")
 
 
-def coursepage(request, coursepage_id):
-    if not hasattr(request.user, 'userdetail') or request.user.userdetail.role.lower() != 'learner':
-        messages.error(request, "Only learners can access course pages.")
-        return redirect('dashboard')
-    
-    page = get_object_or_404(CoursePage, coursepage_id=coursepage_id)
+@role_required('learner', "Only learners can access course pages.")
+async def coursepage(request, coursepage_id):
+    user = await request.auser()
+    # The page body is only loaded if its rendered fragment isn't cached
+    page = await aget_object_or_404(
+        CoursePage.objects.select_related('course', 'stats').defer('page_description'),
+        coursepage_id=coursepage_id
+    )
     course = page.course
-
-     # Get interactions
-    interactions = CourseInteraction.objects.filter(course_page=page)
-    likes_count = interactions.filter(liked=True).count()
-    shares_count = interactions.filter(shared=True).count()
-    user_interaction = None
+    
+    # Enrollment, manifest, counters and the user's like don't depend on each other
+    enrolled, manifest, stats, user_has_liked = await async_db.gather(
+        lambda: user.enrolled_courses.filter(pk=course.course_id).exists(),
+        lambda: CourseManifest.for_course(course.course_id),
+        # Engagement numbers come from the page's counter row
+        lambda: CoursePageStats.for_page(page),
+        lambda: CourseInteraction.objects.filter(course_page=page, user=user, liked=True).exists(),
+    )
     
     # Check if user is enrolled in this course
-    if not request.user.enrolled_courses.filter(pk=course.course_id).exists():
+    if not enrolled:
         messages.error(request, "You need to enroll in this course first.")
         return redirect('mycourse')
     
-    # Get or create progress
-    progress, created = CourseProgress.objects.get_or_create(
-        learner=request.user,
-        course=course,
-        defaults={'current_page': page}
+    # Get next and previous pages from the course manifest
+    position, previous_page, next_page = manifest.neighbours(page)
+    
+    # Mark the page completed and current; written in batches by the progress buffer.
+    # Page body and comments are rendered once and served from the fragment cache.
+    _, rendered = await async_db.gather(
+        lambda: progress_buffer.record_page_view(user.pk, course.course_id, page.coursepage_id),
+        lambda: fragments.render_page_fragments(page, {
+            'body': ('fragments/page_body.html', lambda: {'page': page}),
+            'comments': ('fragments/page_comments.html', lambda: dict(zip(
+                ('comments', 'next_cursor'),
+                CourseComment.objects.page_for(page, limit=COMMENTS_PAGE_SIZE)
+            ), page=page)),
+        }),
     )
     
-    # Update current page if different
-    if progress.current_page != page:
-        progress.current_page = page
-        progress.save()
-    
-    # Mark page as completed if not already
-    if not progress.completed_pages.filter(pk=page.coursepage_id).exists():
-        progress.completed_pages.add(page)
-    
-    # Get next and previous pages
-    all_pages = list(course.pages.order_by('page_no'))
-    current_index = all_pages.index(page)
-    previous_page = all_pages[current_index - 1] if current_index > 0 else None
-    next_page = all_pages[current_index + 1] if current_index < len(all_pages) - 1 else None
-
-    if request.user.is_authenticated:
-        user_interaction = CourseInteraction.objects.filter(
-            course_page=page,
-            user=request.user
-        ).first()
-
-     # Get comments
-    comments = CourseComment.objects.filter(course_page=page).select_related('user')
-    
     context = {
         'page': page,
         'course': course,
         'previous_page': previous_page,
         'next_page': next_page,
-        'like_count': CourseInteraction.objects.filter(course_page=page, liked=True).count(),
-        'user_has_liked': CourseInteraction.objects.filter(course_page=page, user=request.user, liked=True).exists() if request.user.is_authenticated else False,
-        'comments': CourseComment.objects.filter(course_page=page).order_by('-created_at')
+        # Page numbers have gaps once pages are archived or deleted, so show the position instead
+        'page_position': position or page.page_no,
+        'page_count': manifest.page_count,
+        'like_count': stats.like_count,
+        'share_count': stats.share_count,
+        'comment_count': stats.comment_count,
+        'user_has_liked': user_has_liked,
+        'page_body_html': rendered['body'],
+        'comments_html': rendered['comments']
     }
     
-    return render(request, "coursepage.html", context)
+    return await arender(request, "coursepage.html", context)
 
 
-def qrgen(request):
-    # Check if user is a learner
-    if not hasattr(request.user, 'userdetail') or request.user.userdetail.role.lower() != 'learner':
-        messages.error(request, "Only learners can access this page.")
-        return redirect('dashboard')
-    
-    # Get all courses the learner is enrolled in
-    enrolled_courses = request.user.enrolled_courses.all()
+@role_required('learner', "Only learners can access this page.")
+async def qrgen(request):
+    user = await request.auser()
+    # Get all courses the learner is enrolled in, with their QR rows in the same query
+    enrolled_courses = [course async for course in user.enrolled_courses.select_related('qrcode')]
+    
+    # Create the missing QR rows in one statement
+    missing = [course for course in enrolled_courses if not hasattr(course, 'qrcode')]
+    if missing:
+        base_url = request.build_absolute_uri('/')
+        await QRcode.objects.abulk_create([
+            QRcode(course=course, qrcode_url=f"{base_url}elevatelearning/continue/{course.course_id}/")
+            for course in missing
+        ], ignore_conflicts=True)
+        qr_codes = await QRcode.objects.ain_bulk([course.course_id for course in missing], field_name='course_id')
+        for course in missing:
+            course.qrcode = qr_codes[course.course_id]
+    
+    # Render any images that aren't on disk yet, inline and in this process; later views are
+    # served by nginx from the shared MEDIA_ROOT. This is CPU and file work, so it doesn't
+    # hold up the request's database thread.
+    await sync_to_async(qrcodes.ensure_images, thread_sensitive=False)(
+        [course.qrcode.qrcode_url for course in enrolled_courses]
+    )
     
-    # Prepare course data with QR codes
-    courses_with_qr = []
-    for course in enrolled_courses:
-        # Get or create QR code for each course
-        qr_code, created = QRcode.objects.get_or_create(
-            course=course,
-            defaults={
-                'qrcode_url': f"{request.build_absolute_uri('/')}elevatelearning/continue/{course.course_id}/"
-            }
-        )
-        courses_with_qr.append({
-            'course': course,
-            'qr_code': qr_code,
-            'enrollment_date': course.enrollment_date if hasattr(course, 'enrollment_date') else None
-        })
+    courses_with_qr = [{
+        'course': course,
+        'qr_code': course.qrcode,
+        'enrollment_date': course.enrollment_date if hasattr(course, 'enrollment_date') else None
+    } for course in enrolled_courses]
     
     context = {
         'enrolled_courses': courses_with_qr
     }
-    return render(request, "qrgen.html", context)
+    return await arender(request, "qrgen.html", context)
 
 def login_view(request):
     if request.method == 'POST':
@@ -161,8 +195,8 @@ def login_view(request):
         
         if user is not None:
             try:
-                # Check if the user has the correct role
-                user_detail = UserDetail.objects.get(user=user)
+                # Check if the user has the correct role; the backend loads the details with the user
+                user_detail = user.userdetail
                 
                 if user_detail.role.lower() == role.lower():
                     login(request, user)
@@ -245,51 +279,44 @@ def register(request):
     return render(request, "register.html")
 
 @login_required
-def mycourse(request):
-    # Check if user is a learner
-    if not hasattr(request.user, 'userdetail') or request.user.userdetail.role.lower() != 'learner':
-        messages.error(request, "Only learners can access this page.")
-        return redirect('dashboard')
-    
-    # Get all courses the learner is enrolled in
-    enrolled_courses = request.user.enrolled_courses.all()
+@role_required('learner', "Only learners can access this page.")
+async def mycourse(request):
+    user = await request.auser()
+    # The enrolled courses (with progress computed in the same query) and the
+    # courses the learner hasn't enrolled in are independent queries
+    enrolled_courses, (available_courses, more_available) = await async_db.gather(
+        lambda: list(user.enrolled_courses.with_progress_for(user)),
+        # Only the newest few; the catalog pages through the rest
+        lambda: Course.all_objects.catalog_page(user, not_enrolled=True, limit=AVAILABLE_COURSES_SHOWN),
+    )
     
-    # Get progress for each course
-     # Get progress for each course - MODIFIED THIS PART
     courses_with_progress = []
     for course in enrolled_courses:
-        try:
-            progress = CourseProgress.objects.get(learner=request.user, course__course_id=course.course_id)
-            next_page = progress.get_next_incomplete_page()
-            progress_percentage = progress.progress_percentage * 100
-        except CourseProgress.DoesNotExist:
-            progress = None
-            next_page = course.pages.order_by('page_no').first()
+        if course.progress_id is not None and course.page_total:
+            progress_percentage = min(course.completed_total * 100 / course.page_total, 100)
+        else:
             progress_percentage = 0
         
         courses_with_progress.append({
             'course': course,
-            'progress': progress,
-            'next_page': next_page,
+            'next_page_id': course.next_page_id,
+            'next_page_title': course.next_page_title,
+            'completed_count': course.completed_total,
+            'page_count': course.page_total,
             'progress_percentage': progress_percentage,
-            'is_completed': progress_percentage == 100 if progress else False
+            'is_completed': progress_percentage == 100
         })
     
-    # Get all available courses that the learner hasn't enrolled in
-    available_courses = Course.objects.exclude(learners=request.user)
-    
     context = {
         'enrolled_courses': courses_with_progress,
-        'available_courses': available_courses
+        'available_courses': available_courses,
+        'more_available': more_available is not None,
     }
-    return render(request, "mycourse.html", context)
+    return await arender(request, "mycourse.html", context)
 
 @login_required
+@role_required('learner', "Only learners can enroll in courses.")
 def enroll_course(request, course_id):
-    if not hasattr(request.user, 'userdetail') or request.user.userdetail.role.lower() != 'learner':
-        messages.error(request, "Only learners can enroll in courses.")
-        return redirect('dashboard')
-    
     course = get_object_or_404(Course, course_id=course_id)
     
     # Check if already enrolled
@@ -300,47 +327,81 @@ def enroll_course(request, course_id):
     # Enroll the learner
     course.learners.add(request.user)
     
-    # Create a progress record
+    # Create a progress record starting at the first page
     CourseProgress.objects.create(
         learner=request.user,
         course=course,
-        current_page=course.pages.order_by('page_no').first()
+        current_page_id=CourseManifest.for_course(course.course_id).first_page_id
     )
     
     messages.success(request, f"Successfully enrolled in {course.title}!")
     return redirect('mycourse')
 
 
-def continue_course(request, course_id):
-    if not hasattr(request.user, 'userdetail') or request.user.userdetail.role.lower() != 'learner':
+@login_required
+@require_POST
+def bulk_enroll(request, course_id):
+    """
+    Enroll a cohort in a course the user created (any course, for staff).
+    Learners are given as a JSON body ``{"learners": [...]}``, an uploaded
+    CSV ``file`` or a ``learners`` form field; the counts come back as JSON.
+    """
+    courses = Course.objects.all() if request.user.is_staff else Course.objects.filter(creator=request.user)
+    course = get_object_or_404(courses.only('course_id'), pk=course_id)
+    if request.content_type == 'application/json':
+        try:
+            usernames = json.loads(request.body).get('learners')
+        except (ValueError, AttributeError):
+            usernames = None
+        if not isinstance(usernames, list) or not all(isinstance(username, str) for username in usernames):
+            return JsonResponse({'error': "Send {\"learners\": [usernames]}."}, status=400)
+    elif 'file' in request.FILES:
+        usernames = enrollment.read_usernames(request.FILES['file'])
+    else:
+        usernames = enrollment.split_usernames(request.POST.get('learners', ''))
+    return JsonResponse({'course_id': course.course_id, **enrollment.enroll(course, usernames)})
+
+
+async def continue_course(request, course_id):
+    user = await request.auser()
+    if await aget_role(user) != 'learner':
         messages.error(request, "Only learners can access courses.")
         redirect_url = request.path
         login_url = f"{reverse('login')}?{urlencode({'next': redirect_url})}"
         return redirect(login_url)
     
-    course = get_object_or_404(Course, course_id=course_id)
+    # The course, the enrollment check and the manifest are independent queries
+    course, enrolled, manifest = await async_db.gather(
+        lambda: Course.objects.filter(course_id=course_id).first(),
+        lambda: user.enrolled_courses.filter(course_id=course_id).exists(),
+        lambda: CourseManifest.objects.filter(course_id=course_id).first(),
+    )
+    if course is None:
+        raise Http404("No Course matches the given query.")
     
     # Check if enrolled
-    if not request.user.enrolled_courses.filter(course_id=course.course_id).exists():
+    if not enrolled:
         messages.error(request, "You need to enroll in this course first.")
         return redirect('mycourse')
     
-    # Get or create progress
-    progress, created = CourseProgress.objects.get_or_create(
-        learner=request.user,
+    # Get or create progress, building the manifest only once the course is known to exist
+    if manifest is None:
+        manifest = await sync_to_async(CourseManifest.rebuild)(course_id)
+    first_page_id = manifest.first_page_id
+    progress, created = await CourseProgress.objects.aget_or_create(
+        learner=user,
         course=course,
-        defaults={'current_page': course.pages.order_by('page_no').first()}
+        defaults={'current_page_id': first_page_id}
     )
     
     # Redirect to the current page
-    if progress.current_page:
-        return redirect('coursepage', coursepage_id=progress.current_page.coursepage_id)
+    if progress.current_page_id:
+        return redirect('coursepage', coursepage_id=progress.current_page_id)
     else:
-        first_page = course.pages.order_by('page_no').first()
-        if first_page:
-            progress.current_page = first_page
-            progress.save()
-            return redirect('coursepage', page_id=first_page.coursepage_id)
+        if first_page_id:
+            progress.current_page_id = first_page_id
+            await progress.asave()
+            return redirect('coursepage', coursepage_id=first_page_id)
         else:
             messages.error(request, "This course has no content yet.")
             return redirect('mycourse')
@@ -348,14 +409,41 @@ def continue_course(request, course_id):
 
 @login_required
 def createdcourses(request):
-    # Get all courses created by the current user (educator)
-    courses = Course.objects.filter(creator=request.user).order_by('-created_date')
+    # Get all courses created by the current user (educator), with learner counts in the same query
+    courses = Course.objects.filter(creator=request.user).annotate(
+        learner_count=Count('learners')
+    ).order_by('-created_date')
     
     context = {
         'courses': courses
     }
     return render(request, "createdcourses.html", context)
 
+@login_required
+def course_analytics(request, course_id):
+    course = get_object_or_404(Course.objects.only('title', 'creator_id'), pk=course_id, creator=request.user)
+    days = request.GET.get('days')
+    days = int(days) if days in [str(choice) for choice in ANALYTICS_PERIODS] else ANALYTICS_PERIODS[1]
+    # Only the pre-aggregated rollups are read; see analytics.py
+    end = timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    totals = analytics.totals(course_id)
+    series = analytics.daily_series(course_id, start, end)
+    peak = max([row['enrollments'] for row in series] + [row['page_completions'] for row in series] + [1])
+    context = {
+        'course': course,
+        'days': days,
+        'periods': ANALYTICS_PERIODS,
+        'totals': totals,
+        'summary': [(label, metric, totals[metric], sum(row[metric] for row in series))
+                    for label, metric in ANALYTICS_METRICS],
+        'series': [dict(row, enrollments_width=row['enrollments'] * 100 // peak,
+                        page_completions_width=row['page_completions'] * 100 // peak) for row in reversed(series)],
+        'funnel': analytics.funnel(course_id, totals['enrollments']),
+        'aggregated_until': analytics.watermark(),
+    }
+    return render(request, "courseanalytics.html", context)
+
 @login_required
 def addpage(request, course_id):
     # Get the course or return 404 if not found
@@ -365,35 +453,55 @@ def addpage(request, course_id):
         if 'delete_page' in request.POST:
             # Handle page deletion
             page_id = request.POST.get('page_id')
-            page = get_object_or_404(CoursePage, pk=page_id, course=course)
-            page.delete()
-            
-            # Reorder remaining pages
-            pages = CoursePage.objects.filter(course=course).order_by('page_no')
-            for index, page in enumerate(pages, start=1):
-                if page.page_no != index:
-                    page.page_no = index
-                    page.save()
+            with transaction.atomic():
+                page = get_object_or_404(CoursePage, pk=page_id, course=course)
+                page_no = page.page_no
+                page.delete()
+                
+                # Close the gap in the remaining pages' numbering
+                ordering.close_gap(course.course_id, page_no)
             
             messages.success(request, "Page deleted successfully!")
             return redirect('addpage', course_id=course_id)
         elif 'delete_course' in request.POST:
-            # Handle course deletion
+            # Handle course deletion: the course disappears now and the job runner
+            # deletes its pages, progress and engagement in chunks
             course_title = course.title
-            course.delete()
+            jobs.delete_courses_later(Course.objects.filter(pk=course.pk), request.user)
             messages.success(request, f"Course '{course_title}' deleted successfully!")
             return redirect('createdcourses')    
 
     
-    # Get all pages for this course ordered by page number
-    pages = CoursePage.objects.filter(course=course).order_by('page_no')
+    # Get all pages for this course ordered by page number; the listing never shows page bodies
+    pages = CoursePage.objects.filter(course=course).order_by('page_no').defer('page_description')
     
     context = {
         'course': course,
-        'pages': pages
+        'pages': pages,
+        'page_count': CourseManifest.for_course(course.course_id).page_count
     }
     return render(request, "addpage.html", context)
 
+@login_required
+@require_POST
+def move_page(request, course_id, coursepage_id):
+    """Move a page to another position in its course (drag-and-drop reordering on the manage page)"""
+    course = get_object_or_404(Course, pk=course_id, creator=request.user)
+    try:
+        position = int(request.POST.get('position', ''))
+    except ValueError:
+        return JsonResponse({'error': "position must be a page number."}, status=400)
+
+    with transaction.atomic():
+        page = get_object_or_404(CoursePage, pk=coursepage_id, course=course)
+        page_no = ordering.move_page(page, position)
+    
+    return JsonResponse({
+        'coursepage_id': page.coursepage_id,
+        'page_no': page_no,
+        'pages': CourseManifest.for_course(course.course_id).pages,
+    })
+
 @login_required
 def newpage(request, course_id, coursepage_id=None):
     # Get the course or return 404 if not found
@@ -445,15 +553,43 @@ def newpage(request, course_id, coursepage_id=None):
 @require_POST
 def toggle_like(request, coursepage_id):
     page = get_object_or_404(CoursePage, coursepage_id=coursepage_id)
-    interaction, created = CourseInteraction.objects.get_or_create(
-        course_page=page,
-        user=request.user
-    )
-    interaction.liked = not interaction.liked
-    interaction.save()
+    # Lock the interaction row so concurrent toggles can't both flip the same stored value
+    with transaction.atomic():
+        interaction, created = CourseInteraction.all_objects.select_for_update().get_or_create(
+            course_page=page,
+            user=request.user
+        )
+        if interaction.is_archived:
+            # The archived row was invisible to the user, so it comes back as a fresh one
+            interaction.restore_as_new()
+        interaction.liked = not interaction.liked
+        interaction.save(update_fields=['liked', 'shared', 'is_archived'])
     messages.success(request, "Like updated successfully!")
     return redirect('coursepage', coursepage_id=coursepage_id)
 
+@login_required
+def page_comments(request, coursepage_id):
+    """Next page of a course page's comments for the "load more" button"""
+    page = get_object_or_404(CoursePage.objects.only('coursepage_id', 'course_id'), coursepage_id=coursepage_id)
+    if not request.user.enrolled_courses.filter(pk=page.course_id).exists():
+        return JsonResponse({'error': "You need to enroll in this course first."}, status=403)
+
+    comments, next_cursor = CourseComment.objects.page_for(
+        page, cursor=request.GET.get('cursor'), limit=COMMENTS_PAGE_SIZE
+    )
+    return JsonResponse({
+        'comments': [
+            {
+                'id': comment.id,
+                'user': comment.user.username,
+                'text': comment.text,
+                'created_at': comment.created_at.isoformat(),
+            }
+            for comment in comments
+        ],
+        'next_cursor': next_cursor,
+    })
+
 @require_POST
 def add_comment(request, coursepage_id):
     page = get_object_or_404(CoursePage, coursepage_id=coursepage_id)
@@ -469,25 +605,137 @@ def add_comment(request, coursepage_id):
         messages.error(request, "Comment cannot be empty.")
     return redirect('coursepage', coursepage_id=coursepage_id)
 
+def _catalog(request):
+    category = request.GET.get('category') or None
+    if category not in dict(Course.CATEGORY_CHOICES):
+        category = None
+    # Archived courses are hidden unless asked for; 'any' lists both
+    archived = {'true': True, 'any': None}.get(request.GET.get('archived'), False)
+    not_enrolled = request.GET.get('not_enrolled') in ('1', 'true')
+    courses, next_cursor = Course.all_objects.catalog_page(
+        request.user, category=category, archived=archived, not_enrolled=not_enrolled,
+        cursor=request.GET.get('cursor'), limit=CATALOG_PAGE_SIZE
+    )
+    filters = {'category': category or '', 'archived': request.GET.get('archived', ''), 'not_enrolled': not_enrolled}
+    return courses, next_cursor, filters
+
+@login_required
+def catalog(request):
+    courses, next_cursor, filters = _catalog(request)
+    next_query = None
+    if next_cursor:
+        params = {key: value for key, value in request.GET.items() if key != 'cursor'}
+        next_query = urlencode({**params, 'cursor': next_cursor})
+    return render(request, "catalog.html", {
+        'courses': courses,
+        'next_query': next_query,
+        'filters': filters,
+        'categories': Course.CATEGORY_CHOICES,
+    })
+
+@login_required
+def catalog_api(request):
+    """One page of the catalog as JSON; pass ``next_cursor`` back as ``cursor`` for the next page"""
+    courses, next_cursor, filters = _catalog(request)
+    return JsonResponse({
+        'courses': [
+            {
+                'course_id': course.course_id,
+                'title': course.title,
+                'description': course.description,
+                'category': course.category,
+                'created_date': course.created_date.isoformat(),
+                'is_archived': course.is_archived,
+                'is_enrolled': course.is_enrolled,
+            }
+            for course in courses
+        ],
+        'next_cursor': next_cursor,
+    })
+
+def _search(request):
+    query = request.GET.get('q', '').strip()
+    results, next_cursor = search.search(query, cursor=request.GET.get('cursor'), limit=SEARCH_PAGE_SIZE)
+    for result in results:
+        # Pages open directly; courses go through continue, which sends learners who aren't enrolled to My Courses
+        if result['page'] is not None:
+            result['url'] = reverse('coursepage', args=[result['page'].coursepage_id])
+        else:
+            result['url'] = reverse('continue_course', args=[result['course'].course_id])
+    return query, results, next_cursor
+
+@login_required
+def search_view(request):
+    query, results, next_cursor = _search(request)
+    return render(request, "search.html", {'query': query, 'results': results, 'next_cursor': next_cursor})
+
+@login_required
+def search_api(request):
+    """Ranked search results as JSON; pass ``next_cursor`` back as ``cursor`` for the next page"""
+    query, results, next_cursor = _search(request)
+    return JsonResponse({
+        'query': query,
+        'results': [
+            {
+                'type': 'page' if result['page'] is not None else 'course',
+                'course_id': result['course'].course_id,
+                'course_title': result['course'].title,
+                'page_id': result['page'].coursepage_id if result['page'] is not None else None,
+                'page_title': result['page'].page_title if result['page'] is not None else None,
+                'score': result['score'],
+                'url': result['url'],
+            }
+            for result in results
+        ],
+        'next_cursor': next_cursor,
+    })
+
 @require_POST
 def record_share(request, coursepage_id):
     page = get_object_or_404(CoursePage, coursepage_id=coursepage_id)
-    interaction, created = CourseInteraction.objects.get_or_create(
-        course_page=page,
-        user=request.user
-    )
-    interaction.shared = True
-    interaction.save()
+    with transaction.atomic():
+        interaction, created = CourseInteraction.all_objects.select_for_update().get_or_create(
+            course_page=page,
+            user=request.user
+        )
+        if interaction.is_archived:
+            interaction.restore_as_new()
+        if not interaction.shared:
+            interaction.shared = True
+            interaction.save(update_fields=['liked', 'shared', 'is_archived'])
     messages.success(request, "Share recorded successfully!")
-    return redirect(request.META.get('HTTP_REFERER', 'coursepage'))
+    return redirect(request.META.get('HTTP_REFERER') or reverse('coursepage', args=[coursepage_id]))
 
+@login_required
 def certificate_view(request, course_id):
-    course = get_object_or_404(Course, course_id=course_id)
-    
-    
-    context = {
-        'course': course,
-        'completion_date': timezone.now(),
-        'certificate_id': str(uuid.uuid4())[:8].upper(),  # Generate a short unique ID
-    }
-    return render(request, "viewcertificate.html", context)
\ No newline at end of file
+    certificate = Certificate.objects.filter(learner=request.user, course_id=course_id).first()
+    if certificate is None:
+        # Completed before certificates were issued, or not completed at all
+        progress_id = CourseProgress.objects.filter(
+            learner=request.user, course_id=course_id, completed_at__isnull=False
+        ).values_list('pk', flat=True).first()
+        if progress_id is None:
+            messages.error(request, "Complete the course to get its certificate.")
+            return redirect('mycourse')
+        certificates.issue([progress_id])
+        certificate = Certificate.objects.filter(learner=request.user, course_id=course_id).first()
+        if certificate is None:
+            # Not written, e.g. its code was already taken
+            messages.error(request, "We couldn't issue your certificate. Please try again later or contact support.")
+            return redirect('mycourse')
+    return render(request, "viewcertificate.html", {'certificate': certificate})
+
+def verify_certificate(request, code):
+    # Public, so anyone handed a certificate can check it
+    certificate = get_object_or_404(Certificate, code=code.upper())
+    return render(request, "viewcertificate.html", {'certificate': certificate, 'verification': True})
+
+@staff_member_required
+def fragment_cache_stats(request):
+    return JsonResponse(fragments.get_stats())
+
+def prometheus_metrics(request):
+    # Scraped by Prometheus, so no login; scrapers are recognised by token or address instead
+    if not metrics.scrape_allowed(request):
+        raise PermissionDenied
+    return HttpResponse(metrics.render_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
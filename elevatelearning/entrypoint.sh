@@ -25,11 +25,13 @@ else:
     print('Superuser already exists.')
 END
 
-# Start Gunicorn
+# Start Gunicorn with uvicorn workers serving the ASGI app, so async views
+# keep serving other requests while theirs wait on MySQL
 echo "Starting Gunicorn..."
-exec gunicorn elevatelearning.wsgi:application \
+exec gunicorn elevatelearning.asgi:application \
+    --worker-class uvicorn.workers.UvicornWorker \
     --bind 0.0.0.0:8000 \
-    --workers 3 \
+    --workers ${GUNICORN_WORKERS:-3} \
     --timeout 120 \
     --access-logfile - \
     --error-logfile -